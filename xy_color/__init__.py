@@ -1,7 +1,15 @@
 __all__ = [
+    "backends",
+    "benchmarks",
+    "color_difference",
     "color_space_transform",
     "data",
     "demos",
+    "instrumentation",
+    "lut",
+    "palette",
+    "spectral",
+    "temperature",
     "utils",
     "web",
 ]
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+"""Compute backends running the element-wise kernels of the color space
+transforms.
+
+The reference backend `"numpy"` is made of the NumPy kernels defined in
+`color_space_transform`, which evaluate each formula with a few whole-array
+operations and masked copies. The other backends evaluate the same formulas in
+a single fused loop over the data, and are registered at import time if their
+package is installed:
+
+  * `"numexpr"`, with the `numexpr` expression evaluator;
+  * `"numba"`, with loops compiled by the `numba` JIT compiler (on first use).
+
+A backend only needs to provide the kernels it speeds up, and uses the ones of
+`"numpy"` for the others, as well as for `precision="fast"`, which is a NumPy
+approximation. The results agree with the reference backend up to floating
+point rounding.
+
+Example::
+
+  lab = color_space_transform(image, "sRGB", "CIE-L*a*b*", backend="numba")
+  set_backend("numexpr")      # For all the following transforms.
+
+"""
+
+import numpy as np
+
+class Backend(object):
+    """A named set of element-wise kernels.
+
+    Parameters
+    ----------
+    name: string
+        Name of the backend, as passed to `color_space_transform`.
+
+    kernels: dict
+        The kernels keyed by name, among:
+          * `"srgb_gamma"`, `"srgb_inverse_gamma"`, `"lab_f"` and
+            `"lab_f_inv"`: functions `kernel(data, tmp, precision="exact")`
+            applying the sRGB transfer functions, or the nonlinear function of
+            CIE-L*a*b* and its inverse, in place on the C-contiguous array
+            `data`, with `tmp` (of the same shape) as scratch space.
+          * `"xyy_to_xyz"`: a function `kernel(src_data, out)` converting the
+            `Nx3` CIE-xyY colors into CIE-XYZ colors in `out`, which can be
+            `src_data` itself.
+
+    fallback: string, optional
+        Name of the backend providing the kernels missing from `kernels`.
+
+    """
+    def __init__(self, name, kernels, fallback="numpy"):
+        self.name = name
+        self.kernels = kernels
+        self.fallback = fallback
+
+    def kernel(self, name):
+        """Get the kernel called `name`, from the fallback backend if this one
+        does not provide it."""
+        if name in self.kernels:
+            return self.kernels[name]
+        if self.fallback is None:
+            raise Exception("Unknown kernel '%s'." % name)
+        return get_backend(self.fallback).kernel(name)
+
+    def __repr__(self):
+        return "Backend('%s')" % self.name
+
+def register_backend(backend):
+    """Register a `Backend`, replacing any backend of the same name."""
+    _backends[backend.name] = backend
+
+def get_backend(name=None):
+    """Get the registered `Backend` called `name`, or the default one set by
+    `set_backend` if `name` is `None`."""
+    if name is None:
+        name = _default_backend
+    try:
+        return _backends[name]
+    except KeyError:
+        raise Exception("Unknown backend '%s'." % name)
+
+def set_backend(name):
+    """Set the backend used by `color_space_transform` when none is given. The
+    initial default is the reference `"numpy"` backend."""
+    global _default_backend
+    get_backend(name)
+    _default_backend = name
+
+def list_backends():
+    """The names of the available backends, in alphabetical order."""
+    return sorted(_backends)
+
+_backends = {}
+_default_backend = "numpy"
+
+def _exact_only(name):
+    """Decorate an element-wise kernel `name` which only implements the
+    `"exact"` precision, using the reference one for the others."""
+    def decorator(fcn):
+        def kernel(data, tmp, precision="exact"):
+            if precision != "exact":
+                return get_backend("numpy").kernel(name)(data, tmp, precision)
+            return fcn(data)
+        kernel.__name__ = fcn.__name__
+        kernel.__doc__ = fcn.__doc__
+        return kernel
+    return decorator
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+if numexpr is not None:
+    def _numexpr_inplace(expression, data):
+        numexpr.evaluate(expression, local_dict={"x": data}, out=data,
+                         casting="same_kind")
+
+    @_exact_only("srgb_gamma")
+    def _numexpr_srgb_gamma(data):
+        _numexpr_inplace("where(x > 0.0031308, "
+                         "1.055 * x ** (1 / 2.4) - 0.055, 12.92 * x)", data)
+
+    @_exact_only("srgb_inverse_gamma")
+    def _numexpr_srgb_inverse_gamma(data):
+        _numexpr_inplace("where(x > 0.04045, "
+                         "((x + 0.055) / 1.055) ** 2.4, x / 12.92)", data)
+
+    @_exact_only("lab_f")
+    def _numexpr_lab_f(data):
+        _numexpr_inplace("where(x > (6. / 29.) ** 3, x ** (1. / 3.), "
+                         "x * (1. / 3. * (29. / 6.) ** 2) + 4. / 29.)", data)
+
+    @_exact_only("lab_f_inv")
+    def _numexpr_lab_f_inv(data):
+        _numexpr_inplace("where(x > 6. / 29., x * x * x, "
+                         "(x - 4. / 29.) * (3. * (6. / 29.) ** 2))", data)
+
+    def _numexpr_xyy_to_xyz(src_data, out):
+        local_dict = {"x": src_data[:,0], "y": src_data[:,1],
+                      "Y": src_data[:,2]}
+        X = numexpr.evaluate("where(y > 0, Y / y * x, 0)", local_dict)
+        Z = numexpr.evaluate("where(y > 0, Y / y * (1 - x - y), 0)", local_dict)
+        out[:,1] = src_data[:,2]
+        out[:,0] = X
+        out[:,2] = Z
+
+    register_backend(Backend("numexpr", {
+        "srgb_gamma": _numexpr_srgb_gamma,
+        "srgb_inverse_gamma": _numexpr_srgb_inverse_gamma,
+        "lab_f": _numexpr_lab_f,
+        "lab_f_inv": _numexpr_lab_f_inv,
+        "xyy_to_xyz": _numexpr_xyy_to_xyz,
+    }))
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if numba is not None:
+    # The loops release the GIL, so that they run concurrently when the
+    # transform is split among threads.
+    @numba.njit(nogil=True)
+    def _numba_srgb_gamma_loop(x):
+        for i in range(x.size):
+            v = x[i]
+            if v > 0.0031308:
+                x[i] = 1.055 * v ** (1 / 2.4) - 0.055
+            else:
+                x[i] = 12.92 * v
+
+    @numba.njit(nogil=True)
+    def _numba_srgb_inverse_gamma_loop(x):
+        for i in range(x.size):
+            v = x[i]
+            if v > 0.04045:
+                x[i] = ((v + 0.055) / 1.055) ** 2.4
+            else:
+                x[i] = v / 12.92
+
+    @numba.njit(nogil=True)
+    def _numba_lab_f_loop(x):
+        for i in range(x.size):
+            v = x[i]
+            if v > (6. / 29.) ** 3:
+                x[i] = v ** (1. / 3.)
+            else:
+                x[i] = v * (1. / 3. * (29. / 6.) ** 2) + 4. / 29.
+
+    @numba.njit(nogil=True)
+    def _numba_lab_f_inv_loop(x):
+        for i in range(x.size):
+            v = x[i]
+            if v > 6. / 29.:
+                x[i] = v * v * v
+            else:
+                x[i] = (v - 4. / 29.) * (3. * (6. / 29.) ** 2)
+
+    @numba.njit(nogil=True)
+    def _numba_xyy_to_xyz(src_data, out):
+        for i in range(src_data.shape[0]):
+            x = src_data[i,0]
+            y = src_data[i,1]
+            Y = src_data[i,2]
+            r = Y / y if y > 0 else 0.
+            out[i,0] = r * x
+            out[i,1] = Y
+            out[i,2] = r * (1 - x - y)
+
+    def _numba_kernel(name, loop):
+        @_exact_only(name)
+        def kernel(data):
+            # A view of the C-contiguous data, which the loops write into.
+            loop(data.reshape(-1))
+        return kernel
+
+    register_backend(Backend("numba", {
+        "srgb_gamma": _numba_kernel("srgb_gamma", _numba_srgb_gamma_loop),
+        "srgb_inverse_gamma": _numba_kernel("srgb_inverse_gamma",
+                                            _numba_srgb_inverse_gamma_loop),
+        "lab_f": _numba_kernel("lab_f", _numba_lab_f_loop),
+        "lab_f_inv": _numba_kernel("lab_f_inv", _numba_lab_f_inv_loop),
+        "xyy_to_xyz": _numba_xyy_to_xyz,
+    }))
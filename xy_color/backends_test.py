@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import itertools
+import numpy as np
+import unittest
+
+from xy_python_utils.unittest_utils import check_near
+
+import backends
+from backends import *
+from color_space_transform import color_space_transform, get_transform
+
+class BackendsTest(unittest.TestCase):
+    def test_conformance(self):
+        # Every available backend agrees with the reference one, on each of the
+        # element-wise kernels, including values around the thresholds of the
+        # piecewise functions and out of the usual range.
+        reference = get_backend("numpy")
+        self.assertIn("numpy", list_backends())
+        data = np.concatenate([np.linspace(-0.5, 1.5, 3000),
+                               np.linspace(0, 0.05, 3000)]).reshape(3, -1)
+        for name in list_backends():
+            backend = get_backend(name)
+            for kernel in ("srgb_gamma", "srgb_inverse_gamma", "lab_f",
+                           "lab_f_inv"):
+                for dtype, tol in ((np.float64, 1e-12), (np.float32, 1e-6)):
+                    expected = data.astype(dtype)
+                    with np.errstate(invalid="ignore"):
+                        reference.kernel(kernel)(expected,
+                                                 np.empty_like(expected))
+                    result = data.astype(dtype)
+                    backend.kernel(kernel)(result, np.empty_like(result))
+                    valid = ~np.isnan(expected)
+                    check_near(result[valid], expected[valid], tol)
+            xyy = np.random.rand(1000, 3)
+            xyy[:10,1] = 0
+            expected = np.empty(xyy.shape)
+            reference.kernel("xyy_to_xyz")(xyy, expected)
+            result = np.empty(xyy.shape)
+            backend.kernel("xyy_to_xyz")(xyy, result)
+            check_near(result, expected, 1e-12)
+
+            # The transforms, with both precisions.
+            spaces = ["CIE-XYZ", "CIE-xyY", "sRGB-linear", "sRGB",
+                      "CIE-L*a*b*"]
+            src_image = np.random.rand(20, 30, 3)
+            for src_space, dst_space in itertools.permutations(spaces, 2):
+                for precision in ("exact", "fast"):
+                    check_near(color_space_transform(
+                        src_image, src_space, dst_space, precision=precision,
+                        backend=name), color_space_transform(
+                            src_image, src_space, dst_space,
+                            precision=precision), 1e-9)
+
+    def test_set_backend(self):
+        self.assertRaises(Exception, get_backend, "unknown")
+        self.assertRaises(Exception, set_backend, "unknown")
+        name = list_backends()[-1]
+        set_backend(name)
+        try:
+            self.assertIs(get_backend(), get_backend(name))
+            self.assertEqual(get_transform("sRGB", "CIE-L*a*b*").backend, name)
+        finally:
+            set_backend("numpy")
+        self.assertEqual(get_transform("sRGB", "CIE-L*a*b*").backend, "numpy")
+
+    def test_fallback(self):
+        # Missing kernels are taken from the reference backend.
+        def srgb_gamma(data, tmp, precision="exact"):
+            data[...] = 0.5
+        register_backend(Backend("Test-Constant", {"srgb_gamma": srgb_gamma}))
+        self.addCleanup(backends._backends.pop, "Test-Constant")
+        self.assertIs(get_backend("Test-Constant").kernel("lab_f"),
+                      get_backend("numpy").kernel("lab_f"))
+        src_data = np.random.rand(3, 100)
+        check_near(color_space_transform(
+            src_data, "sRGB-linear", "sRGB", backend="Test-Constant"),
+                   np.full(src_data.shape, 0.5), 1e-12)
+        check_near(color_space_transform(
+            src_data, "CIE-XYZ", "CIE-L*a*b*", backend="Test-Constant"),
+                   color_space_transform(src_data, "CIE-XYZ", "CIE-L*a*b*"),
+                   1e-12)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+
+import argparse
+import ctypes
+import itertools
+import json
+import multiprocessing
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import data
+import utils
+from color_space_transform import color_space_transform, get_backend
+from color_space_transform import _compile_steps, _transform_edges
+
+def run_benchmarks(spaces=None, sizes=None, layouts=None, dtypes=None,
+                   workers=None, backend=None, precision="exact",
+                   measure_memory=True, min_time=0.05, repeat=3,
+                   callback=None):
+    """Measure the throughput and peak memory of `color_space_transform`.
+
+    Every pair of distinct color spaces is run for every combination of size,
+    layout and data type. Integer types are only run from `"sRGB"`, the only
+    color space taking integer codes.
+
+    Parameters
+    ----------
+    spaces: list of strings, optional
+        The color spaces, which default to all the built-in ones.
+
+    sizes: list of `(rows, columns)` tuples, optional
+        The image sizes, from a single color up to an 8K image by default.
+
+    layouts: list of strings, optional
+        Among `"3xN"` (the colors of the image as columns of a matrix),
+        `"MxNx3"` and `"MxNx4"` (an image, with alpha channel for the latter).
+
+    dtypes: list of numpy dtypes, optional
+        Among `float32`, `float64`, `uint8` and `uint16`, all by default.
+
+    workers, backend, precision: optional
+        Passed to `color_space_transform`.
+
+    measure_memory: bool, optional
+        Whether to measure the peak memory of each case (see `peak_memory`),
+        which runs it one more time.
+
+    min_time: float, optional
+        Each timing repeats the transform until it takes at least `min_time`
+        seconds, and the time per run is the best of `repeat` timings.
+
+    callback: callable, optional
+        Called with each result as soon as it is measured, e.g. to print it.
+
+    Returns
+    -------
+    results: list of dicts
+        One result per case, holding the `"src_space"`, `"dst_space"`,
+        `"layout"`, `"shape"` and `"dtype"` of the case, the number of
+        `"pixels"`, the `"seconds"` per run, the throughput in
+        `"mpixels_per_s"` (millions of colors per second), and the
+        `"peak_memory"` in bytes (or `None` if not measured).
+
+    """
+    if spaces is None:
+        spaces = _default_spaces
+    if sizes is None:
+        sizes = _default_sizes
+    if layouts is None:
+        layouts = _default_layouts
+    if dtypes is None:
+        dtypes = _default_dtypes
+    results = []
+    for size, layout, dtype in itertools.product(sizes, layouts, dtypes):
+        dtype = np.dtype(dtype)
+        src_data = _random_data(size, layout, dtype)
+        for src_space, dst_space in itertools.permutations(spaces, 2):
+            if dtype.kind != "f" and src_space != "sRGB":
+                continue
+            run = lambda: color_space_transform(
+                src_data, src_space, dst_space, workers=workers,
+                backend=backend, precision=precision)
+            seconds = _time(run, min_time, repeat)
+            pixels = int(np.prod(size))
+            result = {
+                "src_space": src_space,
+                "dst_space": dst_space,
+                "layout": layout,
+                "shape": list(src_data.shape),
+                "dtype": dtype.name,
+                "pixels": pixels,
+                "seconds": seconds,
+                "mpixels_per_s": pixels / seconds / 1e6,
+                "peak_memory": peak_memory(run) if measure_memory else None,
+            }
+            results.append(result)
+            if callback is not None:
+                callback(result)
+    return results
+
+def run_kernel_benchmarks(kernels=None, sizes=None, dtypes=None,
+                          backend=None, precision="exact",
+                          measure_memory=True, min_time=0.05, repeat=3,
+                          callback=None):
+    """Measure the throughput and peak memory of each transform kernel alone.
+
+    Each kernel is the single step of a registered transform, e.g. the
+    `"sRGB-linear" -> "sRGB"` gamma, the `"CIE-XYZ" -> "sRGB-linear"` matrix
+    or the `"CIE-XYZ" -> "CIE-L*a*b*"` conversion, run on a contiguous `Nx3`
+    matrix of colors into a preallocated output. So a regression found by
+    `run_benchmarks` can be traced to the kernel causing it.
+
+    Parameters
+    ----------
+    kernels: list of `(src_space, dst_space)` tuples, optional
+        The registered transforms, which default to all of them.
+
+    sizes, dtypes: optional
+        As in `run_benchmarks`, with floating point types only.
+
+    backend, precision, measure_memory, min_time, repeat, callback: optional
+        As in `run_benchmarks`.
+
+    Returns
+    -------
+    results: list of dicts
+        One result per case, as in `run_benchmarks`, with the `"Nx3"` layout.
+
+    """
+    if kernels is None:
+        kernels = [(src_space, dst_space)
+                   for src_space in sorted(_transform_edges)
+                   for dst_space in sorted(_transform_edges[src_space])]
+    if sizes is None:
+        sizes = _default_sizes
+    if dtypes is None:
+        dtypes = _default_kernel_dtypes
+    backend = get_backend(backend).name
+    results = []
+    for size, dtype in itertools.product(sizes, dtypes):
+        dtype = np.dtype(dtype)
+        pixels = int(np.prod(size))
+        src_data = np.random.rand(pixels, 3).astype(dtype)
+        out = np.empty_like(src_data)
+        for src_space, dst_space in kernels:
+            steps, names = _compile_steps([src_space, dst_space], precision,
+                                          backend)
+            run = lambda: steps[0](src_data, out)
+            seconds = _time(run, min_time, repeat)
+            result = {
+                "src_space": src_space,
+                "dst_space": dst_space,
+                "layout": "Nx3",
+                "shape": list(src_data.shape),
+                "dtype": dtype.name,
+                "pixels": pixels,
+                "seconds": seconds,
+                "mpixels_per_s": pixels / seconds / 1e6,
+                "peak_memory": peak_memory(run) if measure_memory else None,
+            }
+            results.append(result)
+            if callback is not None:
+                callback(result)
+    return results
+
+def peak_memory(fcn):
+    """Measure the peak memory allocated while running `fcn`, in bytes.
+
+    With Python 3, this is the peak of the memory traced by `tracemalloc`,
+    which includes the NumPy arrays. Otherwise, on Linux, `fcn` is run in a
+    forked process, and this is its peak resident memory above the one at the
+    fork, which is rounded to pages. Returns `None` if neither is supported on
+    this platform.
+
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            fcn()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    if not hasattr(os, "fork") or not os.path.exists("/proc/self/clear_refs"):
+        return None
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # The child only has the forking thread, so it needs new thread pools.
+        try:
+            os.close(read_fd)
+            utils._thread_pools.clear()
+            # Release the freed memory kept by malloc (which would be reused
+            # without showing up), and reset the peak resident memory.
+            _malloc_trim()
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            start_rss = _memory_status("VmRSS")
+            fcn()
+            os.write(write_fd, str(max(
+                _memory_status("VmHWM") - start_rss, 0)).encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    output = os.read(read_fd, 64)
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    return int(output) if output else None
+
+def machine_info():
+    """Describe the machine and software the benchmarks run on, including the
+    git commit of this package if known, to tag the results with."""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=_this_file_path,
+            stderr=open(os.devnull, "w")).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": multiprocessing.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def save_results(results, filename=None, machine=None):
+    """Save benchmark results together with the `machine_info` (or the given
+    `machine` description) into a JSON file, returning its name.
+
+    By default the file is in the `benchmarks` sub-directory of
+    `data.cache_path`, named by the host name, the commit and the date, so
+    that the results of successive commits can be compared with
+    `compare_results`.
+
+    """
+    if machine is None:
+        machine = machine_info()
+    if filename is None:
+        benchmarks_path = os.path.join(data.cache_path, "benchmarks")
+        filename = os.path.join(benchmarks_path, "%s-%s-%s.json" % (
+            machine["hostname"] or "unknown", (machine["commit"] or "none")[:8],
+            time.strftime("%Y%m%d-%H%M%S")))
+    with data._open_atomic(filename, "w") as f:
+        json.dump({"machine": machine, "results": results}, f, indent=1,
+                  sort_keys=True)
+    return filename
+
+def load_results(filename):
+    """Load the `{"machine": ..., "results": ...}` saved by `save_results`."""
+    with open(filename) as f:
+        return json.load(f)
+
+def compare_results(old, new, threshold=0.1):
+    """Compare two sets of benchmark results, e.g. of two commits.
+
+    Parameters
+    ----------
+    old, new: dict or list of dicts
+        The results, either as loaded by `load_results` or as returned by
+        `run_benchmarks`.
+
+    threshold: float, optional
+        The relative change of throughput from which a case is reported.
+
+    Returns
+    -------
+    changes: list of dicts
+        The cases present in both whose throughput changed by more than
+        `threshold`, with the keys of the case, the `"old"` and `"new"`
+        throughputs in Mpixel/s, and their `"ratio"` (below 1 for regressions),
+        sorted from the worst regression to the best improvement.
+
+    """
+    old_results = _results_by_case(old)
+    new_results = _results_by_case(new)
+    changes = []
+    for case in sorted(set(old_results) & set(new_results)):
+        old_speed = old_results[case]["mpixels_per_s"]
+        new_speed = new_results[case]["mpixels_per_s"]
+        ratio = new_speed / old_speed
+        if abs(ratio - 1) > threshold:
+            change = dict(zip(_case_keys, case))
+            change["shape"] = list(change["shape"])
+            change.update(old=old_speed, new=new_speed, ratio=ratio)
+            changes.append(change)
+    changes.sort(key=lambda change: change["ratio"])
+    return changes
+
+def format_result(result):
+    """Format a benchmark result as one line of text."""
+    memory = result["peak_memory"]
+    return "%s %9.2f Mpixel/s %10s" % (
+        _format_case(result), result["mpixels_per_s"],
+        "-" if memory is None else "%.1f MB" % (memory / 1e6))
+
+def _format_case(case):
+    return "%-15s -> %-15s %-5s %-16s %-7s" % (
+        case["src_space"], case["dst_space"], case["layout"],
+        "x".join(str(n) for n in case["shape"]), case["dtype"])
+
+def _results_by_case(results):
+    if isinstance(results, dict):
+        results = results["results"]
+    return {tuple(tuple(result[key]) if key == "shape" else result[key]
+                  for key in _case_keys): result for result in results}
+
+_case_keys = ("src_space", "dst_space", "layout", "shape", "dtype")
+
+def _random_data(size, layout, dtype):
+    """Random colors of the given `(rows, columns)` size and layout, spanning
+    the whole range of integer types, and `[0, 1]` for floating point ones."""
+    rows, columns = size
+    if layout == "3xN":
+        shape = (3, rows * columns)
+    elif layout == "MxNx3":
+        shape = (rows, columns, 3)
+    elif layout == "MxNx4":
+        shape = (rows, columns, 4)
+    else:
+        raise Exception("Unknown layout '%s'." % layout)
+    if dtype.kind == "u":
+        return np.random.randint(0, np.iinfo(dtype).max + 1, shape).astype(
+            dtype)
+    return np.random.rand(*shape).astype(dtype)
+
+def _time(fcn, min_time, repeat):
+    """The best time of `fcn` over `repeat` timings, each running it enough
+    times to take at least `min_time` seconds."""
+    number = 1
+    while True:
+        start = time.time()
+        for i in xrange(number):
+            fcn()
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    times = [elapsed]
+    for i in xrange(repeat - 1):
+        start = time.time()
+        for i in xrange(number):
+            fcn()
+        times.append(time.time() - start)
+    return min(times) / number
+
+def _malloc_trim():
+    """Return the free memory of the C heap to the system, with glibc."""
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def _memory_status(key):
+    """The memory size of the given `key` in `/proc/self/status` in bytes, e.g.
+    `"VmRSS"` for the current resident memory, on Linux."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(key + ":"):
+                return int(line.split()[1]) * 1024
+    raise Exception("Unknown memory status '%s'." % key)
+
+_this_file_path = os.path.dirname(os.path.abspath(__file__))
+
+_default_spaces = ["CIE-XYZ", "CIE-xyY", "sRGB-linear", "sRGB",
+                   "AdobeRGB-linear", "AdobeRGB", "CIE-L*a*b*"]
+_default_sizes = [(1, 1), (64, 64), (480, 640), (1080, 1920), (4320, 7680)]
+_default_layouts = ["3xN", "MxNx3", "MxNx4"]
+_default_dtypes = [np.float32, np.float64, np.uint8, np.uint16]
+_default_kernel_dtypes = [np.float32, np.float64]
+
+def main():
+    """Run the benchmarks from the command line, e.g.::
+
+      python benchmarks.py --sizes 1080x1920 --spaces sRGB CIE-L*a*b*
+      python benchmarks.py --compare old.json
+      python benchmarks.py --no-kernels --dtypes uint8
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the color space transforms.")
+    parser.add_argument("--spaces", nargs="+", default=_default_spaces)
+    parser.add_argument("--sizes", nargs="+", default=[
+        "%dx%d" % size for size in _default_sizes],
+                        help="image sizes as ROWSxCOLUMNS")
+    parser.add_argument("--layouts", nargs="+", default=_default_layouts)
+    parser.add_argument("--dtypes", nargs="+", default=[
+        np.dtype(dtype).name for dtype in _default_dtypes])
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--backend")
+    parser.add_argument("--precision", default="exact")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="do not measure the peak memory")
+    parser.add_argument("--no-kernels", action="store_true",
+                        help="do not benchmark the kernels alone")
+    parser.add_argument("--output", help="file to save the results into")
+    parser.add_argument("--compare", help="results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    sizes = [tuple(int(n) for n in size.split("x")) for size in args.sizes]
+    print_result = lambda result: sys.stdout.write(
+        format_result(result) + "\n")
+    results = run_benchmarks(
+        args.spaces, sizes, args.layouts, args.dtypes, args.workers,
+        args.backend, args.precision, not args.no_memory,
+        callback=print_result)
+    if not args.no_kernels:
+        kernels = [(src_space, dst_space) for src_space, dst_space in
+                   itertools.permutations(args.spaces, 2)
+                   if dst_space in _transform_edges.get(src_space, ())]
+        results += run_kernel_benchmarks(
+            kernels, sizes, [dtype for dtype in args.dtypes
+                             if np.dtype(dtype).kind == "f"],
+            backend=args.backend, precision=args.precision,
+            measure_memory=not args.no_memory, callback=print_result)
+    print("Saved results into %s." % save_results(results, args.output))
+    if args.compare:
+        for change in compare_results(load_results(args.compare), results,
+                                      args.threshold):
+            print("%s %9.2f -> %9.2f Mpixel/s (x%.2f)" % (
+                _format_case(change), change["old"], change["new"],
+                change["ratio"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+import numpy as np
+import os
+import unittest
+
+import data
+from benchmarks import *
+from test_utils import TemporaryCacheMixin
+
+class BenchmarksTest(TemporaryCacheMixin, unittest.TestCase):
+    def test_run_benchmarks(self):
+        results = run_benchmarks(
+            ["sRGB", "CIE-XYZ", "CIE-L*a*b*"], [(1, 1), (20, 30)],
+            dtypes=[np.float32, np.uint8], min_time=0.001, repeat=1)
+        # Integer data is only benchmarked from sRGB.
+        self.assertEqual(len(results), 2 * 3 * (6 + 2))
+        for result in results:
+            self.assertGreater(result["mpixels_per_s"], 0)
+            self.assertEqual(result["pixels"], np.prod(result["shape"]) /
+                             (3 if result["layout"] != "MxNx4" else 4))
+            if result["dtype"] == "uint8":
+                self.assertEqual(result["src_space"], "sRGB")
+
+        # The results are saved with the machine description, and compared by
+        # case.
+        filename = save_results(results)
+        self.assertTrue(filename.startswith(data.cache_path))
+        saved = load_results(filename)
+        self.assertEqual(len(saved["results"]), len(results))
+        self.assertIn("commit", saved["machine"])
+        self.assertEqual(compare_results(saved, results), [])
+        slower = [dict(result) for result in results]
+        slower[0]["mpixels_per_s"] /= 2
+        changes = compare_results(saved, slower)
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0]["ratio"], 0.5)
+        self.assertEqual(changes[0]["src_space"], results[0]["src_space"])
+
+    def test_run_kernel_benchmarks(self):
+        results = run_kernel_benchmarks(
+            [("sRGB-linear", "sRGB"), ("CIE-XYZ", "sRGB-linear"),
+             ("CIE-XYZ", "CIE-L*a*b*")], [(20, 30)], min_time=0.001,
+            repeat=1, measure_memory=False)
+        self.assertEqual(len(results), 3 * 2)
+        for result in results:
+            self.assertGreater(result["mpixels_per_s"], 0)
+            self.assertEqual(result["layout"], "Nx3")
+            self.assertEqual(result["shape"], [600, 3])
+        # All the registered transforms are run by default.
+        results = run_kernel_benchmarks(sizes=[(1, 1)], dtypes=[np.float64],
+                                        min_time=0.001, repeat=1,
+                                        measure_memory=False)
+        self.assertIn(("sRGB", "sRGB-linear"), [
+            (result["src_space"], result["dst_space"]) for result in results])
+
+    def test_peak_memory(self):
+        memory = peak_memory(lambda: np.ones(2 ** 20))
+        if memory is not None:
+            self.assertGreater(memory, 8 * 2 ** 20 * 0.9)
+            self.assertLess(memory, 8 * 2 ** 20 * 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from color_space_transform import color_space_transform
+from data import _float_dtype
+from utils import parallel_map, tile_ranges
+
+def delta_e(data1, data2, method="CIEDE2000", color_space="CIE-L*a*b*",
+            channel_axis=None, workers=None, kL=1., kC=1., kH=1.):
+    """Compute the color difference (Delta E) between two sets of colors.
+
+    The two inputs are broadcast against each other after moving their color
+    channels to the end, so that this covers:
+      1. pairwise differences of two `3xN` matrices (or two images of the same
+         size, giving an `MxN` heatmap);
+      2. one-to-many differences of a single color of shape `(3,)` with a
+         `3xN` matrix or an `MxNx3` image;
+      3. any other pair of broadcastable shapes.
+
+    The differences are computed in chunks of colors, which bounds the memory
+    used by the temporaries, optionally with several threads.
+
+    Parameters
+    ----------
+    data1, data2: ndarray
+        The colors to be compared, with 3 (or 4, where the alpha channel is
+        ignored) color channels along the `channel_axis`. For `"CIE94"`,
+        `data1` holds the reference colors, since the formula is not
+        symmetric.
+
+    method: string, optional
+        One of `"CIE76"` (the Euclidean distance in CIE-L*a*b*), `"CIE94"` (with
+        the graphic arts weights `K1 = 0.045` and `K2 = 0.015`) and
+        `"CIEDE2000"` (default).
+
+    color_space: string, optional
+        Color space of the input data, which is converted into CIE-L*a*b* with
+        `color_space_transform` if needed.
+
+    channel_axis: int, optional
+        The axis of the color channels of both inputs. It defaults to `-1` for
+        three dimensional inputs (i.e. images) and `0` for anything else,
+        separately for each input.
+
+    workers: int, optional
+        Number of threads to split the chunks among, as in
+        `color_space_transform`.
+
+    kL, kC, kH: float, optional
+        The parametric weighting factors of lightness, chroma and hue used by
+        `"CIE94"` and `"CIEDE2000"`, all `1` by default.
+
+    Returns
+    -------
+    diff: ndarray
+        The color differences, of the broadcast shape of the inputs without the
+        color channels, e.g. `N` for `3xN` inputs and `MxN` for images.
+
+    References
+    ----------
+    | G. Sharma, W. Wu and E. N. Dalal, The CIEDE2000 Color-Difference Formula:
+      Implementation Notes, Supplementary Test Data, and Mathematical
+      Observations, Color Research and Application, 30(1), 2005.
+    | Accessed from: http://www.ece.rochester.edu/~gsharma/ciede2000/
+
+    """
+    if method not in _delta_e_kernels:
+        raise Exception("Unknown color difference method '%s'." % method)
+    kernel = _delta_e_kernels[method]
+    lab1 = _to_lab(data1, color_space, channel_axis)
+    lab2 = _to_lab(data2, color_space, channel_axis)
+    shape = np.broadcast(lab1[...,0], lab2[...,0]).shape
+    dtype = np.result_type(lab1, lab2)
+    # Work on at least one dimensional data, and split the first dimension into
+    # chunks of about `_chunk_size` colors.
+    lab1 = np.broadcast_to(lab1, (shape or (1,)) + (3,))
+    lab2 = np.broadcast_to(lab2, (shape or (1,)) + (3,))
+    out = np.empty(lab1.shape[:-1], dtype)
+    row_size = int(np.prod(out.shape[1:]))
+    def run_chunk(chunk):
+        start, stop = chunk
+        out[start:stop] = kernel(lab1[start:stop].reshape(-1, 3),
+                                 lab2[start:stop].reshape(-1, 3),
+                                 kL, kC, kH).reshape(out[start:stop].shape)
+    parallel_map(run_chunk, tile_ranges(out.shape[0],
+                                        _chunk_size // max(row_size, 1)),
+                 workers)
+    return out.reshape(shape)
+
+def _to_lab(data, color_space, channel_axis):
+    """Get a channels-last CIE-L*a*b* view or copy of the color `data`."""
+    data = np.asarray(data)
+    if channel_axis is None:
+        channel_axis = -1 if data.ndim == 3 else 0
+    data = np.moveaxis(data, channel_axis, -1)
+    if (data.shape[-1] != 3) and (data.shape[-1] != 4):
+        raise ValueError("The data must have 3 or 4 color channels.")
+    data = data[...,:3]
+    if color_space != "CIE-L*a*b*":
+        return color_space_transform(data, color_space, "CIE-L*a*b*",
+                                     channel_axis=-1)
+    return data.astype(_float_dtype(data), copy=False)
+
+def _delta_e_cie76(lab1, lab2, kL, kC, kH):
+    """The CIE76 color difference of each pair of rows of two `Nx3` matrices."""
+    diff = lab1 - lab2
+    diff *= diff
+    return np.sqrt(np.sum(diff, axis=1))
+
+def _delta_e_cie94(lab1, lab2, kL, kC, kH):
+    """The CIE94 color difference of each pair of rows of two `Nx3` matrices,
+    with the graphic arts weights."""
+    L1, a1, b1 = lab1.T
+    L2, a2, b2 = lab2.T
+    C1 = np.hypot(a1, b1)
+    dC = C1 - np.hypot(a2, b2)
+    dL = L1 - L2
+    da = a1 - a2
+    db = b1 - b2
+    # dH^2 = da^2 + db^2 - dC^2, which can be slightly negative by rounding.
+    dH2 = da * da
+    dH2 += db * db
+    dH2 -= dC * dC
+    np.maximum(dH2, 0, out=dH2)
+    dL /= kL
+    dC /= kC * (1 + 0.045 * C1)
+    dH2 /= (kH * (1 + 0.015 * C1)) ** 2
+    dL *= dL
+    dC *= dC
+    dL += dC
+    dL += dH2
+    return np.sqrt(dL, out=dL)
+
+def _delta_e_ciede2000(lab1, lab2, kL, kC, kH):
+    """The CIEDE2000 color difference of each pair of rows of two `Nx3`
+    matrices, following the notation of Sharma et al. with angles in
+    radians."""
+    L1, a1, b1 = lab1.T
+    L2, a2, b2 = lab2.T
+    # Modify a* to account for the chroma dependence of the hue.
+    C_mean = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    C_mean7 = C_mean ** 7
+    G = 0.5 * (1 - np.sqrt(C_mean7 / (C_mean7 + 25. ** 7)))
+    a1p = a1 * (1 + G)
+    a2p = a2 * (1 + G)
+    C1p = np.hypot(a1p, b1)
+    C2p = np.hypot(a2p, b2)
+    # Hue angles in `[0, 2 pi)`, which are 0 for achromatic colors.
+    h1p = np.arctan2(b1, a1p) % (2 * np.pi)
+    h2p = np.arctan2(b2, a2p) % (2 * np.pi)
+    chromatic = (C1p * C2p) != 0
+
+    dLp = L2 - L1
+    dCp = C2p - C1p
+    dhp = h2p - h1p
+    dhp[dhp > np.pi] -= 2 * np.pi
+    dhp[dhp < -np.pi] += 2 * np.pi
+    dhp[~chromatic] = 0
+    dHp = 2 * np.sqrt(C1p * C2p) * np.sin(dhp / 2)
+
+    Lp_mean = (L1 + L2) / 2
+    Cp_mean = (C1p + C2p) / 2
+    hp_mean = h1p + h2p
+    far = chromatic & (np.abs(h1p - h2p) > np.pi)
+    below = far & (hp_mean < 2 * np.pi)
+    hp_mean[below] += 2 * np.pi
+    hp_mean[far & ~below] -= 2 * np.pi
+    hp_mean[chromatic] /= 2
+
+    T = (1 - 0.17 * np.cos(hp_mean - np.radians(30)) +
+         0.24 * np.cos(2 * hp_mean) +
+         0.32 * np.cos(3 * hp_mean + np.radians(6)) -
+         0.20 * np.cos(4 * hp_mean - np.radians(63)))
+    d_theta = np.radians(30) * np.exp(
+        -((hp_mean - np.radians(275)) / np.radians(25)) ** 2)
+    Cp_mean7 = Cp_mean ** 7
+    RC = 2 * np.sqrt(Cp_mean7 / (Cp_mean7 + 25. ** 7))
+    Lp_50 = (Lp_mean - 50) ** 2
+    SL = 1 + 0.015 * Lp_50 / np.sqrt(20 + Lp_50)
+    SC = 1 + 0.045 * Cp_mean
+    SH = 1 + 0.015 * Cp_mean * T
+    RT = -np.sin(2 * d_theta) * RC
+
+    dLp /= kL * SL
+    dCp /= kC * SC
+    dHp /= kH * SH
+    diff = dLp * dLp + dCp * dCp + dHp * dHp + RT * dCp * dHp
+    return np.sqrt(diff, out=diff)
+
+_delta_e_kernels = {
+    "CIE76": _delta_e_cie76,
+    "CIE94": _delta_e_cie94,
+    "CIEDE2000": _delta_e_ciede2000,
+}
+
+# Number of color pairs processed at a time, to bound the memory of the
+# temporaries.
+_chunk_size = 16384
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import numpy as np
+import unittest
+
+from color_space_transform import color_space_transform
+from color_difference import *
+
+# Test pairs of CIE-L*a*b* colors and their CIEDE2000 differences, from the
+# supplementary test data of Sharma et al.
+_ciede2000_data = np.array([
+    [50.0000,   2.6772, -79.7751, 50.0000,   0.0000, -82.7485,  2.0425],
+    [50.0000,   3.1571, -77.2803, 50.0000,   0.0000, -82.7485,  2.8615],
+    [50.0000,   2.8361, -74.0200, 50.0000,   0.0000, -82.7485,  3.4412],
+    [50.0000,   0.0000,   0.0000, 50.0000,  -1.0000,   2.0000,  2.3669],
+    [50.0000,   2.5000,   0.0000, 73.0000,  25.0000, -18.0000, 27.1492],
+    [50.0000,   2.5000,   0.0000, 61.0000,  -5.0000,  29.0000, 22.8977],
+    [50.0000,   2.5000,   0.0000, 56.0000, -27.0000,  -3.0000, 31.9030],
+    [50.0000,   2.5000,   0.0000, 58.0000,  24.0000,  15.0000, 19.4535],
+    [60.2574, -34.0099,  36.2677, 60.4626, -34.1751,  39.4387,  1.2644],
+    [63.0109, -31.0961,  -5.8663, 62.8187, -29.7946,  -4.0864,  1.2630],
+])
+
+class ColorDifferenceTest(unittest.TestCase):
+    def test_delta_e(self):
+        lab1 = _ciede2000_data[:,:3].T
+        lab2 = _ciede2000_data[:,3:6].T
+        expected = _ciede2000_data[:,6]
+        self.assertTrue(np.max(np.abs(delta_e(lab1, lab2) - expected)) < 1e-4)
+        # CIEDE2000 and CIE76 are symmetric.
+        self.assertTrue(np.max(np.abs(
+            delta_e(lab2, lab1) - delta_e(lab1, lab2))) < 1e-12)
+        self.assertTrue(np.max(np.abs(delta_e(lab1, lab2, "CIE76") -
+            np.sqrt(np.sum((lab1 - lab2) ** 2, axis=0)))) < 1e-12)
+        # CIE94 equals CIE76 for a neutral reference and a pure lightness
+        # difference.
+        self.assertAlmostEqual(
+            delta_e([50., 0., 0.], [60., 0., 0.], "CIE94"), 10.0)
+        self.assertAlmostEqual(
+            delta_e([50., 10., 0.], [50., 12., 0.], "CIE94"), 2 / 1.45)
+        self.assertRaises(Exception, delta_e, lab1, lab2, "foo")
+
+    def test_shapes(self):
+        srgb1 = np.random.rand(20, 30, 3)
+        srgb2 = np.random.rand(20, 30, 4)
+        lab1 = color_space_transform(srgb1, "sRGB", "CIE-L*a*b*")
+        lab2 = color_space_transform(srgb2[...,:3], "sRGB", "CIE-L*a*b*")
+        for method in ("CIE76", "CIE94", "CIEDE2000"):
+            # Image heatmaps, with the alpha channel ignored.
+            diff = delta_e(lab1, lab2, method)
+            self.assertEqual(diff.shape, (20, 30))
+            self.assertTrue(np.max(np.abs(delta_e(
+                srgb1, srgb2, method, color_space="sRGB") - diff)) < 1e-9)
+            self.assertTrue(np.max(np.abs(delta_e(
+                lab1.reshape(-1, 3).T, lab2.reshape(-1, 3).T, method) -
+                diff.ravel())) < 1e-12)
+            # One-to-many differences.
+            diff = delta_e(lab1[3,4], lab2, method)
+            self.assertEqual(diff.shape, (20, 30))
+            self.assertAlmostEqual(diff[5,6], delta_e(
+                lab1[3,4], lab2[5,6], method))
+            self.assertEqual(delta_e(lab1[3,4], lab1.reshape(-1, 3),
+                                     method, channel_axis=-1).shape, (600,))
+
+    def test_chunks_and_workers(self):
+        import color_difference
+        lab1 = np.random.rand(3, 1000) * 100
+        lab2 = np.random.rand(3, 1000) * 100
+        chunk_size = color_difference._chunk_size
+        diff = delta_e(lab1, lab2)
+        try:
+            color_difference._chunk_size = 64
+            self.assertTrue(np.all(delta_e(lab1, lab2) == diff))
+            self.assertTrue(np.all(delta_e(lab1, lab2, workers=4) == diff))
+            self.assertTrue(np.all(delta_e(
+                lab1.T.reshape(10, 100, 3), lab2.T.reshape(10, 100, 3),
+                workers=4) == diff.reshape(10, 100)))
+        finally:
+            color_difference._chunk_size = chunk_size
+
+if __name__ == "__main__":
+    unittest.main()
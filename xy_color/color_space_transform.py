@@ -3,12 +3,23 @@
 # Author: Ying Xiong.
 # Created: Apr 24, 2015.
 
+import functools
+import heapq
 import numpy as np
-import sys
+import time
 
+import backends
+from backends import Backend, get_backend, register_backend
 from data import *
+from data import _code_max, _float_dtype, _power
+import instrumentation
+import utils
+from utils import parallel_map, tile_ranges
 
-def color_space_transform(src_data, src_space, dst_space):
+def color_space_transform(src_data, src_space, dst_space, out=None,
+                          inplace=False, dtype=None, channel_axis=None,
+                          tile_size=None, workers=None, precision="exact",
+                          dither=False, gamut="clip", backend=None):
     """Transform an image from a one color space to another color space.
 
     Parameters
@@ -18,162 +29,1067 @@ def color_space_transform(src_data, src_space, dst_space):
           1. a `3xN` matrix, with each column representing a color vector.
           2. an `MxNx3` or `MxNx4` image. The alpha channel will be preserved if
              present.
+          3. an array of any shape with 3 (or 4, with alpha) color channels
+             along the `channel_axis`.
+
+        `uint8` or `uint16` data in `"sRGB"` is taken as integer codes (e.g.
+        `C = code / 255` for `uint8`, including the alpha channel), which are
+        decoded by a table lookup instead of the transfer function.
 
     src_space, dst_space: string
         Color spaces to be transformed from and to. Current supported color
-        spaces are: `"CIE-XYZ"`, `"CIE-xyY"`, `"sRGB-linear"`, `"sRGB"` and
-        `"CIE-L*a*b*"`.
+        spaces are: `"CIE-XYZ"`, `"CIE-xyY"`, `"sRGB-linear"`, `"sRGB"`,
+        `"AdobeRGB-linear"`, `"AdobeRGB"` (i.e. Adobe RGB (1998)) and
+        `"CIE-L*a*b*"`, and any other color space added by
+        `register_transform`.
+
+    out: ndarray, optional
+        A preallocated array of the same size as `src_data` to write the result
+        into, e.g. a buffer reused across video frames. The
+        intermediate results are computed in place inside it, so no full-size
+        array is allocated for the output.
+
+    inplace: bool, optional
+        If `True`, the result is written into `src_data` itself, which must then
+        be a floating point array. This is the same as `out=src_data`.
+
+    dtype: numpy dtype, optional
+        The floating point type to compute in and return. It defaults to the
+        type of `out` if given, or otherwise `float32` for `float32` input and
+        `float64` for anything else, so that `float32` data stays `float32`
+        end-to-end. Compared with the `float64` results, the `float32` ones have
+        an absolute error below `1e-5` in CIE-XYZ, CIE-xyY, sRGB-linear and sRGB
+        (for data in the usual `[0, 1]` range), and below `2e-4` in CIE-L*a*b*.
+
+        If it is `uint8` or `uint16` (or `out` is of such type), the result is
+        instead clipped to `[0, 1]` (see `gamut`) and quantized into integer
+        codes, e.g. `round(255 * C)` for `uint8`, chunk by chunk in the same
+        pass as the transform, so that no floating point output is allocated.
+        This is meant for RGB destination spaces such as `"sRGB"`.
+
+    channel_axis: int, optional
+        The axis of `src_data` holding the color channels. It defaults to `-1`
+        for `MxNx3` or `MxNx4` images and `0` for anything else. The transform
+        works natively on channels-last data (e.g. images), which are not
+        reshaped or transposed into a `3xN` matrix, and the `3xN` layout is
+        processed through a transposed view of it.
+
+    tile_size: int, optional
+        If given, the data is processed in tiles of about `tile_size` colors,
+        split along the first axis other than `channel_axis` (i.e. the rows of
+        an image or the columns of a `3xN` matrix), which bounds the memory used
+        by the transform to a small multiple of the tile size. In this mode
+        `src_data` can be anything supporting `shape`, `dtype` and slicing,
+        such as an `np.memmap` of an image larger than memory, and the result
+        can be streamed into a memory-mapped `out` array, e.g. one created by
+        `np.lib.format.open_memmap`.
+
+    workers: int, optional
+        Number of threads to split the colors among, which defaults to the
+        global setting of `utils.set_num_workers` (initially 1). The work is
+        split into chunks aligned with the internal chunking of the kernels, so
+        the result is bit-identical to the single-threaded one.
+
+    precision: string, optional
+        Either `"exact"` (default), or `"fast"` to replace the power functions
+        of the sRGB and CIE-L*a*b* transforms by polynomial approximations with
+        a relative error below `2.5e-6`. For data in the usual range, the
+        `"fast"` results are within `1e-5` of the exact ones (of the same
+        `dtype`) in CIE-XYZ, sRGB-linear and sRGB, far below the `0.5 / 255` of
+        8-bit codes, and within `2e-3` in CIE-L*a*b*, far below a just
+        noticeable difference.
+
+    dither: bool, optional
+        If `True`, integer results are quantized with an 8x8 ordered (Bayer)
+        dither over the two last non-channel axes (e.g. the rows and columns of
+        an image), instead of being rounded, which avoids banding in smooth
+        gradients.
+
+    gamut: string, optional
+        How integer results outside of `[0, 1]` are handled. With `"clip"`
+        (default) each channel is clipped independently, which can shift the
+        hue of saturated colors. With `"compress"`, each out-of-gamut color is
+        desaturated towards the gray of the same luma (with the Rec. 709
+        weights) until it fits, which preserves the hue.
+
+    backend: string, optional
+        Name of the compute backend running the element-wise kernels, among
+        `backends.list_backends()`, which defaults to the global setting of
+        `backends.set_backend` (initially the reference `"numpy"` backend).
 
     Returns
     -------
     dst_data : ndarray
         The output data after transformation. It will be an `ndarray` of
-        the same size as `src_data`.
+        the same size as `src_data`, and will be `out` (or `src_data`) itself if
+        it is provided.
+
+    See Also
+    --------
+    get_transform: get the compiled (and cached) transform used by this
+        function, which avoids the per-call lookup when converting many small
+        batches.
+
+    """
+    return get_transform(src_space, dst_space, precision, backend)(
+        src_data, out=out, inplace=inplace, dtype=dtype,
+        channel_axis=channel_axis, tile_size=tile_size, workers=workers,
+        dither=dither, gamut=gamut)
+
+def color_space_transform_multi(src_data, src_space, dst_spaces, dtype=None,
+                                channel_axis=None, workers=None,
+                                precision="exact", backend=None):
+    """Transform an image from one color space to several color spaces,
+    computing each shared intermediate color space only once.
+
+    The destinations are computed one at a time, each from the source or from
+    an already computed destination, whichever is the cheapest to transform
+    from (see `TransformPlan.cost`). Intermediate color spaces on the routes of
+    two or more destinations are computed once as well, but not returned. For
+    example, converting sRGB data into `"sRGB-linear"`, `"CIE-XYZ"`,
+    `"CIE-xyY"` and `"CIE-L*a*b*"` only applies the inverse sRGB gamma once, and
+    computes the other three from the CIE-XYZ result.
+
+    Parameters
+    ----------
+    src_data: ndarray
+        The input data, as in `color_space_transform`.
+
+    src_space: string
+        Color space of `src_data`.
+
+    dst_spaces: list of strings
+        Color spaces to be transformed to.
+
+    dtype, channel_axis, workers, precision, backend: optional
+        Same as in `color_space_transform`.
+
+    Returns
+    -------
+    dst_data : dict
+        The transformed data of each color space in `dst_spaces`, as new arrays
+        of the same size as `src_data`.
 
     """
-    if len(src_data.shape) == 3:
-        # The 'src_data' is an image, convert it into 3xN color matrix.
-        (M,N,C) = src_data.shape
-        assert (C == 3) or (C == 4)
-        src_data2 = src_data[:,:,:3].reshape(M*N, 3).T
-
-        # Recursively call this function on the 3xN matrix.
-        dst_data2 = color_space_transform(src_data2, src_space, dst_space)
-
-        # Put the transformed data back into image form.
-        dst_data = np.zeros(src_data.shape)
-        dst_data[:,:,:3] = dst_data2.T.reshape(M,N,3)
-        if (C == 4):
-            dst_data[:,:,3] = src_data[:,:,3]
-        return dst_data
+    dtype = _float_dtype(src_data, dtype)
+    results = {src_space: src_data}
+    routes = [get_transform(src_space, dst_space).route
+              for dst_space in dst_spaces if dst_space != src_space]
+    shared_spaces = set(space for route in routes for space in route[1:-1]
+                        if sum(space in r for r in routes) > 1)
+    targets = set(dst_spaces) | shared_spaces
+    targets.discard(src_space)
+    while targets:
+        # Compute the cheapest target from anything computed so far.
+        plan = min((get_transform(space, target, precision, backend)
+                    for space in results for target in targets),
+                   key=lambda plan: plan.cost)
+        results[plan.dst_space] = plan(
+            results[plan.src_space], dtype=dtype, channel_axis=channel_axis,
+            workers=workers)
+        targets.remove(plan.dst_space)
+    if src_space in dst_spaces:
+        results[src_space] = np.array(src_data, dtype)
+        if src_space == "sRGB" and _code_max(src_data.dtype) is not None:
+            results[src_space] /= _code_max(src_data.dtype)
+    return {dst_space: results[dst_space] for dst_space in dst_spaces}
+
+class TransformPlan(object):
+    """A compiled transform from one color space to another.
+
+    The chain of intermediate color spaces is resolved once when the plan is
+    created, and consecutive linear steps are folded into a single precomputed
+    `3x3` matrix, so calling the plan only runs the remaining kernels. Plans
+    are usually obtained from `get_transform` instead of being constructed
+    directly.
+
+    Attributes
+    ----------
+    src_space, dst_space: string
+        Color spaces to be transformed from and to.
 
+    route: list of strings
+        All the color spaces visited by the transform, starting with
+        `src_space` and ending with `dst_space`.
+
+    precision: string
+        Either `"exact"` or `"fast"`, as in `color_space_transform`.
+
+    backend: string
+        Name of the compute backend running the kernels.
+
+    steps: list of callables
+        The kernels to be applied in order, each taking an `Nx3` matrix and an
+        optional `out` array (which can be the input itself) to write into.
+
+    step_names: list of strings
+        The part of the route covered by each step, e.g. `"sRGB-linear ->
+        CIE-XYZ"`, as reported by the `instrumentation`.
+
+    cost: float
+        The estimated run time of the steps, relative to a `3x3` matrix product
+        on the same number of colors.
+
+    """
+    def __init__(self, src_space, dst_space, precision="exact", backend=None):
+        if precision not in ("exact", "fast"):
+            raise Exception("Unknown precision '%s'." % precision)
+        self.src_space = src_space
+        self.dst_space = dst_space
+        self.precision = precision
+        self.backend = get_backend(backend).name
+        self.route, self.cost = _resolve_route(src_space, dst_space)
+        self.steps, self.step_names = _compile_steps(self.route, precision,
+                                                     self.backend)
+
+    def __call__(self, src_data, out=None, inplace=False, dtype=None,
+                 channel_axis=None, tile_size=None, workers=None, dither=False,
+                 gamut="clip"):
+        """Apply the transform on `src_data`, with the same `out`, `inplace`,
+        `dtype`, `channel_axis`, `tile_size`, `workers`, `dither` and `gamut`
+        options as in `color_space_transform`."""
+        if instrumentation._hooks:
+            return instrumentation.record(
+                "transform", "%s -> %s" % (self.src_space, self.dst_space),
+                self._call, src_data, out, inplace, dtype, channel_axis,
+                tile_size, workers, dither, gamut)
+        return self._call(src_data, out, inplace, dtype, channel_axis,
+                          tile_size, workers, dither, gamut)
+
+    def _call(self, src_data, out, inplace, dtype, channel_axis, tile_size,
+              workers, dither, gamut):
+        if inplace:
+            out = src_data
+        if out is None:
+            dtype = _float_dtype(src_data, dtype)
+        else:
+            if out.shape != src_data.shape:
+                raise ValueError("The `out` array must be of shape %s." %
+                                 (src_data.shape,))
+            dtype = out.dtype
+        if channel_axis is None:
+            channel_axis = -1 if len(src_data.shape) == 3 else 0
+        if tile_size is not None:
+            return self._call_tiled(src_data, out, dtype, channel_axis,
+                                    tile_size, workers, dither, gamut)
+        if _code_max(dtype) is not None:
+            return self._call_quantized(src_data, out, dtype, channel_axis,
+                                        workers, dither, gamut)
+        if (self.src_space == "sRGB" and dtype.kind == "f" and
+            _code_max(src_data.dtype) is not None):
+            return self._call_codes(src_data, out, dtype, channel_axis,
+                                    workers)
+        if src_data.dtype != dtype:
+            # Convert the input once, and then work in place on it.
+            src_data = src_data.astype(dtype)
+            if out is None:
+                out = src_data
+        if out is None:
+            out = np.empty(src_data.shape, dtype)
+
+        # Work on channels-last views of the data, and pass the alpha channel
+        # (if any) through without transforming it.
+        src_view = np.moveaxis(src_data, channel_axis, -1)
+        dst_view = np.moveaxis(out, channel_axis, -1)
+        C = src_view.shape[-1]
+        if (C != 3) and (C != 4):
+            raise ValueError("The data must have 3 or 4 color channels.")
+        if (C == 4) and (out is not src_data):
+            dst_view[...,3] = src_view[...,3]
+        src_colors = src_view[...,:3].reshape(-1, 3)
+        dst_colors = _colors_view(dst_view[...,:3])
+        if dst_colors is not None:
+            self._run_parallel(src_colors, dst_colors, workers)
+        else:
+            dst_colors = np.empty(src_colors.shape, dtype)
+            self._run_parallel(src_colors, dst_colors, workers)
+            dst_view[...,:3] = dst_colors.reshape(dst_view.shape[:-1] + (3,))
+        return out
+
+    def _call_tiled(self, src_data, out, dtype, channel_axis, tile_size,
+                    workers, dither, gamut):
+        """Apply the transform tile by tile, reading each tile of `src_data`
+        into memory only when it is processed."""
+        shape = src_data.shape
+        channel_axis %= len(shape)
+        if out is None:
+            out = np.empty(shape, dtype)
+        if len(shape) == 1:
+            return self(np.asarray(src_data), out, channel_axis=channel_axis,
+                        dither=dither, gamut=gamut)
+        tile_axis = 1 if channel_axis == 0 else 0
+        # Number of colors in each slice along the tile axis.
+        slice_size = int(np.prod(shape)) // \
+                     max(shape[channel_axis] * shape[tile_axis], 1)
+        for start, stop in tile_ranges(shape[tile_axis],
+                                       tile_size // max(slice_size, 1)):
+            index = (slice(None),) * tile_axis + (slice(start, stop),)
+            src_tile = np.asarray(src_data[index])
+            if isinstance(out, np.ndarray):
+                self(src_tile, out[index], channel_axis=channel_axis,
+                     workers=workers, dither=dither, gamut=gamut)
+            else:
+                out[index] = self(src_tile, dtype=dtype,
+                                  channel_axis=channel_axis, workers=workers,
+                                  dither=dither, gamut=gamut)
+        return out
+
+    def _call_codes(self, src_data, out, dtype, channel_axis, workers):
+        """Apply the transform on integer sRGB codes, by decoding them into
+        sRGB-linear with a lookup table and transforming from there."""
+        out = srgb_inverse_gamma(src_data, out=out, dtype=dtype)
+        src_view = np.moveaxis(src_data, channel_axis, -1)
+        if src_view.shape[-1] == 4:
+            # The alpha channel is only scaled into `[0, 1]`.
+            np.multiply(src_view[...,3], 1.0 / _code_max(src_data.dtype),
+                        out=np.moveaxis(out, channel_axis, -1)[...,3])
+        if self.dst_space == "sRGB-linear":
+            return out
+        plan = get_transform("sRGB-linear", self.dst_space, self.precision,
+                             self.backend)
+        return plan(out, inplace=True, channel_axis=channel_axis,
+                    workers=workers)
+
+    def _call_quantized(self, src_data, out, dtype, channel_axis, workers,
+                        dither, gamut):
+        """Apply the transform and quantize the results into integer codes of
+        type `dtype`, running all the steps on one chunk of colors at a time in
+        a small floating point buffer."""
+        if gamut not in ("clip", "compress"):
+            raise Exception("Unknown gamut mapping '%s'." % gamut)
+        if out is None:
+            out = np.empty(src_data.shape, dtype)
+        code_max = _code_max(dtype)
+        src_code_max = _code_max(src_data.dtype)
+        float_dtype = _float_dtype(src_data)
+        steps, names = self.steps, self.step_names
+        if self.src_space == "sRGB" and src_code_max is not None:
+            # Decode the sRGB codes into sRGB-linear with a lookup table.
+            plan = get_transform("sRGB-linear", self.dst_space, self.precision,
+                                 self.backend)
+            steps = [_transform_srgb_to_srgblin] + plan.steps
+            names = ["sRGB -> sRGB-linear"] + plan.step_names
+
+        src_view = np.moveaxis(src_data, channel_axis, -1)
+        dst_view = np.moveaxis(out, channel_axis, -1)
+        C = src_view.shape[-1]
+        if (C != 3) and (C != 4):
+            raise ValueError("The data must have 3 or 4 color channels.")
+        if (C == 4) and (out is not src_data):
+            if src_code_max == code_max:
+                dst_view[...,3] = src_view[...,3]
+            else:
+                alpha = src_view[...,3].astype(float_dtype)
+                if src_code_max is not None:
+                    alpha /= src_code_max
+                _quantize(alpha[...,np.newaxis], dst_view[...,3:], code_max,
+                          "clip", None)
+        src_colors = src_view[...,:3].reshape(-1, 3)
+        dst_colors = _colors_view(dst_view[...,:3])
+        if dst_colors is None:
+            dst_colors = np.empty(src_colors.shape, dtype)
+        shape = src_view.shape[:-1]
+        def run_chunk(chunk):
+            for start, stop in _chunks(chunk[1] - chunk[0]):
+                start += chunk[0]
+                stop += chunk[0]
+                buf = np.empty((stop - start, 3), float_dtype)
+                if steps is self.steps:
+                    buf[...] = src_colors[start:stop]
+                    colors = self._run(buf, buf)
+                else:
+                    colors = self._run(src_colors[start:stop], buf, steps,
+                                       names)
+                thresholds = None
+                if dither:
+                    thresholds = _dither_thresholds(start, stop, shape)
+                _quantize(colors, dst_colors[start:stop], code_max, gamut,
+                          thresholds)
+        _map_chunks(run_chunk, len(src_colors), workers)
+        if not np.may_share_memory(dst_colors, out):
+            dst_view[...,:3] = dst_colors.reshape(dst_view.shape[:-1] + (3,))
+        return out
+
+    def _run_parallel(self, src_colors, dst_colors, workers):
+        """Run the steps on chunks of the `Nx3` matrix with a pool of `workers`
+        threads, see `_map_chunks`."""
+        def run_chunk(chunk):
+            start, stop = chunk
+            self._run(src_colors[start:stop], dst_colors[start:stop])
+        _map_chunks(run_chunk, src_colors.shape[0], workers)
+
+    def _run(self, src_colors, out=None, steps=None, names=None):
+        """Run the steps (or the given `steps` with their `names`) on an `Nx3`
+        matrix."""
+        if steps is None:
+            steps, names = self.steps, self.step_names
+        if not steps and out is not None:
+            out[...] = src_colors
+            return out
+        dst_colors = src_colors
+        for step, name in zip(steps, names):
+            if instrumentation._hooks:
+                dst_colors = instrumentation.record("step", name, step,
+                                                    dst_colors, out)
+            else:
+                dst_colors = step(dst_colors, out)
+            # Following steps run in place on the intermediate results.
+            out = dst_colors
+        return dst_colors
+
+    def __repr__(self):
+        return "TransformPlan(%s%s%s)" % (
+            " -> ".join("'%s'" % space for space in self.route),
+            ", precision='fast'" if self.precision == "fast" else "",
+            ", backend='%s'" % self.backend if self.backend != "numpy" else "")
+
+def _map_chunks(fcn, num_colors, workers):
+    """Call `fcn` on the `(start, stop)` ranges of chunks of `num_colors`
+    colors with a pool of `workers` threads, or on the whole range if it is not
+    worth splitting. The chunks are multiples of `_fused_chunk_size`, so that
+    the kernels see exactly the same sub-chunks as in a single run."""
+    if workers is None:
+        workers = utils._num_workers
+    if workers <= 1 or num_colors <= _fused_chunk_size:
+        fcn((0, num_colors))
+        return
+    # Use a few chunks per thread to balance the load.
+    num_chunks = -(-num_colors // _fused_chunk_size)
+    chunk_size = _fused_chunk_size * max(num_chunks // (4 * workers), 1)
+    parallel_map(fcn, tile_ranges(num_colors, chunk_size), workers)
+
+def _quantize(colors, out, code_max, gamut, thresholds):
+    """Clip (or gamut map) the `Nx3` floating point `colors` in place, and
+    quantize them into the integer `out` with codes from `0` to `code_max`,
+    using the per-color dither `thresholds` in `[0, 1)` if given."""
+    if gamut == "compress":
+        _compress_gamut(colors)
+    np.clip(colors, 0, 1, out=colors)
+    colors *= code_max
+    if thresholds is None:
+        colors += 0.5
+    else:
+        colors += thresholds[:,np.newaxis]
+    # The values are non-negative, so truncating them rounds them down.
+    out[...] = colors
+
+def _compress_gamut(colors):
+    """Desaturate the `Nx3` colors outside of `[0, 1]` in place, towards the
+    gray of the same luma, just enough to fit into `[0, 1]`."""
+    gray = np.dot(colors, _luma_weights.astype(colors.dtype))
+    np.clip(gray, 0, 1, out=gray)
+    diff = colors - gray[:,np.newaxis]
+    # The largest scale of `diff` keeping each channel inside `[0, 1]`.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        limit = np.where(diff > 0, 1 - gray[:,np.newaxis], -gray[:,np.newaxis])
+        limit /= diff
+    limit[diff == 0] = 1
+    scale = np.min(limit, axis=1)
+    np.clip(scale, 0, 1, out=scale)
+    diff *= scale[:,np.newaxis]
+    np.add(diff, gray[:,np.newaxis], out=colors)
+
+def _dither_thresholds(start, stop, shape):
+    """The ordered dither thresholds of the colors from `start` to `stop` in
+    the flattened array of the given `shape` (without the color channels),
+    tiling the Bayer matrix over its two last axes."""
+    index = np.arange(start, stop)
+    if len(shape) >= 2:
+        rows = (index // shape[-1]) % 8
+        cols = index % shape[-1] % 8
+    else:
+        rows = 0
+        cols = index % 8
+    return _bayer_thresholds[rows, cols]
+
+# The 8x8 Bayer matrix, as thresholds evenly spaced in `[0, 1)`.
+_bayer_matrix = np.array([[0, 2], [3, 1]])
+for i in xrange(2):
+    _bayer_matrix = np.vstack([
+        np.hstack([4 * _bayer_matrix, 4 * _bayer_matrix + 2]),
+        np.hstack([4 * _bayer_matrix + 3, 4 * _bayer_matrix + 1])])
+_bayer_thresholds = (_bayer_matrix + 0.5) / 64
+
+# The Rec. 709 luma weights used by `_compress_gamut`.
+_luma_weights = np.array([0.2126, 0.7152, 0.0722])
+
+def _colors_view(data):
+    """View the `...x3` data as an `Nx3` matrix, or return `None` if that is not
+    possible without copying."""
+    colors = data.view()
     try:
-        # Find a transform function from `src_space` to `dst_space` and run it.
-        _src_space = _color_space_name[src_space]
-        _dst_space = _color_space_name[dst_space]
-        _transform_fcn = getattr(
-            sys.modules[__name__],
-            "_transform_%s_to_%s" % (_src_space, _dst_space))
-        return _transform_fcn(src_data)
+        colors.shape = (-1, 3)
     except AttributeError:
-        # There is no such transform function defined. In this case we will use
-        # an intermediate space `itm_space`, try convert the data from
-        # `src_space` to `itm_space` and then from `itm_space` to `dst_space`.
-        if src_space == "sRGB" or dst_space == "sRGB":
-            itm_space = "sRGB-linear"
+        return None
+    return colors
+
+def get_transform(src_space, dst_space, precision="exact", backend=None):
+    """Get the compiled transform from `src_space` to `dst_space`.
+
+    The returned `TransformPlan` is cached per `(src_space, dst_space,
+    precision, backend)`, where `backend` defaults to the global setting of
+    `backends.set_backend`, so it is only resolved the first time it is
+    requested (or the first time after `register_transform` changes the
+    transform graph). Calling it is equivalent to calling
+    `color_space_transform` with the same color spaces.
+
+    Example::
+
+      srgb_to_lab = get_transform("sRGB", "CIE-L*a*b*")
+      for batch in batches:
+          lab = srgb_to_lab(batch)
+
+    """
+    key = (src_space, dst_space, precision, get_backend(backend).name)
+    try:
+        return _transform_plans[key]
+    except KeyError:
+        plan = TransformPlan(src_space, dst_space, precision, backend)
+        _transform_plans[key] = plan
+        return plan
+
+_transform_plans = {}
+
+def register_transform(src_space, dst_space, kernel, cost=None,
+                       takes_precision=False, takes_backend=False):
+    """Register a direct transform from `src_space` to `dst_space`.
+
+    Color spaces form a graph with the registered transforms as edges, and
+    `color_space_transform` goes through the route of the lowest total cost,
+    e.g. `"CIE-xyY"` to `"sRGB"` through `"CIE-XYZ"` and `"sRGB-linear"`. So a
+    new color space can be supported by registering transforms from and to any
+    existing one, and a cheaper direct transform between two spaces can be
+    registered to replace a longer route. Registering an existing edge again
+    replaces it.
+
+    Parameters
+    ----------
+    src_space, dst_space: string
+        Color spaces to be transformed from and to.
+
+    kernel: callable or ndarray
+        Either a `3x3` matrix to be left-multiplied with each color, or a
+        function `kernel(src_data, out=None)` taking an `Nx3` matrix of colors
+        and returning the transformed `Nx3` matrix, written into `out` if
+        provided (which can be `src_data` itself).
+
+    cost: float, optional
+        The estimated run time of the transform, relative to a `3x3` matrix
+        product on the same number of colors. Matrices default to `1`, and the
+        cost of a function is measured if not provided. Consecutive matrices
+        on a route are folded into one, and so are only counted once.
+
+    takes_precision: bool, optional
+        Whether `kernel` takes a `precision` keyword argument, as described in
+        `color_space_transform`.
+
+    takes_backend: bool, optional
+        Whether `kernel` takes a `backend` keyword argument, which is the
+        `backends.Backend` to get its element-wise kernels from.
+
+    """
+    key = (src_space, dst_space)
+    if callable(kernel):
+        _transform_kernel[key] = kernel
+        _linear_transform_matrix.pop(key, None)
+    else:
+        kernel = np.asarray(kernel, dtype=np.float64)
+        if kernel.shape != (3, 3):
+            raise ValueError("The transform matrix must be of shape (3, 3).")
+        _linear_transform_matrix[key] = kernel
+        _transform_kernel.pop(key, None)
+    if takes_precision:
+        _precision_transforms.add(key)
+    else:
+        _precision_transforms.discard(key)
+    if takes_backend:
+        _backend_transforms.add(key)
+    else:
+        _backend_transforms.discard(key)
+    if cost is None:
+        cost = 1. if key in _linear_transform_matrix else _measure_cost(key)
+    _transform_cost[key] = float(cost)
+    _transform_edges.setdefault(src_space, set()).add(dst_space)
+    _transform_plans.clear()
+
+def unregister_transform(src_space, dst_space):
+    """Unregister the direct transform from `src_space` to `dst_space`
+    registered by `register_transform`, e.g. to undo a temporary one. The
+    routes going through it are resolved again when next requested."""
+    key = (src_space, dst_space)
+    if dst_space not in _transform_edges.get(src_space, ()):
+        raise Exception("Unknown transform from '%s' to '%s'." % key)
+    _transform_edges[src_space].discard(dst_space)
+    if not _transform_edges[src_space]:
+        del _transform_edges[src_space]
+    _transform_kernel.pop(key, None)
+    _linear_transform_matrix.pop(key, None)
+    _precision_transforms.discard(key)
+    _backend_transforms.discard(key)
+    del _transform_cost[key]
+    _transform_plans.clear()
+
+def calibrate_transform_costs(num_colors=65536):
+    """Measure the cost of all the registered transform functions on
+    `num_colors` random colors, relative to a `3x3` matrix product, and use
+    them for routing from then on. The built-in costs were measured this way,
+    and may differ on other machines."""
+    for key in _transform_kernel:
+        _transform_cost[key] = _measure_cost(key, num_colors)
+    _transform_plans.clear()
+
+def _measure_cost(key, num_colors=65536):
+    """Measure the run time of the transform function of `key` relative to a
+    `3x3` matrix product, on `num_colors` random colors."""
+    src_data = np.random.rand(num_colors, 3)
+    out = np.empty(src_data.shape)
+    matrix = np.eye(3)
+    def run_time(fcn):
+        # Take the best of a few runs.
+        times = []
+        for i in xrange(3):
+            start = time.time()
+            fcn()
+            times.append(time.time() - start)
+        return min(times)
+    with np.errstate(all="ignore"):
+        kernel_time = run_time(
+            lambda: _transform_kernel[key](src_data, out))
+    matrix_time = run_time(lambda: _apply_matrix(matrix, src_data, out))
+    return kernel_time / max(matrix_time, 1e-9)
+
+def _resolve_route(src_space, dst_space):
+    """Find the list of color spaces to go through from `src_space` to
+    `dst_space`, both ends included, and its total cost.
+
+    This runs Dijkstra's algorithm on the graph of registered transforms, where
+    a state is a color space together with whether it was reached by a matrix,
+    so that the matrices folded into a previous one are free, and ties are
+    broken by the number of transforms. The route from a color space to itself
+    is just the color space, i.e. the identity transform."""
+    start = (src_space, False)
+    best = {start: (0., 0)}
+    previous = {}
+    heap = [(0., 0, start)]
+    while heap:
+        cost, hops, state = heapq.heappop(heap)
+        if best[state] < (cost, hops):
+            continue
+        space, linear = state
+        if space == dst_space:
+            route = [space]
+            while state != start:
+                state = previous[state]
+                route.append(state[0])
+            return route[::-1], cost
+        for next_space in sorted(_transform_edges.get(space, ())):
+            key = (space, next_space)
+            is_linear = key in _linear_transform_matrix
+            edge_cost = 0. if (linear and is_linear) else _transform_cost[key]
+            next_state = (next_space, is_linear)
+            next_cost = (cost + edge_cost, hops + 1)
+            if next_cost < best.get(next_state, (np.inf, 0)):
+                best[next_state] = next_cost
+                previous[next_state] = state
+                heapq.heappush(heap, next_cost + (next_state,))
+    raise Exception("Unknown transform from '%s' to '%s'." %
+                    (src_space, dst_space))
+
+def _compile_steps(route, precision="exact", backend="numpy"):
+    """Turn a route of color spaces into a list of kernels, folding consecutive
+    linear transforms into a single matrix, and binding `precision` and the
+    `backend` of the given name to the kernels that take them. Returns the
+    kernels and the names of the parts of the route they cover."""
+    steps = []
+    names = []
+    matrix = None
+    for i, key in enumerate(zip(route[:-1], route[1:])):
+        if key in _linear_transform_matrix:
+            m = _linear_transform_matrix[key]
+            if matrix is None:
+                matrix, matrix_start = m, i
+            else:
+                matrix = np.dot(m, matrix)
+            continue
+        if matrix is not None:
+            steps.append(functools.partial(_apply_matrix, matrix))
+            names.append(" -> ".join(route[matrix_start:i+1]))
+            matrix = None
+        step = _transform_kernel[key]
+        if precision != "exact" and key in _precision_transforms:
+            step = functools.partial(step, precision=precision)
+        if backend != "numpy" and key in _backend_transforms:
+            step = functools.partial(step, backend=get_backend(backend))
+        steps.append(step)
+        names.append(" -> ".join(key))
+    if matrix is not None:
+        steps.append(functools.partial(_apply_matrix, matrix))
+        names.append(" -> ".join(route[matrix_start:]))
+    return steps, names
+
+# The registered transforms: the color spaces directly reachable from each color
+# space, and keyed by `(src_space, dst_space)`, the functions, the matrices of
+# the transforms that are linear in the color vector (to be left-multiplied
+# with each color), the transforms whose functions take a `precision` or a
+# `backend` argument, and the cost of all of them relative to a `3x3` matrix
+# product on the same number of colors.
+_transform_edges = {}
+_transform_kernel = {}
+_linear_transform_matrix = {}
+_precision_transforms = set()
+_backend_transforms = set()
+_transform_cost = {}
+
+def _apply_matrix(matrix, src_data, out=None):
+    """Multiply each color in the `Nx3` data with a `3x3` matrix, writing into
+    `out` if provided. The `out` array can be `src_data` itself."""
+    if out is None:
+        out = np.empty(src_data.shape, _float_dtype(src_data))
+    matrix = matrix.astype(out.dtype)
+    # The product is computed on fixed chunks, so that the result does not
+    # depend on how the data is split among threads.
+    direct = (out.flags.c_contiguous and out.dtype == src_data.dtype and
+              not np.may_share_memory(out, src_data))
+    for start, stop, buf, _ in _fused_chunks(src_data.shape[0], out.dtype):
+        if direct:
+            np.dot(src_data[start:stop], matrix.T, out=out[start:stop])
         else:
-            itm_space = "CIE-XYZ"
-        if src_space == itm_space or dst_space == itm_space:
-            raise Exception("Unknown transform from '%s' to '%s'." %
-                            (src_space, dst_space))
-        itm_data = color_space_transform(src_data, src_space, itm_space)
-        dst_data = color_space_transform(itm_data, itm_space, dst_space)
-        return dst_data
-
-_color_space_name = {
-    "CIE-XYZ": "xyz",
-    "CIE-xyY": "xyy",
-    "sRGB": "srgb",
-    "sRGB-linear": "srgblin",
-    "CIE-L*a*b*": "lab",
-}
+            np.dot(matrix, src_data[start:stop].T, out=buf)
+            out[start:stop] = buf.T
+    return out
 
-def _transform_xyy_to_xyz(src_data):
+# All the `_transform_*` kernels below take an `Nx3` matrix `src_data` and an
+# optional `out` array of the same size to write the result into, which can be
+# `src_data` itself. They compute in the type of `out`, which defaults to the
+# type given by `_float_dtype(src_data)`, and return the result array.
+
+def _transform_xyy_to_xyz(src_data, out=None, backend=None):
     """Convert data from CIE-xyY color space to CIE-XYZ color space."""
-    assert src_data.shape[0] == 3, "Input data must be 3xN matrix."
-    dst_data = np.zeros(src_data.shape)
-    # Y = Y.
-    dst_data[1,:] = src_data[2,:]
-    # X = Y / y * x.
-    validTag = src_data[1,:] > 0
-    dst_data[0,validTag] = src_data[2,validTag] / src_data[1,validTag] * \
-                           src_data[0,validTag]
+    assert src_data.shape[1] == 3, "Input data must be Nx3 matrix."
+    if out is None:
+        out = np.empty(src_data.shape, _float_dtype(src_data))
+    _kernel(backend, "xyy_to_xyz")(src_data, out)
+    return out
+
+def _xyy_to_xyz(src_data, out):
+    """The reference `"xyy_to_xyz"` kernel, see `backends.Backend`."""
+    x, y, Y = src_data.T
+    # r = Y / y, or 0 when y <= 0.
+    r = np.zeros(y.shape, out.dtype)
+    validTag = y > 0
+    np.divide(Y, y, out=r, where=validTag)
     # Z = Y / y * (1 - x - y).
-    dst_data[2,validTag] = src_data[2,validTag] / src_data[1,validTag] * \
-                           (1 - src_data[0,validTag] - src_data[1,validTag])
-    return dst_data
+    Z = 1 - x - y
+    Z *= r
+    # X = Y / y * x.
+    np.multiply(r, x, out=out[:,0])
+    # Y = Y.
+    out[:,1] = Y
+    out[:,2] = Z
 
-def _transform_xyz_to_xyy(src_data):
+def _transform_xyz_to_xyy(src_data, out=None):
     """Convert data from CIE-XYZ color space to CIE-xyY color space."""
-    assert src_data.shape[0] == 3, "Input data must be 3xN matrix."
-    dst_data = np.zeros(src_data.shape)
+    assert src_data.shape[1] == 3, "Input data must be Nx3 matrix."
+    if out is None:
+        out = np.empty(src_data.shape, _float_dtype(src_data))
+    s = np.sum(src_data, axis = 1)
+    validTag = s > 0
     # Y = Y.
-    dst_data[2] = src_data[1,:]
+    out[:,2] = src_data[:,1]
     # x = X / (X + Y + Z).
     # y = Y / (X + Y + Z).
-    s = np.sum(src_data, axis = 0)
-    validTag = s > 0
-    dst_data[:2, validTag] = src_data[:2,validTag] / s[validTag]
-    return dst_data
+    for c in (0, 1):
+        np.divide(src_data[:,c], s, out=out[:,c], where=validTag)
+        out[~validTag,c] = 0.
+    return out
 
-def _transform_xyz_to_srgblin(src_data):
-    return np.dot(xyz_to_srgb_matrix, src_data)
+def _transform_srgblin_to_srgb(src_data, out=None, precision="exact",
+                               backend=None):
+    if backend is None:
+        return srgb_gamma(src_data, out=out, precision=precision)
+    return _apply_elementwise(src_data, out, precision,
+                              backend.kernel("srgb_gamma"))
 
-def _transform_srgblin_to_xyz(src_data):
-    return np.dot(srgb_to_xyz_matrix, src_data)
+def _transform_srgb_to_srgblin(src_data, out=None, precision="exact",
+                               backend=None):
+    if backend is None or _code_max(src_data.dtype) is not None:
+        return srgb_inverse_gamma(src_data, out=out, precision=precision)
+    return _apply_elementwise(src_data, out, precision,
+                              backend.kernel("srgb_inverse_gamma"))
 
-def _transform_srgblin_to_srgb(src_data):
-    return srgb_gamma(src_data)
+def _apply_elementwise(src_data, out, precision, kernel):
+    """Apply the element-wise `kernel` of a backend on chunks of the `Nx3`
+    data."""
+    if out is None:
+        out = np.empty(src_data.shape, _float_dtype(src_data))
+    for start, stop, buf, tmp in _fused_chunks(src_data.shape[0], out.dtype):
+        buf[...] = src_data[start:stop].T
+        kernel(buf, tmp, precision)
+        out[start:stop] = buf.T
+    return out
 
-def _transform_srgb_to_srgblin(src_data):
-    return srgb_inverse_gamma(src_data)
+def _transform_adobelin_to_adobe(src_data, out=None, precision="exact"):
+    return adobe_gamma(src_data, out=out, precision=precision)
 
-def _transform_xyz_to_lab(src_data):
+def _transform_adobe_to_adobelin(src_data, out=None, precision="exact"):
+    return adobe_inverse_gamma(src_data, out=out, precision=precision)
+
+def _transform_xyz_to_lab(src_data, out=None, precision="exact",
+                          backend=None):
     """Convert data from CIE-XYZ color space to CIE-L*a*b* color space.
 
     See: https://en.wikipedia.org/wiki/Lab_color_space#CIELAB-CIEXYZ_conversions
     Accessed on: Apr 24, 2015.
     """
-    assert src_data.shape[0] == 3, "Input data must be 3xN matrix."
-    Xn = d65_xyz[0] / d65_xyz[1]
-    Yn = 1.
-    Zn = d65_xyz[2] / d65_xyz[1]
-    f = _lab_f
-
-    dst_data = np.empty(src_data.shape)
-    # L* = 116 f(Y / Yn) - 16.
-    dst_data[0:] = 116 * f(src_data[1,:] / Yn) - 16
-    # a* = 500 [f(X / Xn) - f(Y / Yn)].
-    dst_data[1:] = 500 * (f(src_data[0,:] / Xn) - f(src_data[1,:] / Yn))
-    # b* = 200 [f(Y / Yn) - f(Z / Zn)].
-    dst_data[2:] = 200 * (f(src_data[1,:] / Yn) - f(src_data[2,:] / Zn))
-
-    return dst_data
+    assert src_data.shape[1] == 3, "Input data must be Nx3 matrix."
+    if out is None:
+        out = np.empty(src_data.shape, _float_dtype(src_data))
+    white = _lab_white[:,np.newaxis].astype(out.dtype)
+    lab_f = _kernel(backend, "lab_f")
+    for start, stop, buf, tmp in _fused_chunks(src_data.shape[0], out.dtype):
+        # f(X / Xn), f(Y / Yn) and f(Z / Zn).
+        np.divide(src_data[start:stop].T, white, out=buf)
+        lab_f(buf, tmp, precision)
+        _lab_from_f_chunk(buf, tmp)
+        out[start:stop] = tmp.T
+    return out
 
-def _lab_f(t):
-    f = np.empty(t.shape)
+def _lab_f(t, out=None, inplace=False, precision="exact"):
+    """The nonlinear function used by CIE-L*a*b*, i.e. `f` in `L* = 116 f(Y /
+    Yn) - 16`. The result is written into `out` if provided, or into `t` itself
+    if `inplace` is `True`. If `precision` is `"fast"`, the cube root is
+    approximated by `_fast_power`."""
+    if inplace:
+        out = t
+    if out is None:
+        out = np.empty(t.shape, _float_dtype(t))
     part1 = (t > ((6. / 29.) ** 3))
-    f[part1] = t[part1] ** (1. / 3.)
-    part2 = ~part1
-    f[part2] = 1. / 3. * (29. / 6.) ** 2 * t[part2] + 4. / 29.
-    return f
+    cube_root = _power(t, 1. / 3., precision=precision)
+    np.multiply(t, 1. / 3. * (29. / 6.) ** 2, out=out)
+    out += 4. / 29.
+    np.copyto(out, cube_root, where=part1)
+    return out
 
-def _transform_lab_to_xyz(src_data):
+def _transform_lab_to_xyz(src_data, out=None, precision="exact",
+                          backend=None):
     """Convert data from CIE-L*a*b* color space to CIE-XYZ color space.
 
     See: https://en.wikipedia.org/wiki/Lab_color_space#CIELAB-CIEXYZ_conversions
     Accessed on: Apr 24, 2015.
     """
-    assert src_data.shape[0] == 3, "Input data must be 3xN matrix."
-    Xn = d65_xyz[0] / d65_xyz[1]
-    Yn = 1.
-    Zn = d65_xyz[2] / d65_xyz[1]
-    f_inv = _lab_f_inv
-
-    dst_data = np.empty(src_data.shape)
-    # X = Xn * f_inv((L* + 16) / 116 + a* / 500).
-    dst_data[0:] = Xn * f_inv((src_data[0,:]+16)/116 + src_data[1,:]/500)
-    # Y = Yn * f_inv((L* + 16) / 116)
-    dst_data[1:] = Yn * f_inv((src_data[0,:]+16)/116)
-    # Z = Zn * f_inv((L* + 16) / 116 - b* / 200)
-    dst_data[2:] = Zn * f_inv((src_data[0,:]+16)/116 - src_data[2,:]/200)
-
-    return dst_data
-
-def _lab_f_inv(t):
-    f_inv = np.empty(t.shape)
+    assert src_data.shape[1] == 3, "Input data must be Nx3 matrix."
+    if out is None:
+        out = np.empty(src_data.shape, _float_dtype(src_data))
+    white = _lab_white[:,np.newaxis].astype(out.dtype)
+    lab_f_inv = _kernel(backend, "lab_f_inv")
+    for start, stop, buf, tmp in _fused_chunks(src_data.shape[0], out.dtype):
+        _lab_to_f_chunk(src_data[start:stop].T, buf)
+        lab_f_inv(buf, tmp, precision)
+        # X = Xn * f_inv(f(X / Xn)), and similarly for Y and Z.
+        np.multiply(buf, white, out=tmp)
+        out[start:stop] = tmp.T
+    return out
+
+def _lab_f_inv(t, out=None, inplace=False, precision="exact"):
+    """The inverse of `_lab_f`, with the same `out`, `inplace` and
+    `precision` options, where the `"fast"` cube is a product instead of a
+    power function."""
+    if inplace:
+        out = t
+    if out is None:
+        out = np.empty(t.shape, _float_dtype(t))
     part1 = (t > (6. / 29.))
-    f_inv[part1] = t[part1] ** 3.
-    part2 = ~part1
-    f_inv[part2] = 3. * ((6. / 29.) ** 2) * (t[part2] - 4. / 29.)
-    return f_inv
+    cube = _cube(t, precision=precision)
+    np.subtract(t, 4. / 29., out=out)
+    out *= 3. * ((6. / 29.) ** 2)
+    np.copyto(out, cube, where=part1)
+    return out
+
+# Number of colors processed at a time by the chunked kernels. It is chosen
+# such that the per-chunk temporaries stay resident in the CPU cache.
+_fused_chunk_size = 4096
+
+# The white point normalization of CIE-L*a*b*, i.e. `(Xn, Yn, Zn)`, and the
+# same folded into the sRGB matrices for the fused kernels.
+_lab_white = np.array([d65_xyz[0] / d65_xyz[1], 1., d65_xyz[2] / d65_xyz[1]])
+_srgblin_to_lab_xyz_matrix = srgb_to_xyz_matrix / _lab_white[:,np.newaxis]
+_lab_xyz_to_srgblin_matrix = xyz_to_srgb_matrix * _lab_white[np.newaxis,:]
+
+def _transform_srgb_to_lab(src_data, out=None, precision="exact",
+                           backend=None):
+    """Convert data from sRGB color space to CIE-L*a*b* color space.
+
+    This fuses `srgb_inverse_gamma`, the sRGB-to-XYZ matrix product and
+    `_transform_xyz_to_lab` into a single pass, which runs on chunks of
+    `_fused_chunk_size` colors so that all temporaries stay in cache. The
+    result agrees with going through "sRGB-linear" and "CIE-XYZ" step by step
+    up to floating point rounding, i.e. within `1e-9` in L*a*b* units.
+    """
+    assert src_data.shape[1] == 3, "Input data must be Nx3 matrix."
+    if out is None:
+        out = np.empty(src_data.shape, _float_dtype(src_data))
+    matrix = _srgblin_to_lab_xyz_matrix.astype(out.dtype)
+    inverse_gamma = _kernel(backend, "srgb_inverse_gamma")
+    lab_f = _kernel(backend, "lab_f")
+    for start, stop, buf, tmp in _fused_chunks(src_data.shape[0], out.dtype):
+        buf[...] = src_data[start:stop].T
+        inverse_gamma(buf, tmp, precision)
+        np.dot(matrix, buf, out=tmp)
+        lab_f(tmp, buf, precision)
+        _lab_from_f_chunk(tmp, buf)
+        out[start:stop] = buf.T
+    return out
+
+def _transform_lab_to_srgb(src_data, out=None, precision="exact",
+                           backend=None):
+    """Convert data from CIE-L*a*b* color space to sRGB color space.
+
+    This is the fused inverse of `_transform_srgb_to_lab`, with the same
+    chunking and the same `1e-9` agreement with the step-by-step transform.
+    """
+    assert src_data.shape[1] == 3, "Input data must be Nx3 matrix."
+    if out is None:
+        out = np.empty(src_data.shape, _float_dtype(src_data))
+    matrix = _lab_xyz_to_srgblin_matrix.astype(out.dtype)
+    lab_f_inv = _kernel(backend, "lab_f_inv")
+    gamma = _kernel(backend, "srgb_gamma")
+    for start, stop, buf, tmp in _fused_chunks(src_data.shape[0], out.dtype):
+        _lab_to_f_chunk(src_data[start:stop].T, buf)
+        lab_f_inv(buf, tmp, precision)
+        np.dot(matrix, buf, out=tmp)
+        gamma(tmp, buf, precision)
+        out[start:stop] = tmp.T
+    return out
+
+def _chunks(num_colors):
+    """The `(start, stop)` ranges of chunks of `num_colors` colors, each of at
+    most `_fused_chunk_size` colors."""
+    return tile_ranges(num_colors, _fused_chunk_size)
+
+def _fused_chunks(num_colors, dtype):
+    """Iterate over chunks of `num_colors` colors, yielding the range of each
+    chunk together with two `3xK` C-contiguous scratch buffers of type `dtype`,
+    holding one color channel per row."""
+    buf = tmp = None
+    for start, stop in _chunks(num_colors):
+        if buf is None or buf.shape[1] != stop - start:
+            buf = np.empty((3, stop - start), dtype)
+            tmp = np.empty((3, stop - start), dtype)
+        yield start, stop, buf, tmp
+
+def _lab_from_f_chunk(f, dst):
+    """Compute L*a*b* from `(f(X / Xn), f(Y / Yn), f(Z / Zn))` into `dst`, both
+    holding one channel per row, where `dst` must not overlap `f`."""
+    fx, fy, fz = f
+    # L* = 116 f(Y / Yn) - 16.
+    np.multiply(fy, 116., out=dst[0])
+    dst[0] -= 16.
+    # a* = 500 [f(X / Xn) - f(Y / Yn)].
+    np.subtract(fx, fy, out=dst[1])
+    dst[1] *= 500.
+    # b* = 200 [f(Y / Yn) - f(Z / Zn)].
+    np.subtract(fy, fz, out=dst[2])
+    dst[2] *= 200.
+
+def _lab_to_f_chunk(lab, f):
+    """The inverse of `_lab_from_f_chunk`, where `f` must not overlap `lab`."""
+    fx, fy, fz = f
+    # f(Y / Yn) = (L* + 16) / 116.
+    np.add(lab[0], 16., out=fy)
+    fy /= 116.
+    # f(X / Xn) = f(Y / Yn) + a* / 500.
+    np.divide(lab[1], 500., out=fx)
+    fx += fy
+    # f(Z / Zn) = f(Y / Yn) - b* / 200.
+    np.divide(lab[2], -200., out=fz)
+    fz += fy
+
+def _kernel(backend, name):
+    """The element-wise kernel `name` of the `backend`, or of the reference
+    backend if it is `None`."""
+    kernel = (_numpy_kernels[name] if backend is None else
+              backend.kernel(name))
+    if instrumentation._hooks:
+        return functools.partial(instrumentation.record, "kernel", name, kernel)
+    return kernel
+
+# In-place counterparts of `srgb_gamma`, `srgb_inverse_gamma`, `_lab_f` and
+# `_lab_f_inv` used by the chunked kernels, which are the element-wise kernels
+# of the reference backend. The result is written into `data`, using `tmp` (of
+# the same shape) as scratch space.
+def _srgb_inverse_gamma_chunk(data, tmp, precision="exact"):
+    part2 = data > 0.04045
+    np.add(data, 0.055, out=tmp)
+    tmp /= 1.055
+    _power(tmp, 2.4, out=tmp, precision=precision)
+    data /= 12.92
+    np.copyto(data, tmp, where=part2)
+
+def _srgb_gamma_chunk(data, tmp, precision="exact"):
+    part2 = data > 0.0031308
+    _power(data, 1/2.4, out=tmp, precision=precision)
+    tmp *= 1.055
+    tmp -= 0.055
+    data *= 12.92
+    np.copyto(data, tmp, where=part2)
+
+def _lab_f_chunk(data, tmp, precision="exact"):
+    part1 = data > ((6. / 29.) ** 3)
+    _power(data, 1. / 3., out=tmp, precision=precision)
+    data *= 1. / 3. * (29. / 6.) ** 2
+    data += 4. / 29.
+    np.copyto(data, tmp, where=part1)
+
+def _lab_f_inv_chunk(data, tmp, precision="exact"):
+    part1 = data > (6. / 29.)
+    _cube(data, out=tmp, precision=precision)
+    data -= 4. / 29.
+    data *= 3. * ((6. / 29.) ** 2)
+    np.copyto(data, tmp, where=part1)
+
+def _cube(data, out=None, precision="exact"):
+    """Compute `data ** 3` into `out`, with `np.power` if `precision` is
+    `"exact"`, or two products if it is `"fast"`."""
+    if precision != "fast":
+        return _power(data, 3., out=out, precision=precision)
+    out = np.multiply(data, data, out=out)
+    out *= data
+    return out
+
+# The reference backend.
+_numpy_kernels = {
+    "srgb_gamma": _srgb_gamma_chunk,
+    "srgb_inverse_gamma": _srgb_inverse_gamma_chunk,
+    "lab_f": _lab_f_chunk,
+    "lab_f_inv": _lab_f_inv_chunk,
+    "xyy_to_xyz": _xyy_to_xyz,
+}
+register_backend(Backend("numpy", _numpy_kernels, fallback=None))
+
+# The built-in transforms, with their costs measured by
+# `calibrate_transform_costs`.
+register_transform("CIE-XYZ", "sRGB-linear", xyz_to_srgb_matrix)
+register_transform("sRGB-linear", "CIE-XYZ", srgb_to_xyz_matrix)
+register_transform("CIE-xyY", "CIE-XYZ", _transform_xyy_to_xyz, 1.4,
+                   takes_backend=True)
+register_transform("CIE-XYZ", "CIE-xyY", _transform_xyz_to_xyy, 1.3)
+register_transform("sRGB-linear", "sRGB", _transform_srgblin_to_srgb, 3.7, True,
+                   True)
+register_transform("sRGB", "sRGB-linear", _transform_srgb_to_srgblin, 4.2, True,
+                   True)
+register_transform("CIE-XYZ", "CIE-L*a*b*", _transform_xyz_to_lab, 4.5, True,
+                   True)
+register_transform("CIE-L*a*b*", "CIE-XYZ", _transform_lab_to_xyz, 4.6, True,
+                   True)
+register_transform("sRGB", "CIE-L*a*b*", _transform_srgb_to_lab, 9.1, True,
+                   True)
+register_transform("CIE-L*a*b*", "sRGB", _transform_lab_to_srgb, 8.8, True,
+                   True)
+register_transform("CIE-XYZ", "AdobeRGB-linear", xyz_to_adobe_matrix)
+register_transform("AdobeRGB-linear", "CIE-XYZ", adobe_to_xyz_matrix)
+register_transform("sRGB-linear", "AdobeRGB-linear", srgb_to_adobe_matrix)
+register_transform("AdobeRGB-linear", "sRGB-linear", adobe_to_srgb_matrix)
+register_transform("AdobeRGB-linear", "AdobeRGB", _transform_adobelin_to_adobe,
+                   2.9, True)
+register_transform("AdobeRGB", "AdobeRGB-linear", _transform_adobe_to_adobelin,
+                   3.4, True)
@@ -6,12 +6,20 @@
 import itertools
 import numpy as np
 import os
+import shutil
+import tempfile
 import unittest
 
 from xy_python_utils.image_utils import imread
 from xy_python_utils.unittest_utils import check_near
 
-from color_space_transform import color_space_transform
+from color_space_transform import color_space_transform, get_transform
+from color_space_transform import color_space_transform_multi
+from color_space_transform import register_transform, unregister_transform
+from color_space_transform import _lab_f, _lab_f_inv
+from data import adobe_gamma, adobe_to_xyz_matrix, xyz_to_adobe_matrix
+from data import d65_xyz, srgb_gamma, srgb_inverse_gamma
+from data import srgb_to_xyz_matrix, xyz_to_srgb_matrix
 
 _this_file_path = os.path.dirname(__file__)
 _data_path = _this_file_path + "/data"
@@ -72,6 +80,351 @@ class ColorSpaceTransformTest(unittest.TestCase):
                 self.assertAlmostEqual(dst_image[i,j,c], dst_pixel[c])
             self.assertEqual(dst_image[i,j,3], src_image[i,j,3])
 
+    def test_get_transform(self):
+        # The transform plans are cached per pair of color spaces.
+        plan = get_transform("CIE-xyY", "sRGB")
+        self.assertIs(plan, get_transform("CIE-xyY", "sRGB"))
+        self.assertEqual(plan.route,
+                         ["CIE-xyY", "CIE-XYZ", "sRGB-linear", "sRGB"])
+
+        # Consecutive linear steps are folded into one.
+        plan = get_transform("sRGB-linear", "CIE-XYZ")
+        self.assertEqual(len(plan.steps), 1)
+
+        # The plans agree with going through CIE-XYZ with the reference
+        # formulas of each color space.
+        xyz = 0.05 + 0.9 * np.random.RandomState(0).rand(3, 10)
+        for src_space, dst_space in itertools.permutations(
+                ["CIE-XYZ", "CIE-xyY", "sRGB-linear", "sRGB", "CIE-L*a*b*"], 2):
+            plan = get_transform(src_space, dst_space)
+            src_data = _reference_from_xyz[src_space](xyz)
+            check_near(plan(src_data), _reference_from_xyz[dst_space](
+                _reference_to_xyz[src_space](src_data)), 1.0e-10)
+
+        # Known values: the D65 white point is the white of sRGB, and nearly
+        # the white of CIE-L*a*b*, up to the rounding of the chromaticities of
+        # sRGB, which gives b* = -0.012.
+        white_xyy = np.array([[0.3127], [0.3290], [1.0]])
+        check_near(get_transform("CIE-xyY", "sRGB")(white_xyy),
+                   np.ones((3, 1)), 1.0e-3)
+        check_near(get_transform("sRGB", "CIE-L*a*b*")(np.ones((3, 1))),
+                   np.array([[100.], [0.], [0.]]), 2.0e-2)
+
+    def test_adobe_rgb(self):
+        # Linear sRGB and Adobe RGB are converted by a single matrix.
+        plan = get_transform("sRGB-linear", "AdobeRGB-linear")
+        self.assertEqual(plan.route, ["sRGB-linear", "AdobeRGB-linear"])
+        self.assertEqual(len(plan.steps), 1)
+        self.assertEqual(len(get_transform("sRGB", "AdobeRGB").steps), 3)
+
+        # The results agree with going through CIE-XYZ. The round trips are
+        # only as exact as the published matrices are inverse of each other,
+        # which the transfer functions amplify near 0.
+        srgb = 0.05 + 0.9 * np.random.RandomState(0).rand(3, 100)
+        xyz = color_space_transform(srgb, "sRGB", "CIE-XYZ")
+        adobe = color_space_transform(srgb, "sRGB", "AdobeRGB")
+        check_near(adobe, adobe_gamma(np.dot(xyz_to_adobe_matrix, xyz)),
+                   1.0e-12)
+        round_trip = np.dot(np.dot(xyz_to_srgb_matrix, adobe_to_xyz_matrix),
+                            np.dot(xyz_to_adobe_matrix, srgb_to_xyz_matrix))
+        tol = 3 * np.max(np.abs(round_trip - np.eye(3))) + 1.0e-12
+        check_near(color_space_transform(adobe, "AdobeRGB", "sRGB-linear"),
+                   srgb_inverse_gamma(srgb), tol)
+        check_near(color_space_transform(adobe, "AdobeRGB", "CIE-XYZ"), xyz,
+                   1.0e-4)
+        check_near(color_space_transform(adobe, "AdobeRGB", "sRGB"), srgb,
+                   1.0e-4)
+        # The sRGB primaries are inside the Adobe RGB gamut, up to the rounding
+        # of the published matrices, which gives tiny negative values.
+        self.assertTrue(np.all(color_space_transform(
+            np.eye(3), "sRGB", "AdobeRGB") > -0.02))
+
+    def test_register_transform(self):
+        # A new color space linked to CIE-XYZ by a matrix is reachable from
+        # all the others.
+        self.register_test_transform("Test-XYZ2", "CIE-XYZ", np.eye(3) / 2)
+        self.register_test_transform("CIE-XYZ", "Test-XYZ2", np.eye(3) * 2)
+        plan = get_transform("Test-XYZ2", "sRGB")
+        self.assertEqual(plan.route,
+                         ["Test-XYZ2", "CIE-XYZ", "sRGB-linear", "sRGB"])
+        # The matrices are folded into one.
+        self.assertEqual(len(plan.steps), 2)
+        xyz = np.random.rand(3, 10)
+        check_near(color_space_transform(xyz * 2, "Test-XYZ2", "CIE-L*a*b*"),
+                   color_space_transform(xyz, "CIE-XYZ", "CIE-L*a*b*"),
+                   1.0e-12)
+        self.assertRaises(Exception, get_transform, "Test-XYZ2", "Test-None")
+
+        # A cheaper direct transform replaces the longer route, and the cached
+        # plans are updated.
+        self.register_test_transform("Test-XYZ4", "CIE-XYZ", np.eye(3) / 4)
+        self.register_test_transform("CIE-XYZ", "Test-XYZ4", np.eye(3) * 4)
+        self.assertEqual(get_transform("Test-XYZ2", "Test-XYZ4").route,
+                         ["Test-XYZ2", "CIE-XYZ", "Test-XYZ4"])
+        def xyz2_to_xyz4(src_data, out=None):
+            return np.multiply(src_data, 2, out=out)
+        self.register_test_transform("Test-XYZ2", "Test-XYZ4", xyz2_to_xyz4,
+                                     cost=0.5)
+        plan = get_transform("Test-XYZ2", "Test-XYZ4")
+        self.assertEqual(plan.route, ["Test-XYZ2", "Test-XYZ4"])
+        self.assertEqual(plan.cost, 0.5)
+        check_near(plan(xyz * 2), xyz * 4, 1.0e-12)
+        # The cost of a function is measured if not given.
+        register_transform("Test-XYZ2", "Test-XYZ4", xyz2_to_xyz4)
+        self.assertGreater(
+            get_transform("Test-XYZ2", "Test-XYZ4").cost, 0.0)
+
+        # Unregistering a transform goes back to the longer route.
+        register_transform("Test-XYZ4", "Test-XYZ2", np.eye(3) / 2, cost=0.5)
+        self.assertEqual(get_transform("Test-XYZ4", "Test-XYZ2").route,
+                         ["Test-XYZ4", "Test-XYZ2"])
+        unregister_transform("Test-XYZ4", "Test-XYZ2")
+        self.assertEqual(get_transform("Test-XYZ4", "Test-XYZ2").route,
+                         ["Test-XYZ4", "CIE-XYZ", "Test-XYZ2"])
+        self.assertRaises(Exception, unregister_transform, "Test-XYZ4",
+                          "Test-XYZ2")
+
+    def test_color_space_transform_multi(self):
+        spaces = ["CIE-XYZ", "CIE-xyY", "sRGB-linear", "sRGB", "CIE-L*a*b*"]
+        src_image = np.random.rand(10, 20, 4)
+        for src_space in spaces:
+            results = color_space_transform_multi(src_image, src_space, spaces)
+            self.assertEqual(sorted(results.keys()), sorted(spaces))
+            for dst_space in spaces:
+                if dst_space != src_space:
+                    check_near(results[dst_space], color_space_transform(
+                        src_image, src_space, dst_space), 1.0e-9)
+            self.assertIsNot(results[src_space], src_image)
+            check_near(results[src_space], src_image, 1.0e-12)
+
+        # Integer sRGB codes, float32 and channels-first data.
+        codes = np.random.randint(0, 256, (3, 10, 20)).astype(np.uint8)
+        results = color_space_transform_multi(
+            codes, "sRGB", ["sRGB", "CIE-XYZ"], dtype=np.float32,
+            channel_axis=0)
+        self.assertEqual(results["CIE-XYZ"].dtype, np.float32)
+        check_near(results["sRGB"], codes / 255.0, 1.0e-6)
+        check_near(results["CIE-XYZ"], color_space_transform(
+            codes / 255.0, "sRGB", "CIE-XYZ", channel_axis=0), 1.0e-6)
+
+    def test_fused_srgb_lab(self):
+        # Compare the fused sRGB <-> CIE-L*a*b* kernels with going through
+        # each intermediate color space, on more colors than a single chunk.
+        srgb = np.random.rand(3, 10000) * 1.2 - 0.1
+        srgb[:,:3] = [[0.0, 0.04045, 1.0]]
+        srgblin = color_space_transform(srgb, "sRGB", "sRGB-linear")
+        xyz = color_space_transform(srgblin, "sRGB-linear", "CIE-XYZ")
+        lab = color_space_transform(xyz, "CIE-XYZ", "CIE-L*a*b*")
+        self.assertTrue(np.max(np.abs(
+            color_space_transform(srgb, "sRGB", "CIE-L*a*b*") - lab)) < 1.0e-9)
+
+        xyz = color_space_transform(lab, "CIE-L*a*b*", "CIE-XYZ")
+        srgblin = color_space_transform(xyz, "CIE-XYZ", "sRGB-linear")
+        srgb2 = color_space_transform(srgblin, "sRGB-linear", "sRGB")
+        self.assertTrue(np.max(np.abs(
+            color_space_transform(lab, "CIE-L*a*b*", "sRGB") - srgb2)) < 1.0e-9)
+
+    def test_precision(self):
+        # The fast transforms have their own cached plans.
+        plan = get_transform("sRGB", "CIE-L*a*b*", "fast")
+        self.assertIs(plan, get_transform("sRGB", "CIE-L*a*b*", "fast"))
+        self.assertIsNot(plan, get_transform("sRGB", "CIE-L*a*b*"))
+        self.assertRaises(Exception, get_transform, "sRGB", "CIE-XYZ", "foo")
+
+        # The fast results are within the stated bounds of the exact ones,
+        # over the whole sRGB gamut.
+        srgb = np.random.rand(3, 100000)
+        srgb[:,:2] = [[0.0, 1.0]]
+        spaces = ["CIE-XYZ", "sRGB-linear", "sRGB", "CIE-L*a*b*"]
+        for dtype in (np.float64, np.float32):
+            src_data = {space: color_space_transform(
+                srgb.astype(dtype), "sRGB", space) for space in spaces}
+            for src_space, dst_space in itertools.permutations(spaces, 2):
+                exact = color_space_transform(src_data[src_space], src_space,
+                                              dst_space)
+                fast = color_space_transform(src_data[src_space], src_space,
+                                             dst_space, precision="fast")
+                self.assertEqual(fast.dtype, dtype)
+                tol = 2e-3 if dst_space == "CIE-L*a*b*" else 1e-5
+                self.assertLess(np.max(np.abs(fast - exact)), tol)
+
+        t = np.linspace(-0.1, 1.2, 1000)
+        self.assertLess(np.max(np.abs(
+            _lab_f(t, precision="fast") - _lab_f(t))), 3e-6)
+        self.assertLess(np.max(np.abs(
+            _lab_f_inv(t, precision="fast") - _lab_f_inv(t))), 1e-12)
+
+    def test_out_and_inplace(self):
+        spaces = ["CIE-XYZ", "CIE-xyY", "sRGB-linear", "sRGB", "CIE-L*a*b*"]
+        src_data = np.random.rand(3, 10)
+        src_image = np.random.rand(4, 5, 4)
+        for src_space, dst_space in itertools.permutations(spaces, 2):
+            for src in (src_data, src_image):
+                dst = color_space_transform(src, src_space, dst_space)
+                # Write into a preallocated buffer.
+                out = np.empty(src.shape)
+                self.assertIs(color_space_transform(
+                    src, src_space, dst_space, out=out), out)
+                check_near(out, dst, 1.0e-12)
+                # Transform in place.
+                inplace_src = src.copy()
+                color_space_transform(inplace_src, src_space, dst_space,
+                                      inplace=True)
+                check_near(inplace_src, dst, 1.0e-12)
+
+        # The nonlinear functions of CIE-L*a*b*.
+        t = np.linspace(-0.1, 1.0, 100)
+        f = _lab_f(t)
+        self.assertTrue(np.max(np.abs(_lab_f_inv(f) - t)) < 1.0e-12)
+        _lab_f_inv(f, inplace=True)
+        _lab_f(f, out=f)
+        self.assertTrue(np.max(np.abs(_lab_f(t) - f)) < 1.0e-12)
+
+    def test_float32(self):
+        # The float32 results should stay float32 and be close to the float64
+        # ones, within the error bounds documented in `color_space_transform`.
+        spaces = ["CIE-XYZ", "CIE-xyY", "sRGB-linear", "sRGB", "CIE-L*a*b*"]
+        srgb = np.random.rand(3, 10000)
+        for src_space, dst_space in itertools.permutations(spaces, 2):
+            src_data = color_space_transform(srgb, "sRGB", src_space)
+            dst_data = color_space_transform(src_data, src_space, dst_space)
+            dst_data32 = color_space_transform(
+                src_data.astype(np.float32), src_space, dst_space)
+            self.assertEqual(dst_data32.dtype, np.float32)
+            tol = 2.0e-4 if dst_space == "CIE-L*a*b*" else 1.0e-5
+            self.assertTrue(np.max(np.abs(dst_data32 - dst_data)) < tol)
+
+        # The computation type can also be requested explicitly.
+        dst_data32 = color_space_transform(srgb, "sRGB", "CIE-XYZ",
+                                           dtype=np.float32)
+        self.assertEqual(dst_data32.dtype, np.float32)
+        dst_image = color_space_transform(np.ones((2, 3, 4), np.float32),
+                                          "sRGB", "CIE-L*a*b*")
+        self.assertEqual(dst_image.dtype, np.float32)
+
+    def test_channel_axis(self):
+        src_data = np.random.rand(3, 24)
+        dst_data = color_space_transform(src_data, "sRGB", "CIE-xyY")
+        # Channels-last data of any leading shape.
+        src_image = src_data.T.reshape(2, 3, 4, 3)
+        dst_image = color_space_transform(src_image, "sRGB", "CIE-xyY",
+                                          channel_axis=-1)
+        check_near(dst_image, dst_data.T.reshape(2, 3, 4, 3), 1.0e-12)
+        # Channels-first data.
+        src_image = src_data.reshape(3, 4, 6)
+        dst_image = color_space_transform(src_image, "sRGB", "CIE-xyY",
+                                          channel_axis=0)
+        check_near(dst_image, dst_data.reshape(3, 4, 6), 1.0e-12)
+        # The alpha channel is passed through, and left untouched in place.
+        src_image = np.random.rand(4, 6, 4)
+        src_image[:,:,:3] = src_data.T.reshape(4, 6, 3)
+        dst_image = src_image.copy()
+        color_space_transform(dst_image, "sRGB", "CIE-xyY", inplace=True)
+        check_near(dst_image[:,:,:3], dst_data.T.reshape(4, 6, 3), 1.0e-12)
+        self.assertTrue(np.all(dst_image[:,:,3] == src_image[:,:,3]))
+        self.assertRaises(ValueError, color_space_transform,
+                          np.zeros((4, 6, 5)), "sRGB", "CIE-xyY")
+
+    def test_tile_size(self):
+        src_image = np.random.rand(50, 40, 4)
+        dst_image = color_space_transform(src_image, "sRGB", "CIE-L*a*b*")
+        check_near(color_space_transform(src_image, "sRGB", "CIE-L*a*b*",
+                                         tile_size=300), dst_image, 1.0e-12)
+        src_data = np.random.rand(3, 1000)
+        dst_data = color_space_transform(src_data, "CIE-XYZ", "sRGB")
+        check_near(color_space_transform(src_data, "CIE-XYZ", "sRGB",
+                                         tile_size=64), dst_data, 1.0e-12)
+
+        # Stream from one memory-mapped file into another.
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            src_memmap = np.lib.format.open_memmap(
+                os.path.join(tmp_dir, "src.npy"), "w+", np.float64, (50,40,4))
+            src_memmap[...] = src_image
+            dst_memmap = np.lib.format.open_memmap(
+                os.path.join(tmp_dir, "dst.npy"), "w+", np.float32, (50,40,4))
+            color_space_transform(src_memmap, "sRGB", "CIE-L*a*b*",
+                                  out=dst_memmap, tile_size=300)
+            check_near(dst_memmap, dst_image, 1.0e-3)
+            del src_memmap, dst_memmap
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_workers(self):
+        # The multi-threaded results are bit-identical to single-threaded ones.
+        spaces = ["CIE-XYZ", "CIE-xyY", "sRGB-linear", "sRGB", "CIE-L*a*b*"]
+        src_data = np.random.rand(3, 50000)
+        src_image = np.random.rand(200, 150, 4)
+        for src_space, dst_space in itertools.permutations(spaces, 2):
+            for src in (src_data, src_image):
+                dst = color_space_transform(src, src_space, dst_space)
+                dst4 = color_space_transform(src, src_space, dst_space,
+                                             workers=4)
+                self.assertTrue(np.array_equal(dst, dst4))
+
+    def test_srgb_codes(self):
+        data = np.random.randint(0, 256, (20, 30, 4)).astype(np.uint8)
+        expected = data / 255.0
+        for dst_space in ("sRGB-linear", "CIE-XYZ", "CIE-L*a*b*"):
+            expected[...,:3] = color_space_transform(
+                data[...,:3] / 255.0, "sRGB", dst_space)
+            check_near(color_space_transform(data, "sRGB", dst_space),
+                       expected, 1.0e-9)
+            check_near(color_space_transform(data.transpose(), "sRGB",
+                                             dst_space, channel_axis=0),
+                       expected.transpose(), 1.0e-9)
+        self.assertEqual(color_space_transform(
+            data, "sRGB", "CIE-XYZ", dtype=np.float32).dtype, np.float32)
+
+    def test_integer_output(self):
+        lab = np.random.rand(60, 70, 4) * [100, 200, 200, 1] - [0, 100, 100, 0]
+        srgb = color_space_transform(lab, "CIE-L*a*b*", "sRGB")
+        for dtype in (np.uint8, np.uint16):
+            code_max = np.iinfo(dtype).max
+            expected = np.floor(np.clip(srgb, 0, 1) * code_max + 0.5)
+            dst = color_space_transform(lab, "CIE-L*a*b*", "sRGB", dtype=dtype)
+            self.assertEqual(dst.dtype, dtype)
+            self.assertTrue(np.array_equal(dst, expected))
+            # With preallocated output, channels first, tiles and threads.
+            out = np.empty(lab.shape, dtype)
+            color_space_transform(lab, "CIE-L*a*b*", "sRGB", out=out,
+                                  tile_size=32, workers=3)
+            self.assertTrue(np.array_equal(out, expected))
+            dst = color_space_transform(lab.transpose(), "CIE-L*a*b*", "sRGB",
+                                        dtype=dtype, channel_axis=0)
+            self.assertTrue(np.array_equal(dst, expected.transpose()))
+            # The dithered codes are within one code of the rounded ones, and
+            # average to the original values over flat areas.
+            dst = color_space_transform(lab, "CIE-L*a*b*", "sRGB", dtype=dtype,
+                                        dither=True)
+            self.assertTrue(np.all(np.abs(dst - expected) <= 1))
+            flat = np.full((64, 64, 3), 0.3)
+            dst = color_space_transform(flat, "sRGB", "sRGB", dtype=dtype,
+                                        dither=True)
+            self.assertTrue(abs(np.mean(dst) - 0.3 * code_max) < 1e-2)
+            # Gamut compression keeps the luma of the colors, and the grays.
+            dst = color_space_transform(lab, "CIE-L*a*b*", "sRGB", dtype=dtype,
+                                        gamut="compress")
+            weights = [0.2126, 0.7152, 0.0722]
+            luma = np.clip(np.dot(srgb[...,:3], weights), 0, 1)
+            self.assertTrue(np.all(np.abs(
+                np.dot(dst[...,:3], weights) / code_max - luma) < 1e-2))
+            gray = np.tile(np.linspace(0, 1, 11), (3, 1))
+            dst = color_space_transform(gray, "sRGB", "sRGB", dtype=dtype,
+                                        gamut="compress")
+            self.assertTrue(np.array_equal(
+                dst, np.floor(gray * code_max + 0.5)))
+        # Integer sRGB input, with the alpha channel rescaled.
+        data = np.random.randint(0, 256, (20, 30, 4)).astype(np.uint8)
+        expected = np.clip(color_space_transform(data, "sRGB", "AdobeRGB"),
+                           0, 1)
+        dst = color_space_transform(data, "sRGB", "AdobeRGB", dtype=np.uint16)
+        self.assertTrue(np.array_equal(
+            dst, np.floor(expected * 65535 + 0.5)))
+        with self.assertRaises(Exception):
+            color_space_transform(lab, "CIE-L*a*b*", "sRGB", dtype=np.uint8,
+                                  gamut="unknown")
+
     def test_lenna(self):
         srgb = imread(_data_path + "/lenna/sRGB.png")
         srgblin = imread(_data_path + "/lenna/sRGB-linear.png")
@@ -89,5 +442,49 @@ class ColorSpaceTransformTest(unittest.TestCase):
         check_near(cst(src_data, src_space, dst_space), dst_data, tol)
         check_near(cst(dst_data, dst_space, src_space), src_data, tol)
 
+    def register_test_transform(self, src_space, dst_space, *args, **kwargs):
+        """Register a transform for the current test only."""
+        register_transform(src_space, dst_space, *args, **kwargs)
+        self.addCleanup(unregister_transform, src_space, dst_space)
+
+def _reference_xyz_to_xyy(xyz):
+    return np.vstack((xyz[:2] / np.sum(xyz, axis=0), xyz[1:2]))
+
+def _reference_xyy_to_xyz(xyy):
+    x, y, Y = xyy
+    return np.vstack((x * Y / y, Y, (1 - x - y) * Y / y))
+
+def _reference_xyz_to_lab(xyz):
+    """See: https://en.wikipedia.org/wiki/CIELAB_color_space"""
+    t = xyz / (d65_xyz / d65_xyz[1])[:,np.newaxis]
+    f = np.where(t > (6. / 29.) ** 3, np.cbrt(t),
+                 t / (3 * (6. / 29.) ** 2) + 4. / 29.)
+    return np.vstack((116 * f[1] - 16, 500 * (f[0] - f[1]),
+                      200 * (f[1] - f[2])))
+
+def _reference_lab_to_xyz(lab):
+    L, a, b = lab
+    fy = (L + 16) / 116
+    f = np.vstack((fy + a / 500, fy, fy - b / 200))
+    t = np.where(f > 6. / 29., f ** 3, 3 * (6. / 29.) ** 2 * (f - 4. / 29.))
+    return t * (d65_xyz / d65_xyz[1])[:,np.newaxis]
+
+# The reference transforms of each color space from and to CIE-XYZ, following
+# the definitions in `data`, for checking the transform plans.
+_reference_from_xyz = {
+    "CIE-XYZ": lambda xyz: xyz,
+    "CIE-xyY": _reference_xyz_to_xyy,
+    "sRGB-linear": lambda xyz: np.dot(xyz_to_srgb_matrix, xyz),
+    "sRGB": lambda xyz: srgb_gamma(np.dot(xyz_to_srgb_matrix, xyz)),
+    "CIE-L*a*b*": _reference_xyz_to_lab,
+}
+_reference_to_xyz = {
+    "CIE-XYZ": lambda xyz: xyz,
+    "CIE-xyY": _reference_xyy_to_xyz,
+    "sRGB-linear": lambda srgblin: np.dot(srgb_to_xyz_matrix, srgblin),
+    "sRGB": lambda srgb: np.dot(srgb_to_xyz_matrix, srgb_inverse_gamma(srgb)),
+    "CIE-L*a*b*": _reference_lab_to_xyz,
+}
+
 if __name__ == "__main__":
     unittest.main()
@@ -3,12 +3,25 @@
 # Author: Ying Xiong.
 # Created: Oct 28, 2014.
 
+import collections
+import contextlib
+import hashlib
 import os
 import numpy as np
+import scipy.sparse
+import tempfile
+import threading
 
 _this_file_path = os.path.dirname(__file__)
 _data_path = _this_file_path + "/data"
 
+# Directory for data computed and cached on disk by this package, such as
+# lookup tables. It can be set with the `XY_COLOR_CACHE_DIR` environment
+# variable, or changed at runtime.
+cache_path = os.environ.get(
+    "XY_COLOR_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "xy_color"))
+
 # Chromaticity coordinates (normalized xyz) for primaries of sRGB color space.
 # Accessed from: http://www.color.org/chardata/rgb/srgb.pdf.
 # Accessed on: Nov 30, 2014.
@@ -27,7 +40,105 @@ xyz_to_srgb_matrix = np.array([
 ])
 srgb_to_xyz_matrix = np.linalg.inv(xyz_to_srgb_matrix)
 
-def srgb_gamma(linear_data):
+def _float_dtype(data, dtype=None):
+    """The floating point type to compute on `data` with: `dtype` if given,
+    `float32` for `float32` data to preserve it end-to-end, or `float64`
+    otherwise."""
+    if dtype is not None:
+        return np.dtype(dtype)
+    data_dtype = getattr(data, "dtype", None)
+    if data_dtype is None:
+        data_dtype = np.asarray(data).dtype
+    if data_dtype == np.float32:
+        return np.dtype(np.float32)
+    return np.dtype(np.float64)
+
+def _code_max(dtype):
+    """The maximum code of an 8-bit or 16-bit unsigned integer `dtype`, or
+    `None` for any other type. Data of these types is taken as integer codes
+    evenly spanning `[0, 1]` by the sRGB transfer functions."""
+    if dtype is not None and np.dtype(dtype) in (np.uint8, np.uint16):
+        return np.iinfo(dtype).max
+    return None
+
+def _power(data, exponent, out=None, precision="exact"):
+    """Compute `data ** exponent` into `out` (which can be `data` itself), with
+    `np.power` if `precision` is `"exact"`, or `_fast_power` if it is
+    `"fast"`."""
+    if precision == "fast":
+        return _fast_power(data, exponent, out)
+    if precision != "exact":
+        raise Exception("Unknown precision '%s'." % precision)
+    with np.errstate(invalid="ignore"):
+        return np.power(data, exponent, out=out)
+
+def _fast_power(data, exponent, out=None):
+    """Approximate `data ** exponent` for positive, finite floating point
+    `data`, with a relative error below `_fast_power_error`.
+
+    Writing `data = m * 2^e` with `m` in `[1, 2)`, which is read directly from
+    the bits of the floating point numbers, the result is `m ** exponent`
+    evaluated by a polynomial, times `2 ** (e * exponent)` looked up from a
+    table of all the possible exponents `e`. Zero and negative values give
+    (nearly) zero, and non-finite values give arbitrary results."""
+    data = np.asarray(data)
+    if out is None:
+        out = np.empty(data.shape, data.dtype)
+    result = out
+    # Work on 1-d views of scalars, which keep the integer types unchanged.
+    data, out = np.atleast_1d(data, out)
+    coefs, scales = _fast_power_tables(exponent, data.dtype)
+    int_type, mantissa_bits = _float_layout[data.dtype]
+    bits = data.view(int_type)
+    exps = np.right_shift(bits, mantissa_bits)
+    mantissa = np.bitwise_and(bits, (1 << mantissa_bits) - 1)
+    mantissa |= scales.size // 2 - 1 << mantissa_bits
+    mantissa = mantissa.view(data.dtype)
+    # Evaluate the polynomial by Horner's rule.
+    np.multiply(mantissa, coefs[0], out=out)
+    for c in coefs[1:-1]:
+        out += c
+        out *= mantissa
+    out += coefs[-1]
+    out *= np.take(scales, exps, mode="clip")
+    return result
+
+def _fast_power_tables(exponent, dtype):
+    """The polynomial coefficients (highest degree first) of `m ** exponent`
+    for `m` in `[1, 2)`, and the table of `2 ** (e * exponent)` indexed by the
+    biased exponent bits `e` of `dtype`, both cached per `(exponent, dtype)`."""
+    key = (exponent, np.dtype(dtype))
+    if key not in _fast_power_cache:
+        # Interpolate at the Chebyshev points of `[1, 2]`.
+        coefs = np.polynomial.chebyshev.chebinterpolate(
+            lambda t: ((t + 3.) / 2.) ** exponent, _fast_power_degree)
+        coefs = np.polynomial.Polynomial(
+            np.polynomial.chebyshev.cheb2poly(coefs))(
+            np.polynomial.Polynomial([-3., 2.])).coef
+        num_exps = 2 ** (8 * np.dtype(dtype).itemsize -
+                         _float_layout[np.dtype(dtype)][1] - 1)
+        with np.errstate(over="ignore"):
+            scales = np.exp2((np.arange(num_exps) - (num_exps // 2 - 1)) *
+                             float(exponent))
+            _fast_power_cache[key] = (coefs[::-1].astype(dtype),
+                                      scales.astype(dtype))
+    return _fast_power_cache[key]
+
+# The signed integer type of the same size, and the number of mantissa bits, of
+# the floating point types supported by `_fast_power`.
+_float_layout = {np.dtype(np.float32): (np.int32, 23),
+                 np.dtype(np.float64): (np.int64, 52)}
+
+# Degree of the polynomials of `_fast_power`, and the resulting bound on its
+# relative error for the exponents used in this package (`2.4`, `1 / 2.4`,
+# `1 / 3` and `1 / 2.19921875`), including the rounding errors in `float32`.
+_fast_power_degree = 5
+_fast_power_error = 2.5e-6
+
+_fast_power_cache = {}
+
+def srgb_gamma(linear_data, out=None, inplace=False, dtype=None,
+               precision="exact"):
     """The per-channel, nonlinear transfer function used in sRGB.
 
     The conversion formula is::
@@ -35,16 +146,45 @@ def srgb_gamma(linear_data):
       C = 12.92 * C_linear,                     if C_linear <= 0.0031308
           1.055 * C_linear ** (1/2.4) - 0.055,  otherwise
 
+    The result is written into `out` if provided, or into `linear_data` itself
+    if `inplace` is `True`. Otherwise it is a new array of type `dtype`, which
+    defaults to `float32` for `float32` input and `float64` for anything else.
+
+    If `dtype` (or the type of `out`) is `uint8` or `uint16`, the result is
+    quantized into integer codes, i.e. `round(clip(C, 0, 1) * 255)` for
+    `uint8`. This is done with cached tables of the linear values at which the
+    code changes, without evaluating the power function.
+
+    If `precision` is `"fast"`, the power function is replaced by a polynomial
+    approximation (see `_fast_power`), which is within `3e-6` of the exact
+    result for `C_linear` in `[0, 1]`, i.e. far below the `0.5 / 255` of
+    rounding to 8-bit codes.
+
     | Accessed from: http://www.color.org/chardata/rgb/srgb.pdf.
     | Accessed on: Oct 28, 2014."""
-    nonlinear_data = np.empty(linear_data.shape)
-    part1 = (linear_data<=0.0031308)
-    nonlinear_data[part1] = linear_data[part1] * 12.92
-    part2 = ~part1
-    nonlinear_data[part2] = 1.055 * linear_data[part2] ** (1/2.4) - 0.055
-    return nonlinear_data
-
-def srgb_inverse_gamma(nonlinear_data):
+    if inplace:
+        out = linear_data
+    code_dtype = out.dtype if out is not None else dtype
+    if _code_max(code_dtype) is not None:
+        codes = _srgb_encode_codes(np.ravel(linear_data), code_dtype).reshape(
+            np.shape(linear_data))
+        if out is None:
+            return codes
+        out[...] = codes
+        return out
+    if out is None:
+        out = np.empty(linear_data.shape, _float_dtype(linear_data, dtype))
+    linear_data = np.asarray(linear_data, out.dtype)
+    part2 = (linear_data>0.0031308)
+    power_part = _power(linear_data, 1/2.4, precision=precision)
+    power_part *= 1.055
+    power_part -= 0.055
+    np.multiply(linear_data, 12.92, out=out)
+    np.copyto(out, power_part, where=part2)
+    return out
+
+def srgb_inverse_gamma(nonlinear_data, out=None, inplace=False, dtype=None,
+                       precision="exact"):
     """The per-channel transform from nonlinear sRGB data to linear sRGB data.
 
     The conversion formula is::
@@ -52,15 +192,79 @@ def srgb_inverse_gamma(nonlinear_data):
       C_linear = C / 12.92,                     if C <= 0.04045
                  ((C + 0.055) / 1.055) ^ 2.4,   otherwise
 
+    The result is written into `out` if provided, or into `nonlinear_data`
+    itself if `inplace` is `True`. Otherwise it is a new array of type `dtype`,
+    which defaults to `float32` for `float32` input and `float64` for anything
+    else.
+
+    Data of type `uint8` or `uint16` is taken as integer codes, e.g. `C = code /
+    255` for `uint8`, and is converted by looking up a cached table of all the
+    possible codes.
+
+    If `precision` is `"fast"`, the power function is replaced by a polynomial
+    approximation (see `_fast_power`), which is within `1e-6` of the exact
+    result for `C` in `[0, 1]`.
+
     | Accessed from: http://www.color.org/chardata/rgb/srgb.pdf.
     | Accessed on: Apr 24, 2015.
     """
-    linear_data = np.empty(nonlinear_data.shape)
-    part1 = (nonlinear_data<=0.04045)
-    linear_data[part1] = nonlinear_data[part1] / 12.92
-    part2 = ~part1
-    linear_data[part2] = ((nonlinear_data[part2] + 0.055) / 1.055) ** 2.4
-    return linear_data
+    if inplace:
+        out = nonlinear_data
+    if out is None:
+        out = np.empty(nonlinear_data.shape,
+                       _float_dtype(nonlinear_data, dtype))
+    if _code_max(nonlinear_data.dtype) is not None:
+        table = _srgb_decode_table(nonlinear_data.dtype, out.dtype)
+        np.take(table, nonlinear_data, out=out, mode="clip")
+        return out
+    nonlinear_data = np.asarray(nonlinear_data, out.dtype)
+    part2 = (nonlinear_data>0.04045)
+    power_part = nonlinear_data + 0.055
+    power_part /= 1.055
+    _power(power_part, 2.4, out=power_part, precision=precision)
+    np.divide(nonlinear_data, 12.92, out=out)
+    np.copyto(out, power_part, where=part2)
+    return out
+
+def _srgb_decode_table(code_dtype, dtype):
+    """The linear values of all the codes of `code_dtype`, in type `dtype`."""
+    key = (np.dtype(code_dtype), np.dtype(dtype))
+    if key not in _srgb_tables:
+        code_max = _code_max(code_dtype)
+        codes = np.arange(code_max + 1) / float(code_max)
+        _srgb_tables[key] = srgb_inverse_gamma(codes).astype(dtype)
+    return _srgb_tables[key]
+
+def _srgb_encode_codes(linear_data, code_dtype):
+    """Quantize `linear_data` into the `code_dtype` codes of `srgb_gamma`.
+
+    The range `[0, 1]` is split into `N` equal cells, with `N` large enough
+    that each cell contains at most one of the linear values at which the code
+    changes. So the code of a value is the code at the start of its cell, plus
+    one if the value is above the threshold following that code."""
+    cell_codes, thresholds = _srgb_encode_tables(code_dtype)
+    N = cell_codes.size
+    cells = np.multiply(linear_data, N)
+    np.clip(cells, 0, N - 1, out=cells)
+    codes = np.take(cell_codes, cells.astype(np.intp), mode="clip")
+    codes += (np.take(thresholds, codes) <= linear_data)
+    return codes
+
+def _srgb_encode_tables(code_dtype):
+    """The code at the start of each cell of `_srgb_encode_codes`, and the
+    increasing linear values at which the codes change, followed by `inf`."""
+    key = np.dtype(code_dtype)
+    if key not in _srgb_tables:
+        code_max = _code_max(code_dtype)
+        thresholds = srgb_inverse_gamma((np.arange(code_max) + 0.5) / code_max)
+        N = 2 ** int(np.ceil(np.log2(1.0 / np.min(np.diff(thresholds)))))
+        cell_codes = np.searchsorted(thresholds, np.arange(N) / float(N),
+                                     side="right").astype(code_dtype)
+        _srgb_tables[key] = (cell_codes, np.append(thresholds, np.inf))
+    return _srgb_tables[key]
+
+# The lazily built tables of `_srgb_decode_table` and `_srgb_encode_tables`.
+_srgb_tables = {}
 
 # Chromaticity coordinates (xy) for primaries of Adobe RGB (1998) color space.
 # Accessed from: http://www.adobe.com/digitalimag/pdfs/AdobeRGB1998.pdf.
@@ -152,32 +356,90 @@ def adobe_abs_to_norm_xyz(abs_xyz):
     elif len(abs_xyz.shape) == 2:
         return np.concatenate([xn,yn,zn])
 
-def adobe_gamma(linear_data):
+def adobe_gamma(linear_data, out=None, inplace=False, dtype=None,
+                precision="exact"):
     """The per-channel, nonlinear transfer function used in Adobe RGB (1998)
     color space.
 
     .. math::
         C= ( C_{linear} ) ^ {1 / 2.19921875}
 
-    The value `2.19921875` is obtained from `(2 + 51/256)`.
+    The value `2.19921875` is obtained from `(2 + 51/256)`. The result is
+    written into `out` if provided, or into `linear_data` itself if `inplace`
+    is `True`. Otherwise it is a new array of type `dtype`, which defaults to
+    `float32` for `float32` input and `float64` for anything else. Negative
+    values, e.g. of colors slightly outside the gamut, are mapped to the
+    negative of the result of their absolute values.
+
+    If `precision` is `"fast"`, the power function is replaced by a polynomial
+    approximation (see `_fast_power`), which is within `3e-6` of the exact
+    result for `C_linear` in `[0, 1]`.
 
     Accessed from: http://www.adobe.com/digitalimag/pdfs/AdobeRGB1998.pdf.
     Accessed on: Nov 30, 2014.
     """
-    return np.power(linear_data, 1. / 2.19921875)
+    if inplace:
+        out = linear_data
+    if out is None:
+        out = np.empty(np.shape(linear_data), _float_dtype(linear_data, dtype))
+    return _signed_power(linear_data, 1. / 2.19921875, out, precision)
+
+def adobe_inverse_gamma(nonlinear_data, out=None, inplace=False, dtype=None,
+                        precision="exact"):
+    """The per-channel transform from nonlinear Adobe RGB (1998) data to linear
+    Adobe RGB (1998) data, i.e. the inverse of `adobe_gamma`.
+
+    .. math::
+        C_{linear} = C ^ {2.19921875}
+
+    Negative values and the `out`, `inplace`, `dtype` and `precision` options
+    are handled the same as in `adobe_gamma`, where the `"fast"` result is
+    within `1e-6` of the exact one for `C` in `[0, 1]`.
+
+    Accessed from: http://www.adobe.com/digitalimag/pdfs/AdobeRGB1998.pdf.
+    """
+    if inplace:
+        out = nonlinear_data
+    if out is None:
+        out = np.empty(np.shape(nonlinear_data),
+                       _float_dtype(nonlinear_data, dtype))
+    return _signed_power(nonlinear_data, 2.19921875, out, precision)
+
+def _signed_power(data, exponent, out, precision):
+    """Compute `sign(data) * abs(data) ** exponent` into `out` (which can be
+    `data` itself)."""
+    data = np.asarray(data, out.dtype)
+    negative = np.signbit(data)
+    np.abs(data, out=out)
+    _power(out, exponent, out=out, precision=precision)
+    np.negative(out, out=out, where=negative)
+    return out
+
+# The color transform matrices between linear sRGB and linear Adobe RGB (1998),
+# which share the D65 white point, so that the conversion is a single matrix
+# product instead of two through CIE-XYZ.
+srgb_to_adobe_matrix = np.dot(xyz_to_adobe_matrix, srgb_to_xyz_matrix)
+adobe_to_srgb_matrix = np.dot(xyz_to_srgb_matrix, adobe_to_xyz_matrix)
 
 # CIE-D65's XYZ tristimulus values, normalized by relative luminance.
 # Accessed from: http://en.wikipedia.org/wiki/Illuminant_D65
 # Accessed on: Nov 30, 2014.
 d65_xyz = np.array([95.047, 100.00, 108.883])
 
-def read_cvrl_csv(csv_filename, empty_val = 0.0):
+def read_cvrl_csv(csv_filename, empty_val = 0.0, cache=False):
     """Read a csv file downloaded from cvrl.org.
 
     Some of the entries in the csv are empty, and will be filled with
     'empty_val'. If reading linear data, 'empty_val' should be set as 0.0, and
     if reading log data, it should be set as -np.inf.
 
+    If `cache` is `True` (as done by `load_fw`), the parsed table is stored as
+    a `.npy` file in the `cvrl` sub-directory of `cache_path` the first time it
+    is read (see also `build_cvrl_cache`), and memory-mapped by later reads,
+    which then return a read-only array. The stored table is rebuilt whenever
+    the size or the modification time of the csv file changes. Otherwise, the
+    csv file is parsed into a new writable array.
+
     Returns
     -------
     A `ndarray` of size `Nx2` or `Nx4`.
@@ -185,53 +447,291 @@ def read_cvrl_csv(csv_filename, empty_val = 0.0):
         corresponding functions with respect to wavelength.
 
     """
+    if not cache:
+        return _parse_cvrl_csv(csv_filename, empty_val)
+    filename = _cvrl_cache_filename(csv_filename, empty_val)
+    if not os.path.exists(filename):
+        table = _parse_cvrl_csv(csv_filename, empty_val)
+        try:
+            _save_npy(filename, table)
+        except (IOError, OSError):
+            # Without a writable cache, just use the parsed table.
+            table.flags.writeable = False
+            return table
+    return np.load(filename, mmap_mode="r")
+
+def build_cvrl_cache():
+    """Store all the datasets of `load_fw` (i.e. all the csv files bundled in
+    `data/cvrl`) into the cache of `read_cvrl_csv`, e.g. right after installing
+    the package, so that even the first reads are memory-mapped."""
+    for name in _datasets:
+        _read_dataset(name)
+
+def _cvrl_cache_filename(csv_filename, empty_val):
+    """The cache file of a csv file read with the given `empty_val`, named by a
+    hash of the path, size and modification time of the csv file."""
+    stat = os.stat(csv_filename)
+    digest = hashlib.md5(repr((
+        os.path.abspath(csv_filename), stat.st_size, stat.st_mtime,
+        float(empty_val))).encode("utf-8")).hexdigest()
+    return os.path.join(cache_path, "cvrl", "%s-%s.npy" % (
+        os.path.splitext(os.path.basename(csv_filename))[0], digest[:16]))
+
+def _save_npy(filename, array):
+    """Save `array` into a `.npy` file, see `_open_atomic`."""
+    with _open_atomic(filename) as f:
+        np.save(f, array)
+
+def _get_cached(memory_cache, key, sub_dir, basename, load, is_valid,
+                compute):
+    """Get an object cached both in the `memory_cache` dict under `key`, and on
+    disk as `basename` in the `sub_dir` sub-directory of `cache_path`.
+
+    A file on disk is loaded with `load(filename)`, and used if
+    `is_valid(obj)`, e.g. if it was computed with the same parameters.
+    Otherwise, the object is computed by `compute()` and saved with its `save`
+    method.
+
+    """
+    if key in memory_cache:
+        return memory_cache[key]
+    filename = os.path.join(cache_path, sub_dir, basename)
+    obj = None
+    if os.path.exists(filename):
+        obj = load(filename)
+        if not is_valid(obj):
+            obj = None
+    if obj is None:
+        obj = compute()
+        obj.save(filename)
+    memory_cache[key] = obj
+    return obj
+
+@contextlib.contextmanager
+def _open_atomic(filename, mode="wb"):
+    """Open a file for writing, which replaces `filename` once closed.
+
+    The file is written into a temporary file in the same directory first,
+    creating the directory if needed, and then renamed to `filename`, so that
+    concurrent readers never see a partially written file, nor is one left
+    behind if interrupted.
+
+    Example::
+
+      with _open_atomic("table.npz") as f:
+          np.savez(f, table=table)
+
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    fd, tmp_filename = tempfile.mkstemp(
+        suffix=os.path.splitext(filename)[1], dir=dirname)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+    except:
+        os.remove(tmp_filename)
+        raise
+    os.rename(tmp_filename, filename)
+
+def _parse_cvrl_csv(csv_filename, empty_val):
     with open(csv_filename, 'r') as f:
         lines = f.readlines()
         cmfs = [[float(v or empty_val) for v in l.strip().split(',')]
                 for l in lines]
         return np.array(cmfs)
 
-def adjust_wl(fw_in, wl_in, wl_out):
-    """Adjust the wavelength list of the input function(s)."""
-    # For multiple functions, do the adjustment on each one of them and
-    # concatenate results together.
-    if len(fw_in.shape) > 1:
-        fw_out_list = []
-        for k in xrange(fw_in.shape[0]):
-            fw_out_list.append(adjust_wl(fw_in[k], wl_in, wl_out))
-        return np.vstack(fw_out_list)
-    # Do the adjustment for a single wavelength function.
-    assert (wl_in[1] - wl_in[0]) == (wl_out[1] - wl_out[0])
-    dw = wl_in[1] - wl_in[0]
-    left_index = int(np.round((wl_out[0] - wl_in[0]) / dw))
-    right_index = int(np.round((wl_out[-1] - wl_in[-1]) / dw))
-    # The result contains three parts (two pads and a center).
-    left_pad = np.zeros(0)
-    center = fw_in
-    right_pad = np.zeros(0)
-    # Compute left pad.
-    if left_index < 0:
-        left_pad = np.zeros(-left_index)
-    else:
-        center = center[left_index:]
-    # Compute right pad.
-    if right_index >= 0:
-        right_pad = np.zeros(right_index)
+def resample_fw(fw_in, wl_in, wl_out, method="linear", extrapolate="fill",
+                fill_value=0.0):
+    """Resample function(s) of wavelength onto another wavelength list.
+
+    All the functions are resampled at once, as a product with a sparse matrix
+    of interpolation weights, which is computed once per pair of wavelength
+    lists and kept for later calls.
+
+    Parameters
+    ----------
+    fw_in: ndarray
+        The function(s) of wavelength, with the wavelengths along the last axis.
+
+    wl_in: ndarray
+        The increasing wavelength list of `fw_in`.
+
+    wl_out: ndarray
+        The wavelength list to resample onto, of any step and range.
+
+    method: str, optional
+        The interpolation between the samples of `fw_in`, among
+          * "linear": linear interpolation;
+          * "cubic": cubic Lagrange interpolation on the 4 nearest samples;
+          * "sprague": Sprague (1880) quintic interpolation, as recommended by
+            CIE 167:2005 for spectral data, which needs an evenly spaced
+            `wl_in`.
+
+    extrapolate: str, optional
+        The values out of the range of `wl_in`, either "fill" to set them to
+        `fill_value`, or "constant" to repeat the first and last values of
+        `fw_in` (as recommended by CIE 015:2004).
+
+    fill_value: float, optional
+        The values out of the range of `wl_in` for "fill" extrapolation, e.g.
+        `-np.inf` for functions in log scale.
+
+    Returns
+    -------
+    fw_out: ndarray
+        The resampled function(s), with `len(wl_out)` entries along the last
+        axis.
+
+    """
+    fw_in = np.asarray(fw_in)
+    weights, outside = _resample_weights(np.asarray(wl_in, np.float64),
+                                         np.asarray(wl_out, np.float64),
+                                         method, extrapolate)
+    flat = fw_in.reshape(-1, fw_in.shape[-1])
+    fw_out = np.ascontiguousarray(weights.dot(flat.T).T)
+    if extrapolate == "fill" and fill_value != 0:
+        fw_out[:,outside] = fill_value
+    return fw_out.reshape(fw_in.shape[:-1] + (weights.shape[0],))
+
+def _resample_weights(wl_in, wl_out, method, extrapolate):
+    """The sparse matrix mapping functions sampled at `wl_in` to `wl_out`,
+    and the indices of `wl_out` out of the range of `wl_in`."""
+    key = (method, extrapolate, wl_in.tobytes(), wl_out.tobytes())
+    with _resample_cache_lock:
+        if key in _resample_cache:
+            return _resample_cache[key]
+    if method not in _resample_sizes:
+        raise Exception("Unknown method '%s' for `resample_fw`." % method)
+    if extrapolate not in ("fill", "constant"):
+        raise Exception("Unknown extrapolation '%s' for `resample_fw`." %
+                        extrapolate)
+    num_in, num_out = len(wl_in), len(wl_out)
+    size = _resample_sizes[method]
+    if num_in < size:
+        raise ValueError("The method '%s' needs at least %d samples." %
+                         (method, size))
+    steps = np.diff(wl_in)
+    tol = 1e-6 * np.min(steps)
+    if method == "sprague" and np.max(np.abs(steps - steps[0])) > tol:
+        raise ValueError("The method 'sprague' needs an evenly spaced `wl_in`.")
+    # Find the interval `[wl_in[i], wl_in[i+1]]` containing each output, where
+    # the outputs within roundoff of a sample take its value.
+    inside = (wl_out >= wl_in[0] - tol) & (wl_out <= wl_in[-1] + tol)
+    wl = np.clip(wl_out, wl_in[0], wl_in[-1])
+    index = np.clip(np.searchsorted(wl_in, wl, "right") - 1, 0, num_in - 2)
+    t = (wl - wl_in[index]) / steps[index]
+    sample = np.where(t * steps[index] <= tol, index,
+                      np.where((1 - t) * steps[index] <= tol, index + 1, -1))
+    between = np.nonzero(inside & (sample < 0))[0]
+    index, t, wl = index[between], t[between], wl[between]
+    # The weights of `size` consecutive samples starting at `start`.
+    if method == "linear":
+        start = index
+        local = np.column_stack((1 - t, t))
+    elif method == "cubic":
+        start = np.clip(index - 1, 0, num_in - 4)
+        nodes = wl_in[start[:,None] + np.arange(4)]
+        local = np.ones((len(between), 4))
+        for j in xrange(4):
+            for m in xrange(4):
+                if m != j:
+                    local[:,j] *= (wl - nodes[:,m]) / (nodes[:,j] - nodes[:,m])
     else:
-        center = center[:right_pad]
-    return np.concatenate((left_pad, center, right_pad))
+        # The samples `i-2` to `i+3` of the input extended by two samples on
+        # each side, which start at `i` in the extended input.
+        start = index
+        local = np.dot(t[:,None] ** np.arange(6), _sprague_coefficients)
+    weights = scipy.sparse.coo_matrix(
+        (local.ravel(), (np.repeat(between, size),
+                         (start[:,None] + np.arange(size)).ravel())),
+        shape=(num_out, num_in + 4 if method == "sprague" else num_in))
+    if method == "sprague":
+        weights = weights.tocsr().dot(_sprague_extension(num_in)).tocoo()
+    rows, cols, values = [weights.row], [weights.col], [weights.data]
+    snapped = np.nonzero(inside & (sample >= 0))[0]
+    rows.append(snapped)
+    cols.append(sample[snapped])
+    values.append(np.ones(len(snapped)))
+    outside = np.nonzero(~inside)[0]
+    if extrapolate == "constant":
+        rows.append(outside)
+        cols.append(np.where(wl_out[outside] < wl_in[0], 0, num_in - 1))
+        values.append(np.ones(len(outside)))
+    weights = scipy.sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(num_out, num_in))
+    weights.eliminate_zeros()
+    with _resample_cache_lock:
+        _resample_cache[key] = (weights, outside)
+        while len(_resample_cache) > _resample_cache_size:
+            _resample_cache.popitem(last=False)
+    return weights, outside
+
+def _sprague_extension(num_in):
+    """The sparse matrix extending `num_in` samples by two on each side."""
+    rows = np.concatenate((np.repeat([0, 1], 6), np.arange(2, num_in + 2),
+                           np.repeat([num_in + 2, num_in + 3], 6)))
+    cols = np.concatenate((np.tile(np.arange(6), 2), np.arange(num_in),
+                           np.tile(np.arange(num_in - 6, num_in), 2)))
+    values = np.concatenate((_sprague_boundary[:2].ravel(), np.ones(num_in),
+                             _sprague_boundary[2:].ravel()))
+    return scipy.sparse.csr_matrix((values, (rows, cols)),
+                                   shape=(num_in + 4, num_in))
+
+# The number of consecutive samples weighted by each method of `resample_fw`.
+_resample_sizes = {"linear": 2, "cubic": 4, "sprague": 6}
+
+# The coefficients of the Sprague interpolation polynomial, mapping the samples
+# `i-2` to `i+3` to the coefficients of `t**0` to `t**5` (as rows) for
+# `wl_in[i] + t * step`, and the ones extrapolating two samples on each side
+# from the six outermost ones. Accessed from: CIE 167:2005, Recommended
+# practice for tabulating spectral data for use in colour computations.
+_sprague_coefficients = np.array([
+    [  0,   0,   24,    0,   0,  0],
+    [  2, -16,    0,   16,  -2,  0],
+    [ -1,  16,  -30,   16,  -1,  0],
+    [ -9,  39,  -70,   66, -33,  7],
+    [ 13, -64,  126, -124,  61, -12],
+    [ -5,  25,  -50,   50, -25,  5],
+]) / 24.0
+_sprague_boundary = np.array([
+    [ 884, -1960,  3033, -2648,  1080,  -180],
+    [ 508,  -540,   488,  -367,   144,   -24],
+    [ -24,   144,  -367,   488,  -540,   508],
+    [-180,  1080, -2648,  3033, -1960,   884],
+]) / 209.0
+
+_resample_cache = collections.OrderedDict()
+_resample_cache_lock = threading.Lock()
+_resample_cache_size = 32
+
+def adjust_wl(fw_in, wl_in, wl_out):
+    """Adjust the wavelength list of the input function(s), by linear
+    interpolation and zero padding, see `resample_fw`."""
+    return resample_fw(fw_in, wl_in, wl_out)
 
-def load_fw(name, wl=None):
+def load_fw(name, wl=None, method="linear"):
     """Load function of wavelength.
 
+    The results are memoized for the `_fw_cache_size` most recently used
+    `(name, wl, method)` arguments, and shared by all the callers, so they are
+    read-only arrays, which need to be copied before being modified.
+
     Parameters
     ----------
     name: str
-        A string for the name of function, currently support:
+        A string for the name of function, among `list_datasets()`, e.g.:
           * "xyz-cmfs": CIE-XYZ color matching functions.
           * "d65-spd": CIE-D65 spectral power distribution.
     wl: ndarray
-        Wavelength list, optional.
+        Wavelength list, optional, onto which the functions are resampled by
+        `resample_fw`, with zeros out of the range of the dataset (or `-inf`
+        for the datasets in log scale).
+    method: str
+        The interpolation method of `resample_fw`, optional. The datasets in
+        log scale are interpolated in linear scale, except by "linear".
 
     Returns
     -------
@@ -241,31 +741,197 @@ def load_fw(name, wl=None):
         It will be the same as input `wl` if it is not `None`, or will be loaded
         together with `fw` as input data.
     """
-    # Load the 'fw' and corresponding 'load_wl'.
-    if name == "xyz-cmfs":
-        csv_data = read_cvrl_csv(_data_path + "/cvrl/ciexyz31_1.csv")
-        load_wl = csv_data[:,0]
-        fw = csv_data[:, 1:].T
-    elif name == "d65-spd":
-        csv_data = read_cvrl_csv(_data_path + "/cvrl/Illuminantd65.csv")
-        load_wl = csv_data[:,0]
-        fw = csv_data[:,1]
-    else:
+    if name not in _datasets:
         raise Exception("Unknown name '%s' for `load_fw`." % name)
+    if wl is None:
+        key = (name, None)
+    else:
+        wl_array = np.asarray(wl)
+        key = (name, wl_array.dtype.str, wl_array.shape, wl_array.tobytes(),
+               method)
+    with _fw_cache_lock:
+        if key in _fw_cache:
+            # Move the entry to the most recently used end.
+            fw, load_wl = _fw_cache[key] = _fw_cache.pop(key)
+            return (fw, load_wl if wl is None else wl)
+    # Load the 'fw' and corresponding 'load_wl'.
+    fw, load_wl = _read_dataset(name)
     # Adjust the 'wl' if provided as input.
+    if wl is not None and _datasets[name][1] and method != "linear":
+        # The weights of the other methods include negative values, which would
+        # mix the -inf of the missing entries with inf, so the log tables are
+        # resampled in linear scale, clipping the overshoots below 0.
+        fw = resample_fw(10 ** fw, load_wl, wl, method)
+        with np.errstate(divide="ignore"):
+            fw = np.log10(np.maximum(fw, 0))
+    elif wl is not None:
+        fw = resample_fw(fw, load_wl, wl, method,
+                         fill_value=_fill_value(name))
     if wl is not None:
-        return (adjust_wl(fw, load_wl, wl), wl)
-    else:
-        return (fw, load_wl)
+        fw.flags.writeable = False
+    with _fw_cache_lock:
+        _fw_cache[key] = (fw, load_wl)
+        while len(_fw_cache) > _fw_cache_size:
+            _fw_cache.popitem(last=False)
+    return (fw, load_wl if wl is None else wl)
+
+def set_fw_cache_size(size):
+    """Set the number of results memoized by `load_fw` (initially 32), evicting
+    the least recently used ones if needed. A size of 0 disables the
+    memoization."""
+    global _fw_cache_size
+    with _fw_cache_lock:
+        _fw_cache_size = max(int(size), 0)
+        while len(_fw_cache) > _fw_cache_size:
+            _fw_cache.popitem(last=False)
+
+def clear_fw_cache():
+    """Clear the results memoized by `load_fw`."""
+    with _fw_cache_lock:
+        _fw_cache.clear()
+
+_fw_cache = collections.OrderedDict()
+_fw_cache_lock = threading.Lock()
+_fw_cache_size = 32
+
+def list_datasets():
+    """The names of the functions of wavelength that `load_fw` can load, in
+    alphabetical order."""
+    return sorted(_datasets)
+
+def dataset_info(name):
+    """Describe a dataset of `load_fw`.
+
+    Returns
+    -------
+    info : dict
+        Holding the `"name"`, a `"description"` and the `"filename"` of the
+        dataset in `data/cvrl`, whether its values are in `"log"` scale (base
+        10), the `"num_functions"`, and its wavelength grid, i.e. the `"wl"`
+        array and its `"wl_min"`, `"wl_max"` and `"wl_step"` in nm.
+    """
+    if name not in _datasets:
+        raise Exception("Unknown name '%s' for `load_fw`." % name)
+    filename, log, description = _datasets[name]
+    fw, wl = load_fw(name)
+    return {
+        "name": name,
+        "description": description,
+        "filename": filename,
+        "log": log,
+        "num_functions": 1 if fw.ndim == 1 else fw.shape[0],
+        "wl": wl,
+        "wl_min": float(wl[0]),
+        "wl_max": float(wl[-1]),
+        "wl_step": float(np.round((wl[-1] - wl[0]) / (len(wl) - 1), 6)),
+    }
+
+def _read_dataset(name):
+    """Read the functions of a dataset and their wavelength list."""
+    filename = _datasets[name][0]
+    csv_data = read_cvrl_csv(os.path.join(_data_path, "cvrl", filename),
+                             _fill_value(name), cache=True)
+    load_wl = csv_data[:,0]
+    fw = csv_data[:,1:].T
+    if fw.shape[0] == 1:
+        fw = fw[0]
+    return fw, load_wl
+
+def _fill_value(name):
+    """The value of a dataset for its missing entries and out of its range,
+    i.e. `-inf` for the datasets in log scale, and `0` otherwise."""
+    return -np.inf if _datasets[name][1] else 0.0
+
+# The datasets of `load_fw`, mapping each name to the csv file in `data/cvrl`,
+# whether its values are in log scale, and a description. See
+# `data/cvrl/README.txt` for their sources.
+_datasets = {
+    "d65-spd": ("Illuminantd65.csv", False,
+                "CIE standard illuminant D65 spectral power distribution."),
+    "xyz-cmfs": ("ciexyz31_1.csv", False,
+                 "CIE 1931 2-deg XYZ color matching functions."),
+    "xyz-cmfs-judd": ("ciexyzj.csv", False,
+                      "CIE 1931 2-deg XYZ color matching functions, modified "
+                      "by Judd (1951)."),
+    "xyz-cmfs-judd-vos": ("ciexyzjv.csv", False,
+                          "CIE 1931 2-deg XYZ color matching functions, "
+                          "modified by Judd (1951) and Vos (1978)."),
+    "xyz-cmfs-10deg": ("ciexyz64_1.csv", False,
+                       "CIE 1964 10-deg XYZ color matching functions."),
+    "xyz-cmfs-2012-2deg": ("lin2012xyz2e_fine_7sf.csv", False,
+                           "CIE 2012 2-deg XYZ color matching functions, "
+                           "transformed from the CIE 2006 LMS functions."),
+    "xyz-cmfs-2012-10deg": ("lin2012xyz10e_fine_7sf.csv", False,
+                            "CIE 2012 10-deg XYZ color matching functions, "
+                            "transformed from the CIE 2006 LMS functions."),
+    "lms-2deg": ("linss2_10e_fine.csv", False,
+                 "CIE 2006 2-deg LMS cone fundamentals (Stockman & Sharpe), "
+                 "energy units."),
+    "lms-10deg": ("linss10e_fine.csv", False,
+                  "CIE 2006 10-deg LMS cone fundamentals (Stockman & Sharpe), "
+                  "energy units."),
+    "log-lms-2deg": ("ss2_10e_fine.csv", True,
+                     "CIE 2006 2-deg LMS cone fundamentals, log energy "
+                     "units."),
+    "log-lms-10deg": ("ss10e_fine.csv", True,
+                      "CIE 2006 10-deg LMS cone fundamentals, log energy "
+                      "units."),
+    "log-lms-quantal-2deg": ("ss2_10q_fine.csv", True,
+                             "CIE 2006 2-deg LMS cone fundamentals, log "
+                             "quantal units."),
+    "log-lms-quantal-10deg": ("ss10q_fine.csv", True,
+                              "CIE 2006 10-deg LMS cone fundamentals, log "
+                              "quantal units."),
+    "luminosity-2deg": ("linCIE2008v2e_fine.csv", False,
+                        "CIE 2008 2-deg luminous efficiency function, energy "
+                        "units."),
+    "luminosity-10deg": ("linCIE2008v10e_fine.csv", False,
+                         "CIE 2008 10-deg luminous efficiency function, energy "
+                         "units."),
+    "log-luminosity-2deg": ("logCIE2008v2e_fine.csv", True,
+                            "CIE 2008 2-deg luminous efficiency function, log "
+                            "energy units."),
+    "log-luminosity-10deg": ("logCIE2008v10e_fine.csv", True,
+                             "CIE 2008 10-deg luminous efficiency function, "
+                             "log energy units."),
+    "log-luminosity-quantal-2deg": ("logCIE2008v2q_fine.csv", True,
+                                    "CIE 2008 2-deg luminous efficiency "
+                                    "function, log quantal units."),
+    "log-luminosity-quantal-10deg": ("logCIE2008v10q_fine.csv", True,
+                                     "CIE 2008 10-deg luminous efficiency "
+                                     "function, log quantal units."),
+}
 
 def get_blackbody_spd(temperature, wl):
-    """Get blackbody radiation spectral power distribution."""
+    """Get blackbody radiation spectral power distribution.
+
+    Parameters
+    ----------
+    temperature: float or ndarray
+        The temperature(s) in Kelvin.
+
+    wl: ndarray
+        Wavelength list in nm.
+
+    Returns
+    -------
+    spd: ndarray
+        The spectral power distribution of each temperature, sampled at `wl`
+        and normalized to sum to 1, of shape `temperature.shape + wl.shape`,
+        e.g. a `TxW` matrix for `T` temperatures, all computed at once.
+
+    """
     # Setup constants.
     h = 6.6260695729e-34    # Planck constant.
     c = 299792458           # Speed of light.
     k = 1.380648813e-23     # Boltzmann constant.
-    # Compute SPD by Planck's law.
-    wl = wl * 1e-9
-    spd = 2*h*(c**2) / np.power(wl,5) / (np.exp(h*c/wl/k/temperature) - 1)
+    # Compute SPD by Planck's law, with the temperatures along the first axes.
+    # The exponential overflows to infinity, i.e. no power, for wavelengths
+    # far below the peak of low temperatures.
+    temperature = np.asarray(temperature, dtype=np.float64)[...,None]
+    wl = np.asarray(wl) * 1e-9
+    with np.errstate(over="ignore"):
+        spd = 2*h*(c**2) / np.power(wl,5) / (
+            np.exp(h*c/wl/k/temperature) - 1)
     # Normalize the spd such that it sums to 1.
-    return spd / np.sum(spd)
+    return spd / np.sum(spd, axis=-1, keepdims=True)
@@ -4,14 +4,19 @@
 # Created: Nov 05, 2014.
 
 import numpy as np
+import os
+import shutil
 import unittest
 
+import data
 from data import *
+from data import _fast_power, _fast_power_error
+from test_utils import TemporaryCacheMixin
 
 _this_file_path = os.path.dirname(__file__)
 _data_path = _this_file_path + "/data"
 
-class DataTest(unittest.TestCase):
+class DataTest(TemporaryCacheMixin, unittest.TestCase):
     def test_read_cvrl_csv(self):
         # Test on reading regular data.
         cmfs = read_cvrl_csv(_data_path + "/cvrl/ciexyz31_1.csv")
@@ -39,6 +44,35 @@ class DataTest(unittest.TestCase):
         self.assertAlmostEqual(cmfs[3882,2], -5.73979)
         self.assertAlmostEqual(cmfs[3882,3], -np.inf)
 
+    def test_cvrl_cache(self):
+        csv_filename = os.path.join(data.cache_path, "table.csv")
+        shutil.copy(_data_path + "/cvrl/ss2_10e_fine.csv", csv_filename)
+        parsed = read_cvrl_csv(csv_filename, -np.inf)
+        self.assertTrue(parsed.flags.writeable)
+        self.assertFalse(os.path.exists(data.cache_path + "/cvrl"))
+        # The first read stores the table, and the later ones map it.
+        for i in xrange(2):
+            cmfs = read_cvrl_csv(csv_filename, -np.inf, cache=True)
+            self.assertTrue(np.array_equal(cmfs, parsed))
+            self.assertFalse(cmfs.flags.writeable)
+        self.assertEqual(len(os.listdir(data.cache_path + "/cvrl")), 1)
+        self.assertTrue(isinstance(cmfs, np.memmap))
+        # The empty entries are part of the key.
+        self.assertEqual(read_cvrl_csv(csv_filename, cache=True)[3882,3], 0.0)
+        # Changing the csv file invalidates the stored table.
+        with open(csv_filename, "w") as f:
+            f.write("390.0,1.5\n391.0,\n")
+        os.utime(csv_filename, (0, 0))
+        self.assertTrue(np.array_equal(
+            read_cvrl_csv(csv_filename, cache=True),
+            [[390.0, 1.5], [391.0, 0.0]]))
+
+        build_cvrl_cache()
+        num_tables = len([f for f in os.listdir(_data_path + "/cvrl")
+                          if f.endswith(".csv")])
+        self.assertEqual(len(os.listdir(data.cache_path + "/cvrl")),
+                         3 + num_tables)
+
     def test_load_fw(self):
         # Load CIE-XYZ color matching functions.
         xyz_cmfs, wl = load_fw("xyz-cmfs")
@@ -53,6 +87,115 @@ class DataTest(unittest.TestCase):
         self.assertEqual(len(d65_spd), len(wl))
         self.assertAlmostEqual(d65_spd[8], 50.998900)
 
+    def test_datasets(self):
+        # Every bundled table is a dataset.
+        names = list_datasets()
+        self.assertEqual(len(names), len([
+            f for f in os.listdir(_data_path + "/cvrl") if f.endswith(".csv")]))
+        for name in names:
+            info = dataset_info(name)
+            fw, wl = load_fw(name)
+            self.assertIs(info["wl"], wl)
+            self.assertEqual(fw.shape[-1], len(wl))
+            self.assertEqual(fw.ndim, 1 if info["num_functions"] == 1 else 2)
+            self.assertEqual(info["wl_min"], wl[0])
+            self.assertEqual(info["wl_max"], wl[-1])
+            self.assertFalse(np.any(np.isnan(fw)))
+        info = dataset_info("log-lms-2deg")
+        self.assertTrue(info["log"])
+        self.assertEqual(info["num_functions"], 3)
+        self.assertEqual(info["wl_step"], 0.1)
+        self.assertEqual(dataset_info("xyz-cmfs-judd")["wl_step"], 10)
+        self.assertRaises(Exception, dataset_info, "unknown")
+        self.assertRaises(Exception, load_fw, "unknown")
+
+    def test_load_fw_cache(self):
+        # The results are shared and read-only.
+        clear_fw_cache()
+        xyz_cmfs, wl = load_fw("xyz-cmfs")
+        self.assertIs(load_fw("xyz-cmfs")[0], xyz_cmfs)
+        self.assertFalse(xyz_cmfs.flags.writeable)
+        wl2 = np.arange(360, 831)
+        d65_spd, wl3 = load_fw("d65-spd", wl2)
+        self.assertIs(wl3, wl2)
+        self.assertIs(load_fw("d65-spd", wl2.copy())[0], d65_spd)
+        self.assertFalse(d65_spd.flags.writeable)
+        self.assertIsNot(load_fw("d65-spd", wl2[1:])[0], d65_spd)
+        # The least recently used results are evicted.
+        set_fw_cache_size(2)
+        try:
+            clear_fw_cache()
+            xyz_cmfs = load_fw("xyz-cmfs")[0]
+            lms = load_fw("lms-2deg")[0]
+            self.assertIs(load_fw("xyz-cmfs")[0], xyz_cmfs)
+            load_fw("d65-spd")
+            self.assertIs(load_fw("xyz-cmfs")[0], xyz_cmfs)
+            self.assertIsNot(load_fw("lms-2deg")[0], lms)
+            set_fw_cache_size(0)
+            self.assertIsNot(load_fw("xyz-cmfs")[0], xyz_cmfs)
+        finally:
+            set_fw_cache_size(32)
+
+    def test_resample_fw(self):
+        # Polynomials are reproduced up to the degree of each method, away from
+        # the boundary for Sprague interpolation.
+        wl_in = np.arange(400, 701, 10.0)
+        wl_out = np.linspace(395, 705, 311)
+        inside = (wl_out >= 420) & (wl_out <= 680)
+        for method, degree in (("linear", 1), ("cubic", 3), ("sprague", 4)):
+            fw_in = ((wl_in - 550) / 100.0) ** np.arange(degree + 1)[:,None]
+            fw_out = resample_fw(fw_in, wl_in, wl_out, method)
+            self.assertEqual(fw_out.shape, (degree + 1, len(wl_out)))
+            expected = ((wl_out - 550) / 100.0) ** np.arange(degree + 1)[:,None]
+            self.assertLess(np.max(np.abs(fw_out - expected)[:,inside]), 1e-12)
+            # Filled or constant extrapolation.
+            self.assertTrue(np.all(fw_out[:,wl_out < 400] == 0))
+            fw_out = resample_fw(fw_in, wl_in, wl_out, method,
+                                 fill_value=-np.inf)
+            self.assertTrue(np.all(fw_out[:,wl_out < 400] == -np.inf))
+            self.assertLess(np.max(np.abs(fw_out - expected)[:,inside]), 1e-12)
+            fw_out = resample_fw(fw_in, wl_in, wl_out, method, "constant")
+            self.assertTrue(np.all(fw_out[:,wl_out > 700] == fw_in[:,-1:]))
+        self.assertRaises(Exception, resample_fw, fw_in, wl_in, wl_out, "foo")
+        self.assertRaises(Exception, resample_fw, fw_in, wl_in, wl_out,
+                          "linear", "foo")
+        self.assertRaises(ValueError, resample_fw, fw_in[:,:5], wl_in[:5],
+                          wl_out, "sprague")
+        self.assertRaises(ValueError, resample_fw, fw_in, wl_in ** 2, wl_out,
+                          "sprague")
+        # The weights are kept for the same wavelength lists.
+        self.assertIs(data._resample_weights(wl_in, wl_out, "cubic", "fill"),
+                      data._resample_weights(wl_in.copy(), wl_out, "cubic",
+                                             "fill"))
+
+        # The 0.1 nm tables onto 5 nm, keeping the values of the samples
+        # (including the missing ones of the log tables), and cropping or
+        # padding with zeros the ends.
+        lms, wl = load_fw("log-lms-2deg")
+        lms_5nm = resample_fw(lms, wl, np.arange(390, 831, 5), "sprague")
+        self.assertTrue(np.array_equal(lms_5nm, lms[:,::50]))
+        self.assertTrue(np.all(load_fw("lms-2deg", np.arange(400, 701, 5))[0] ==
+                               load_fw("lms-2deg")[0][:,100:3101:50]))
+        lms, wl = load_fw("lms-2deg")
+        self.assertTrue(np.allclose(
+            adjust_wl(lms, wl, [389.9, 390.05, 391]), np.column_stack((
+                np.zeros(3), (lms[:,0] + lms[:,1]) / 2, lms[:,10])),
+            rtol=1e-12, atol=0))
+        # The log tables are interpolated without NaN from their missing
+        # entries, in linear scale except by linear interpolation, and padded
+        # with -inf, i.e. the log of 0.
+        wl = np.arange(390, 831, 0.73)
+        log_lms = load_fw("log-lms-2deg", wl, "linear")[0]
+        for method in ("cubic", "sprague"):
+            check = load_fw("log-lms-2deg", wl, method)[0]
+            self.assertFalse(np.any(np.isnan(check)))
+            self.assertTrue(np.array_equal(np.isinf(check), np.isinf(log_lms)))
+            self.assertLess(np.max(np.abs(10 ** check - 10 ** log_lms)), 1e-4)
+        log_lms = load_fw("log-lms-2deg", np.arange(360, 400, 5))[0]
+        self.assertTrue(np.all(log_lms[:,:6] == -np.inf))
+        self.assertTrue(np.array_equal(log_lms[:,6:],
+                                       load_fw("log-lms-2deg")[0][:,:51:50]))
+
     def test_d65(self):
         # Compute the xy coordinates of d65, and check with ground truth.
         xyz_cmfs, wl = load_fw("xyz-cmfs")
@@ -62,6 +205,18 @@ class DataTest(unittest.TestCase):
         self.assertAlmostEqual(d65_xy[0], 0.3127, places=4)
         self.assertAlmostEqual(d65_xy[1], 0.3290, places=4)
 
+    def test_blackbody_spd(self):
+        # A matrix of temperatures is evaluated at once, as one at a time.
+        _, wl = load_fw("xyz-cmfs")
+        temperatures = np.array([[1000, 2856.5], [6500, 25000]])
+        spds = get_blackbody_spd(temperatures, wl)
+        self.assertEqual(spds.shape, (2, 2, len(wl)))
+        for index in np.ndindex(2, 2):
+            spd = get_blackbody_spd(temperatures[index], wl)
+            self.assertEqual(spd.shape, wl.shape)
+            self.assertAlmostEqual(np.sum(spd), 1.0)
+            self.assertLess(np.max(np.abs(spds[index] - spd)), 1e-15)
+
     def test_srgb(self):
         # Check the normalized xyz chromaticity coordinates of RGB and white
         # point.
@@ -80,6 +235,75 @@ class DataTest(unittest.TestCase):
         check_normalized_xyz(np.dot(srgb_to_xyz_matrix, np.array([1,1,1])),
                              srgb_white_xyz, 4)
 
+    def test_srgb_gamma(self):
+        linear_data = np.array([-0.1, 0.0, 0.0031308, 0.1, 0.5, 1.0])
+        nonlinear_data = srgb_gamma(linear_data)
+        self.assertTrue(np.max(np.abs(nonlinear_data - np.array(
+            [-1.292, 0.0, 0.04045, 0.3492, 0.7354, 1.0]))) < 1.0e-4)
+        self.assertTrue(np.max(np.abs(
+            srgb_inverse_gamma(nonlinear_data) - linear_data)) < 1.0e-12)
+
+        # Write the results into a given array, or in place.
+        out = np.empty(linear_data.shape)
+        self.assertIs(srgb_gamma(linear_data, out=out), out)
+        self.assertTrue(np.all(out == nonlinear_data))
+        data = nonlinear_data.copy()
+        self.assertIs(srgb_inverse_gamma(data, inplace=True), data)
+        self.assertTrue(np.all(data == srgb_inverse_gamma(nonlinear_data)))
+
+        # The float32 type is preserved, or can be requested explicitly.
+        data = linear_data.astype(np.float32)
+        self.assertEqual(srgb_gamma(data).dtype, np.float32)
+        self.assertEqual(srgb_inverse_gamma(data).dtype, np.float32)
+        self.assertEqual(adobe_gamma(data).dtype, np.float32)
+        self.assertEqual(srgb_gamma(linear_data, dtype=np.float32).dtype,
+                         np.float32)
+        self.assertTrue(np.max(np.abs(
+            srgb_gamma(data) - nonlinear_data)) < 1.0e-6)
+
+    def test_srgb_gamma_codes(self):
+        for code_dtype in (np.uint8, np.uint16):
+            code_max = np.iinfo(code_dtype).max
+            # Decode all the codes by looking up the table.
+            codes = np.arange(code_max + 1).astype(code_dtype)
+            linear_data = srgb_inverse_gamma(codes)
+            self.assertEqual(linear_data.dtype, np.float64)
+            self.assertTrue(np.all(linear_data == srgb_inverse_gamma(
+                codes / float(code_max))))
+            self.assertEqual(srgb_inverse_gamma(codes, dtype=np.float32).dtype,
+                             np.float32)
+            # Encode back to the same codes, and quantize arbitrary values.
+            self.assertTrue(np.all(
+                srgb_gamma(linear_data, dtype=code_dtype) == codes))
+            data = np.random.uniform(-0.1, 1.1, 10000)
+            expected = np.round(np.clip(srgb_gamma(data), 0, 1) * code_max)
+            out = np.empty(data.shape, code_dtype)
+            self.assertIs(srgb_gamma(data, out=out), out)
+            self.assertTrue(np.all(out == expected))
+
+    def test_fast_power(self):
+        # All the float32 values in `[1, 2)`, and some of them scaled over a
+        # range of exponents or converted to float64.
+        mantissas = (np.arange(2**23, dtype=np.int32) | (127 << 23)).view(
+            np.float32)
+        for exponent in (2.4, 1 / 2.4, 1. / 3., 1. / 2.19921875):
+            for dtype in (np.float32, np.float64):
+                for scale in (1., 2.**-10, 0.5, 4.):
+                    data = mantissas.astype(dtype) * dtype(scale)
+                    if scale != 1. or dtype != np.float32:
+                        data = data[::101]
+                    exact = data.astype(np.float64) ** exponent
+                    self.assertLess(np.max(np.abs(
+                        _fast_power(data, exponent) / exact - 1)),
+                                    _fast_power_error)
+        # The power functions are within the stated bounds over `[0, 1]`.
+        data = np.linspace(0, 1, 1000001)
+        for fcn, tol in ((srgb_gamma, 3e-6), (srgb_inverse_gamma, 1e-6),
+                         (adobe_gamma, 3e-6)):
+            self.assertLess(np.max(np.abs(
+                fcn(data, precision="fast") - fcn(data))), tol)
+        self.assertRaises(Exception, srgb_gamma, data, precision="foo")
+
     def test_adobe(self):
         # Make sure the matrices convert to and from XYZ colorspace are invert
         # of each other.
@@ -99,7 +323,8 @@ class DataTest(unittest.TestCase):
         check_xy(np.dot(adobe_to_xyz_matrix, np.array([1,1,1])), adobe_white_xy)
 
         # Check that the (normalized) white point should match CIE D65.
-        wp_xyz = np.dot(adobe_to_xyz_matrix, np.array([95.047, 100.00, 108.883]))
+        wp_xyz = np.dot(adobe_to_xyz_matrix,
+                        np.array([95.047, 100.00, 108.883]))
         norm_wp_xyz = adobe_abs_to_norm_xyz(wp_xyz)
         norm_wp_xyz = adobe_abs_to_norm_xyz(np.array([95.047, 100.00, 108.883]))
         norm_wp_xyz = np.array([95.047, 100.00, 108.883])
@@ -107,5 +332,21 @@ class DataTest(unittest.TestCase):
         self.assertAlmostEqual(norm_wp_xy[0], 0.3127, places=4)
         self.assertAlmostEqual(norm_wp_xy[1], 0.3290, places=4)
 
+        # The direct matrices between linear sRGB and Adobe RGB, which keep the
+        # white point.
+        self.assertTrue(np.max(np.abs(np.dot(
+            srgb_to_adobe_matrix, adobe_to_srgb_matrix) - np.eye(3))) < 1e-4)
+        self.assertTrue(np.max(np.abs(
+            np.dot(srgb_to_adobe_matrix, np.ones(3)) - 1)) < 1e-3)
+
+        # The inverse transfer function.
+        linear_data = np.linspace(0, 1, 101)
+        nonlinear_data = adobe_gamma(linear_data)
+        self.assertTrue(np.max(np.abs(
+            adobe_inverse_gamma(nonlinear_data) - linear_data)) < 1e-12)
+        self.assertIs(adobe_inverse_gamma(nonlinear_data, inplace=True),
+                      nonlinear_data)
+        self.assertTrue(np.max(np.abs(nonlinear_data - linear_data)) < 1e-12)
+
 if __name__ == "__main__":
     unittest.main()
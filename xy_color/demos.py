@@ -155,11 +155,8 @@ def plot_color_temperature_curve(ax, xyz_cmfs, wl):
     """Plot the color temperature curve."""
     # Compute the color for blackbody radiation of a range of temperatures.
     temperatures = np.arange(1000, 15000, 50)
-    color_curve = np.zeros((2, len(temperatures)))
-    for i,t in enumerate(temperatures):
-        spd = get_blackbody_spd(t, wl)
-        xyz = np.dot(xyz_cmfs, spd)
-        color_curve[:,i] = (xyz / np.sum(xyz))[:2]
+    spds = get_blackbody_spd(temperatures, wl)
+    color_curve = normalize_columns(np.dot(xyz_cmfs, spds.T))[:2,:]
     ticks = np.array([1500, 3000, 6000, 10000])
     tick_indices = [i for i in xrange(len(temperatures)) \
                     if temperatures[i] in ticks]
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import contextlib
+import json
+import numpy as np
+import os
+import threading
+import time
+
+def add_hook(hook):
+    """Register a function `hook(event)` to be called with each instrumented
+    stage of the color space transforms, once the stage is finished.
+
+    Each `event` is a dict holding:
+      * `"kind"`: `"transform"` for a whole call of a `TransformPlan` (which
+        can contain other transforms, e.g. one per tile), `"step"` for one of
+        its steps (one or more hops of its route), or `"kernel"` for an
+        element-wise kernel called by a step on a chunk of colors (e.g. the
+        sRGB transfer functions, or the nonlinear function of CIE-L*a*b*);
+      * `"name"`: the transform or its hops, e.g. `"CIE-XYZ -> CIE-L*a*b*"`,
+        or the kernel name, e.g. `"lab_f"`;
+      * `"start"` and `"seconds"`: the wall clock time (as in `time.time()`)
+        and the duration of the stage;
+      * `"output_bytes"`: the bytes of the array allocated by the stage for
+        its result, i.e. `0` for stages writing into a given or existing
+        array, not counting the temporaries of the stage;
+      * `"shapes"` and `"dtype"`: the shapes of the array arguments of the
+        stage, and the type of the first one;
+      * `"thread"`: the identifier of the thread running the stage.
+
+    The instrumentation is disabled as long as no hook is registered, and then
+    costs one check per transform and per step.
+
+    """
+    _hooks.append(hook)
+
+def remove_hook(hook):
+    """Unregister a hook registered by `add_hook`."""
+    _hooks.remove(hook)
+
+_hooks = []
+
+class Trace(object):
+    """The events recorded by `trace`, see `add_hook` for their content.
+
+    Attributes
+    ----------
+    events: list of dicts
+        The events in the order their stages finished, which is after the
+        stages they contain.
+
+    start: float
+        The wall clock time at which the trace started.
+
+    """
+    def __init__(self):
+        self.events = []
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        """Add an event, which is the hook registered by `trace`."""
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self):
+        """Aggregate the events by kind and name, returning a dict mapping each
+        `(kind, name)` to the `"count"` of its events and their total
+        `"seconds"` and `"output_bytes"`."""
+        summary = {}
+        for event in self.events:
+            total = summary.setdefault((event["kind"], event["name"]), {
+                "count": 0, "seconds": 0., "output_bytes": 0})
+            total["count"] += 1
+            total["seconds"] += event["seconds"]
+            total["output_bytes"] += event["output_bytes"]
+        return summary
+
+    def export(self, filename, format="json"):
+        """Export the trace into a file, either as `"json"`, i.e. a JSON list of
+        the events with their `"start"` relative to the start of the trace, or
+        as `"chrome"`, i.e. the Trace Event Format of `chrome://tracing` and
+        Perfetto."""
+        with self._lock:
+            events = list(self.events)
+        if format == "json":
+            content = [dict(event, start=event["start"] - self.start)
+                       for event in events]
+        elif format == "chrome":
+            pid = os.getpid()
+            content = {"traceEvents": [{
+                "name": event["name"],
+                "cat": event["kind"],
+                "ph": "X",
+                "ts": (event["start"] - self.start) * 1e6,
+                "dur": event["seconds"] * 1e6,
+                "pid": pid,
+                "tid": event["thread"],
+                "args": {"output_bytes": event["output_bytes"],
+                         "shapes": event["shapes"], "dtype": event["dtype"]},
+            } for event in events]}
+        else:
+            raise Exception("Unknown trace format '%s'." % format)
+        with open(filename, "w") as f:
+            json.dump(content, f, indent=1)
+
+@contextlib.contextmanager
+def trace():
+    """Record the stages of the color space transforms run (by any thread)
+    inside a `with` block, yielding a `Trace`.
+
+    Example::
+
+      with trace() as t:
+          color_space_transform(image, "sRGB", "CIE-L*a*b*")
+      t.export("srgb_to_lab.json", format="chrome")
+
+    """
+    t = Trace()
+    add_hook(t.record)
+    try:
+        yield t
+    finally:
+        remove_hook(t.record)
+
+def record(kind, name, fcn, *args, **kwargs):
+    """Call `fcn(*args, **kwargs)`, and pass its event to the hooks."""
+    start = time.time()
+    result = fcn(*args, **kwargs)
+    seconds = time.time() - start
+    arrays = [arg for arg in list(args) + list(kwargs.values())
+              if isinstance(arg, np.ndarray)]
+    output_bytes = 0
+    if isinstance(result, np.ndarray) and not any(
+            np.may_share_memory(result, array) for array in arrays):
+        output_bytes = result.nbytes
+    event = {
+        "kind": kind,
+        "name": name,
+        "start": start,
+        "seconds": seconds,
+        "output_bytes": output_bytes,
+        "shapes": [list(array.shape) for array in arrays],
+        "dtype": arrays[0].dtype.name if arrays else None,
+        "thread": threading.current_thread().ident,
+    }
+    for hook in list(_hooks):
+        hook(event)
+    return result
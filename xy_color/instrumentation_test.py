@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+import instrumentation
+from color_space_transform import color_space_transform, get_transform
+from instrumentation import *
+
+class InstrumentationTest(unittest.TestCase):
+    def test_trace(self):
+        src_image = np.random.rand(100, 100, 3)
+        with trace() as t:
+            dst_image = color_space_transform(src_image, "CIE-xyY",
+                                              "CIE-L*a*b*")
+        self.assertEqual(instrumentation._hooks, [])
+        check = color_space_transform(src_image, "CIE-xyY", "CIE-L*a*b*")
+        self.assertTrue(np.array_equal(dst_image, check))
+
+        # The steps finish before the transform containing them.
+        events = t.events
+        self.assertEqual([(event["kind"], event["name"])
+                          for event in events if event["kind"] != "kernel"],
+                         [("step", "CIE-xyY -> CIE-XYZ"),
+                          ("step", "CIE-XYZ -> CIE-L*a*b*"),
+                          ("transform", "CIE-xyY -> CIE-L*a*b*")])
+        self.assertEqual(events[-1]["output_bytes"], src_image.nbytes)
+        self.assertEqual(events[-1]["shapes"], [[100, 100, 3]])
+        self.assertEqual(events[-1]["dtype"], "float64")
+        self.assertTrue(all(event["seconds"] >= 0 for event in events))
+        # The element-wise kernels run on chunks of colors.
+        summary = t.summary()
+        self.assertEqual(summary[("kernel", "lab_f")]["count"], 3)
+        self.assertEqual(summary[("kernel", "xyy_to_xyz")]["count"], 1)
+        self.assertEqual(
+            summary[("step", "CIE-xyY -> CIE-XYZ")]["output_bytes"], 0)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, "trace.json")
+            t.export(filename)
+            with open(filename) as f:
+                self.assertEqual(len(json.load(f)), len(events))
+            t.export(filename, format="chrome")
+            with open(filename) as f:
+                chrome_events = json.load(f)["traceEvents"]
+            self.assertEqual(chrome_events[-1]["ph"], "X")
+            self.assertEqual(chrome_events[-1]["cat"], "transform")
+            self.assertRaises(Exception, t.export, filename, "unknown")
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_hooks(self):
+        # The folded matrices are named by the hops they cover.
+        plan = get_transform("sRGB", "AdobeRGB")
+        self.assertEqual(plan.step_names, [
+            "sRGB -> sRGB-linear", "sRGB-linear -> AdobeRGB-linear",
+            "AdobeRGB-linear -> AdobeRGB"])
+        events = []
+        add_hook(events.append)
+        try:
+            # Tiles and integer codes run nested transforms.
+            color_space_transform(np.zeros((30, 3), np.uint8), "sRGB",
+                                  "CIE-XYZ", tile_size=30, channel_axis=1)
+        finally:
+            remove_hook(events.append)
+        names = [event["name"] for event in events
+                 if event["kind"] == "transform"]
+        self.assertEqual(names[-1], "sRGB -> CIE-XYZ")
+        self.assertIn("sRGB-linear -> CIE-XYZ", names)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+
+import hashlib
+import numpy as np
+
+import data
+from color_space_transform import color_space_transform
+from data import _code_max
+from utils import _tile_size, parallel_map, tile_ranges
+
+class ColorLUT(object):
+    """A 3D lookup table approximating the transform between two color spaces.
+
+    The exact `color_space_transform` is evaluated once on a regular
+    `size x size x size` grid covering the `domain` of the source color space,
+    and colors are then converted by interpolating between the grid points,
+    which is much cheaper than running the full chain of kernels. This is mostly
+    useful for 8-bit and 16-bit images, whose precision is well below the
+    interpolation error of a 33- or 65-point table.
+
+    Parameters
+    ----------
+    src_space, dst_space: string
+        Color spaces to be transformed from and to, as in
+        `color_space_transform`.
+
+    size: int
+        Number of grid points along each axis, e.g. 33 or 65.
+
+    domain: ndarray of size `2x3`, optional
+        The lower (first row) and upper (second row) bounds of the grid for
+        each channel of `src_space`. Colors outside of it are clamped to it. It
+        defaults to the usual range of `src_space`, which is `[0, 1]` for the
+        RGB spaces and `[0, 100] x [-128, 127] x [-128, 127]` for CIE-L*a*b*.
+
+    Attributes
+    ----------
+    table: ndarray of size `size x size x size x 3`
+        The transformed grid points, stored as `float32`.
+
+    max_error: dict
+        The maximum absolute error against the exact transform, for each of the
+        `"trilinear"` and `"tetrahedral"` interpolation methods, estimated on
+        random colors in the domain. See `measure_error`.
+
+    """
+    def __init__(self, src_space, dst_space, size=33, domain=None):
+        self.src_space = src_space
+        self.dst_space = dst_space
+        self.size = size
+        self.domain = _get_domain(src_space, domain)
+        grid = np.empty((size, size, size, 3))
+        for c in xrange(3):
+            shape = [1, 1, 1]
+            shape[c] = size
+            grid[...,c] = np.linspace(self.domain[0,c], self.domain[1,c],
+                                      size).reshape(shape)
+        self.table = color_space_transform(
+            grid, src_space, dst_space, channel_axis=-1).astype(np.float32)
+        self.max_error = dict((method, self.measure_error(method))
+                              for method in ("trilinear", "tetrahedral"))
+
+    def __call__(self, src_data, method="trilinear", channel_axis=None,
+                 workers=None):
+        """Convert `src_data` by interpolating in the table.
+
+        Parameters
+        ----------
+        src_data: ndarray
+            The input data, in any of the forms accepted by
+            `color_space_transform`, but without alpha channel. `uint8` and
+            `uint16` data is taken as evenly spaced codes spanning the domain,
+            i.e. `0` and `255` are the lower and upper bounds of a `uint8`
+            channel. Other integer types are taken as values in the domain,
+            like floating point data.
+
+        method: string
+            Either `"trilinear"` (the default, using 8 grid points per color)
+            or `"tetrahedral"` (using 4 grid points per color). Tetrahedral
+            interpolation reads fewer grid points, but it is less accurate on
+            the curved transforms, e.g. about 0.5 against 0.36 of maximum error
+            for the default `"sRGB"` to `"CIE-L*a*b*"` table. See `max_error`.
+
+        channel_axis: int, optional
+            The axis holding the color channels, with the same default as in
+            `color_space_transform`.
+
+        workers: int, optional
+            Number of threads to use, see `utils.parallel_map`.
+
+        Returns
+        -------
+        A `float32` ndarray of the same size as `src_data`.
+
+        """
+        if method not in ("trilinear", "tetrahedral"):
+            raise Exception("Unknown interpolation method '%s'." % method)
+        src_data = np.asarray(src_data)
+        if channel_axis is None:
+            channel_axis = -1 if len(src_data.shape) == 3 else 0
+        src_view = np.moveaxis(src_data, channel_axis, -1)
+        if src_view.shape[-1] != 3:
+            raise ValueError("The data must have 3 color channels.")
+        src_colors = src_view.reshape(-1, 3)
+        dst_colors = np.empty(src_colors.shape, np.float32)
+
+        interpolate = getattr(self, "_interpolate_" + method)
+        if _code_max(src_colors.dtype) is not None:
+            locate = self._code_locator(src_colors.dtype)
+        else:
+            locate = self._locate
+        table = self.table.reshape(-1, 3)
+        def run_tile(tile):
+            start, stop = tile
+            index, frac = locate(src_colors[start:stop])
+            dst_colors[start:stop] = interpolate(table, index, frac)
+        parallel_map(run_tile, tile_ranges(len(src_colors), _tile_size),
+                     workers)
+        return np.moveaxis(dst_colors.reshape(src_view.shape), -1,
+                           channel_axis)
+
+    def _locate(self, colors):
+        """Find the grid cell of each of the `Nx3` colors, returning the flat
+        index of the lower corner of the cell, and the `Nx3` fractional position
+        of the color inside the cell. Colors outside of the domain are clamped
+        to it."""
+        lo, hi = self.domain
+        coords = (colors - lo) * ((self.size - 1.) / (hi - lo))
+        np.clip(coords, 0, self.size - 1, out=coords)
+        base = np.minimum(coords.astype(np.intp), self.size - 2)
+        frac = (coords - base).astype(np.float32)
+        return np.dot(base, self._strides()), frac
+
+    def _code_locator(self, dtype):
+        """Get a function like `_locate` for integer colors of type `dtype`
+        (`uint8` or `uint16`), which looks up the cells and positions of all
+        the codes in per-channel tables instead of computing them."""
+        code_max = _code_max(dtype)
+        codes = np.arange(code_max + 1, dtype=np.float64)
+        coords = codes * ((self.size - 1.) / code_max)
+        base = np.minimum(coords.astype(np.intp), self.size - 2)
+        frac_table = (coords - base).astype(np.float32)
+        index_tables = [base * stride for stride in self._strides()]
+        def locate(colors):
+            index = np.take(index_tables[0], colors[:,0])
+            index += np.take(index_tables[1], colors[:,1])
+            index += np.take(index_tables[2], colors[:,2])
+            return index, np.take(frac_table, colors)
+        return locate
+
+    def _strides(self):
+        """Steps in the flat index along each channel of the table."""
+        return np.array([self.size * self.size, self.size, 1])
+
+    def _interpolate_trilinear(self, table, index, frac):
+        strides = self._strides()
+        result = np.zeros(frac.shape, np.float32)
+        for corner in xrange(8):
+            bits = [(corner >> (2 - c)) & 1 for c in xrange(3)]
+            weight = np.ones(len(frac), np.float32)
+            for c in xrange(3):
+                weight *= frac[:,c] if bits[c] else 1 - frac[:,c]
+            corner_values = np.take(table, index + np.dot(bits, strides),
+                                    axis=0)
+            corner_values *= weight[:,np.newaxis]
+            result += corner_values
+        return result
+
+    def _interpolate_tetrahedral(self, table, index, frac):
+        strides = self._strides()
+        fr, fg, fb = frac.T
+        # The enclosing tetrahedron goes from the lower corner to the upper
+        # corner of the cell, first along the axis of the largest fractional
+        # position, then along the axis of the median one. Ties are broken such
+        # that the axes of the largest and smallest positions always differ.
+        is_max_r = (fr >= fg) & (fr >= fb)
+        is_min_b = (fb <= fg) & (fb <= fr)
+        step_max = np.where(is_max_r, strides[0],
+                            np.where(fg >= fb, strides[1], strides[2]))
+        step_min = np.where(is_min_b, strides[2],
+                            np.where(fg <= fr, strides[1], strides[0]))
+        f_max = np.maximum(np.maximum(fr, fg), fb)
+        f_min = np.minimum(np.minimum(fr, fg), fb)
+        f_mid = fr + fg + fb - f_max - f_min
+        v1 = index + step_max
+        v3 = index + np.sum(strides)
+        v2 = v3 - step_min
+        result = np.take(table, index, axis=0)
+        result *= (1 - f_max)[:,np.newaxis]
+        for v, w in ((v1, f_max - f_mid), (v2, f_mid - f_min), (v3, f_min)):
+            corner_values = np.take(table, v, axis=0)
+            corner_values *= w[:,np.newaxis]
+            result += corner_values
+        return result
+
+    def measure_error(self, method="trilinear", num_samples=100000):
+        """Estimate the maximum absolute error of the table against the exact
+        `color_space_transform`, on `num_samples` random colors (with a fixed
+        seed) uniformly distributed in the domain."""
+        rng = np.random.RandomState(0)
+        lo, hi = self.domain
+        src_colors = lo + rng.rand(num_samples, 3) * (hi - lo)
+        exact = color_space_transform(src_colors, self.src_space,
+                                      self.dst_space, channel_axis=-1)
+        approx = self(src_colors, method, channel_axis=-1)
+        return float(np.max(np.abs(approx - exact)))
+
+    def save(self, filename):
+        """Save the table into a `.npz` file, which can be loaded by `load`."""
+        with data._open_atomic(filename) as f:
+            np.savez(f, src_space=self.src_space, dst_space=self.dst_space,
+                     domain=self.domain, table=self.table,
+                     max_error_methods=sorted(self.max_error),
+                     max_error_values=[self.max_error[k]
+                                       for k in sorted(self.max_error)])
+
+    @classmethod
+    def load(cls, filename):
+        """Load a table saved by `save`."""
+        npz = np.load(filename)
+        lut = cls.__new__(cls)
+        lut.src_space = str(npz["src_space"])
+        lut.dst_space = str(npz["dst_space"])
+        lut.domain = npz["domain"]
+        lut.table = npz["table"]
+        lut.size = lut.table.shape[0]
+        lut.max_error = dict(zip([str(k) for k in npz["max_error_methods"]],
+                                 [float(v) for v in npz["max_error_values"]]))
+        return lut
+
+def get_lut(src_space, dst_space, size=33, domain=None):
+    """Get a `ColorLUT`, which is cached both in memory and on disk.
+
+    The tables are stored as `.npz` files in the `lut` sub-directory of
+    `data.cache_path`, so that each one is only computed once per machine.
+
+    Example::
+
+      lut = get_lut("sRGB", "CIE-L*a*b*", size=65)
+      print(lut.max_error)
+      lab = lut(uint8_image)
+
+    """
+    domain = _get_domain(src_space, domain)
+    key = (src_space, dst_space, size, tuple(domain.flatten()))
+    return data._get_cached(
+        _luts, key, "lut", "%s_%s_%d_%s.npz" % (
+            _file_safe(src_space), _file_safe(dst_space), size,
+            hashlib.md5(repr(key).encode("utf-8")).hexdigest()[:8]),
+        ColorLUT.load,
+        lambda lut: (lut.src_space, lut.dst_space, lut.size) == key[:3] and
+                    np.array_equal(lut.domain, domain),
+        lambda: ColorLUT(src_space, dst_space, size, domain))
+
+_luts = {}
+
+def _get_domain(src_space, domain):
+    """Get the domain as a `2x3` ndarray, using the default one if not
+    provided."""
+    if domain is None:
+        if src_space not in _default_domain:
+            raise Exception("Please provide the domain for '%s'." % src_space)
+        domain = _default_domain[src_space]
+    domain = np.array(domain, dtype=np.float64)
+    assert domain.shape == (2, 3)
+    return domain
+
+def _file_safe(name):
+    return "".join(c if c.isalnum() else "-" for c in name)
+
+# The default domains of the color spaces, see `ColorLUT`.
+_default_domain = {
+    "CIE-XYZ": [[0., 0., 0.], [1., 1., 1.1]],
+    "CIE-xyY": [[0., 0., 0.], [1., 1., 1.]],
+    "sRGB-linear": [[0., 0., 0.], [1., 1., 1.]],
+    "sRGB": [[0., 0., 0.], [1., 1., 1.]],
+    "AdobeRGB-linear": [[0., 0., 0.], [1., 1., 1.]],
+    "AdobeRGB": [[0., 0., 0.], [1., 1., 1.]],
+    "CIE-L*a*b*": [[0., -128., -128.], [100., 127., 127.]],
+}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import numpy as np
+import os
+import unittest
+
+import data
+from color_space_transform import color_space_transform
+from lut import *
+from test_utils import TemporaryCacheMixin
+
+class LUTTest(TemporaryCacheMixin, unittest.TestCase):
+    def test_color_lut(self):
+        lut = ColorLUT("sRGB", "CIE-L*a*b*", size=17)
+        self.assertEqual(lut.table.shape, (17, 17, 17, 3))
+
+        # The grid points are exact (up to float32 precision).
+        grid = np.array([[0.0, 0.5, 1.0], [0.25, 0.75, 0.0]]).T
+        exact = color_space_transform(grid, "sRGB", "CIE-L*a*b*")
+        for method in ("trilinear", "tetrahedral"):
+            self.assertTrue(np.max(np.abs(lut(grid, method) - exact)) < 1.0e-4)
+
+        # The reported error bounds the error on other colors.
+        src_data = np.random.rand(3, 1000)
+        exact = color_space_transform(src_data, "sRGB", "CIE-L*a*b*")
+        for method in ("trilinear", "tetrahedral"):
+            self.assertTrue(lut.max_error[method] < 5.0)
+            error = np.max(np.abs(lut(src_data, method) - exact))
+            self.assertTrue(error <= lut.max_error[method] * 1.5)
+
+        # Images, including integer ones.
+        src_image = (np.random.rand(5, 6, 3) * 255).astype(np.uint8)
+        exact = color_space_transform(src_image / 255., "sRGB", "CIE-L*a*b*")
+        approx = lut(src_image, workers=2)
+        self.assertEqual(approx.shape, (5, 6, 3))
+        self.assertTrue(np.max(np.abs(approx - exact)) <=
+                        lut.max_error["trilinear"] * 1.5)
+
+        # Other integer types are taken as values, like floating point data,
+        # and clamped to the domain.
+        src_data = np.array([[0, 1, 127], [1, 0, 1], [-1, 0, 1]]).T
+        expected = lut(np.clip(src_data, 0, 1).astype(np.float64))
+        for dtype in (np.int64, np.int16, np.int8):
+            check = lut(src_data.astype(dtype))
+            self.assertTrue(np.array_equal(check, expected))
+
+    def test_get_lut(self):
+        lut = get_lut("sRGB", "sRGB-linear", size=9)
+        self.assertIs(lut, get_lut("sRGB", "sRGB-linear", size=9))
+        lut_files = os.listdir(os.path.join(data.cache_path, "lut"))
+        self.assertEqual(len(lut_files), 1)
+
+        # Load from the disk cache.
+        lut2 = ColorLUT.load(os.path.join(data.cache_path, "lut", lut_files[0]))
+        self.assertTrue(np.all(lut.table == lut2.table))
+        self.assertEqual(lut.max_error, lut2.max_error)
+        self.assertEqual(lut2.src_space, "sRGB")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+import hashlib
+import numpy as np
+
+from scipy.spatial import cKDTree
+
+import data
+from color_space_transform import color_space_transform
+from data import _code_max, _open_atomic
+from utils import _tile_size, parallel_map, tile_ranges
+
+class PaletteIndex(object):
+    """An index of the colors of a palette, for finding the nearest palette
+    colors of whole images.
+
+    The palette is converted into CIE-L*a*b* once, and stored in a KD-tree, so
+    that finding the nearest palette color of each pixel takes logarithmic
+    instead of linear time in the size of the palette, without any distance
+    matrix between pixels and palette colors. The distances are the CIE76
+    color differences, i.e. Euclidean distances in CIE-L*a*b*.
+
+    Parameters
+    ----------
+    palette: ndarray
+        The palette colors, as a `3xK` matrix or any other array with the color
+        channels along the `channel_axis`.
+
+    color_space: string, optional
+        Color space of `palette`, which is also the default color space of the
+        queried data.
+
+    channel_axis: int, optional
+        The axis of `palette` holding the color channels, with the same default
+        as in `color_space_transform`.
+
+    Attributes
+    ----------
+    palette: ndarray of size `Kx3`
+        The palette colors in `color_space`.
+
+    palette_lab: ndarray of size `Kx3`
+        The palette colors in CIE-L*a*b*.
+
+    tree: scipy.spatial.cKDTree
+        The KD-tree of `palette_lab`.
+
+    """
+    def __init__(self, palette, color_space="sRGB", channel_axis=None):
+        palette = np.asarray(palette)
+        if channel_axis is None:
+            channel_axis = -1 if len(palette.shape) == 3 else 0
+        self.palette = np.moveaxis(palette, channel_axis, -1).reshape(-1, 3)
+        self.color_space = color_space
+        self.palette_lab = color_space_transform(
+            self.palette, color_space, "CIE-L*a*b*", dtype=np.float64,
+            channel_axis=-1)
+        self.tree = cKDTree(self.palette_lab)
+
+    def query(self, src_data, k=1, color_space=None, channel_axis=None,
+              workers=None):
+        """Find the `k` nearest palette colors of each color of `src_data`.
+
+        Parameters
+        ----------
+        src_data: ndarray
+            The input data, in any of the forms accepted by
+            `color_space_transform` but without alpha channel, e.g. a `3xN`
+            matrix or an `MxNx3` image. For `uint8` and `uint16` data, each
+            distinct color is only looked up once.
+
+        k: int, optional
+            Number of nearest palette colors to find.
+
+        color_space: string, optional
+            Color space of `src_data`, which defaults to the one of the palette.
+
+        channel_axis: int, optional
+            The axis of `src_data` holding the color channels, with the same
+            default as in `color_space_transform`.
+
+        workers: int, optional
+            Number of threads to use, see `utils.parallel_map`.
+
+        Returns
+        -------
+        distances: ndarray
+            The CIE76 color differences to the nearest palette colors, of the
+            shape of `src_data` without the color channels, plus a last axis of
+            size `k` if `k > 1`. They are sorted in increasing order.
+
+        indices: ndarray
+            The indices of the nearest palette colors, in the same shape as
+            `distances`.
+
+        """
+        if color_space is None:
+            color_space = self.color_space
+        src_data = np.asarray(src_data)
+        if channel_axis is None:
+            channel_axis = -1 if len(src_data.shape) == 3 else 0
+        src_view = np.moveaxis(src_data, channel_axis, -1)
+        if src_view.shape[-1] != 3:
+            raise ValueError("The data must have 3 color channels.")
+        src_colors = src_view.reshape(-1, 3)
+        inverse = None
+        if _code_max(src_colors.dtype) is not None:
+            src_colors, inverse = _unique_colors(src_colors)
+
+        shape = (len(src_colors),) + ((k,) if k > 1 else ())
+        distances = np.empty(shape)
+        indices = np.empty(shape, np.intp)
+        def run_tile(tile):
+            start, stop = tile
+            lab = color_space_transform(
+                src_colors[start:stop], color_space, "CIE-L*a*b*",
+                dtype=np.float64, channel_axis=-1)
+            distances[start:stop], indices[start:stop] = self.tree.query(lab, k)
+        parallel_map(run_tile, tile_ranges(len(src_colors), _tile_size),
+                     workers)
+        if inverse is not None:
+            distances = np.take(distances, inverse, axis=0)
+            indices = np.take(indices, inverse, axis=0)
+        shape = src_view.shape[:-1] + shape[1:]
+        return distances.reshape(shape), indices.reshape(shape)
+
+    def quantize(self, src_data, color_space=None, channel_axis=None,
+                 workers=None):
+        """Replace each color of `src_data` by its nearest palette color, with
+        the same options as in `query`, returning an array of the same size as
+        `src_data` in the color space of the palette."""
+        src_data = np.asarray(src_data)
+        if channel_axis is None:
+            channel_axis = -1 if len(src_data.shape) == 3 else 0
+        indices = self.query(src_data, 1, color_space, channel_axis,
+                             workers)[1]
+        return np.moveaxis(np.take(self.palette, indices, axis=0), -1,
+                           channel_axis)
+
+    def save(self, filename):
+        """Save the index into a `.npz` file, which can be loaded by `load`."""
+        with _open_atomic(filename) as f:
+            np.savez(f, color_space=self.color_space, palette=self.palette,
+                     palette_lab=self.palette_lab)
+
+    @classmethod
+    def load(cls, filename):
+        """Load an index saved by `save`, without converting the palette
+        again."""
+        npz = np.load(filename)
+        index = cls.__new__(cls)
+        index.color_space = str(npz["color_space"])
+        index.palette = npz["palette"]
+        index.palette_lab = npz["palette_lab"]
+        index.tree = cKDTree(index.palette_lab)
+        return index
+
+def get_palette_index(palette, color_space="sRGB", channel_axis=None):
+    """Get a `PaletteIndex`, which is cached both in memory and on disk.
+
+    The indices are stored as `.npz` files in the `palette` sub-directory of
+    `data.cache_path`, named by a hash of the palette colors.
+
+    Example::
+
+      index = get_palette_index(brand_colors)
+      distances, indices = index.query(uint8_image)
+
+    """
+    palette = np.asarray(palette)
+    if channel_axis is None:
+        channel_axis = -1 if len(palette.shape) == 3 else 0
+    palette = np.ascontiguousarray(
+        np.moveaxis(palette, channel_axis, -1).reshape(-1, 3))
+    digest = hashlib.md5(palette.tobytes() + repr(
+        (color_space, palette.dtype.str)).encode("utf-8")).hexdigest()
+    return data._get_cached(
+        _palette_indices, digest, "palette", "%s.npz" % digest,
+        PaletteIndex.load,
+        lambda index: index.color_space == color_space and
+                      np.array_equal(index.palette, palette),
+        lambda: PaletteIndex(palette, color_space, channel_axis=-1))
+
+_palette_indices = {}
+
+def _unique_colors(colors):
+    """Find the distinct colors of the `Nx3` integer `colors`, returning them
+    and the index of each color in them."""
+    base = int(np.iinfo(colors.dtype).max) + 1
+    keys = colors[:,0].astype(np.int64)
+    keys *= base
+    keys += colors[:,1]
+    keys *= base
+    keys += colors[:,2]
+    keys, inverse = np.unique(keys, return_inverse=True)
+    unique_colors = np.empty((len(keys), 3), colors.dtype)
+    for c in (2, 1, 0):
+        unique_colors[:,c] = keys % base
+        keys //= base
+    return unique_colors, inverse
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+import numpy as np
+import os
+import unittest
+
+import data
+from color_space_transform import color_space_transform
+from palette import *
+from test_utils import TemporaryCacheMixin
+
+class PaletteTest(TemporaryCacheMixin, unittest.TestCase):
+    def test_palette_index(self):
+        palette = np.random.rand(3, 200)
+        index = PaletteIndex(palette)
+        self.assertEqual(index.palette.shape, (200, 3))
+
+        # Compare with the brute-force search, on float and uint8 images.
+        image = np.random.randint(0, 256, (20, 30, 3)).astype(np.uint8)
+        image[:10] = image[10:]
+        lab = color_space_transform(image, "sRGB", "CIE-L*a*b*")
+        all_distances = np.sqrt(np.sum(
+            (lab[:,:,np.newaxis,:] - index.palette_lab) ** 2, axis=-1))
+        for src_data in (image, image / 255.0):
+            distances, indices = index.query(src_data)
+            self.assertEqual(indices.shape, (20, 30))
+            self.assertTrue(np.all(indices == np.argmin(all_distances, -1)))
+            self.assertTrue(np.max(np.abs(
+                distances - np.min(all_distances, -1))) < 1e-9)
+        distances, indices = index.query(image, k=3, workers=2)
+        self.assertEqual(indices.shape, (20, 30, 3))
+        self.assertTrue(np.all(np.diff(distances, axis=-1) >= 0))
+        self.assertTrue(np.all(
+            np.sort(all_distances, -1)[...,:3] - distances < 1e-9))
+
+        # Query in another color space, and with channels first.
+        xyz = color_space_transform(image, "sRGB", "CIE-XYZ")
+        self.assertTrue(np.all(index.query(
+            xyz, color_space="CIE-XYZ")[1] == indices[...,0]))
+        self.assertTrue(np.all(index.query(
+            np.moveaxis(image, -1, 0), channel_axis=0)[1] == indices[...,0]))
+
+        # Quantize into the palette colors.
+        quantized = index.quantize(image)
+        self.assertEqual(quantized.shape, (20, 30, 3))
+        self.assertTrue(np.all(quantized == palette.T[indices[...,0]]))
+        self.assertTrue(np.all(index.quantize(palette) == palette))
+
+    def test_save_and_cache(self):
+        palette = np.random.randint(0, 256, (3, 50)).astype(np.uint8)
+        index = get_palette_index(palette)
+        self.assertIs(get_palette_index(palette), index)
+        filename = os.path.join(data.cache_path, "palette",
+                                os.listdir(os.path.join(data.cache_path,
+                                                        "palette"))[0])
+        loaded = PaletteIndex.load(filename)
+        self.assertEqual(loaded.color_space, "sRGB")
+        self.assertTrue(np.all(loaded.palette == index.palette))
+        image = np.random.rand(10, 10, 3)
+        self.assertTrue(np.all(loaded.query(image)[1] ==
+                               index.query(image)[1]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from color_space_transform import color_space_transform
+from data import _float_dtype, load_fw
+from utils import parallel_map, tile_ranges
+
+class SpectralIntegrator(object):
+    """Convert spectral data, e.g. hyperspectral images, into colors.
+
+    The spectra are integrated against the CIE-XYZ color matching functions,
+    optionally weighted by an illuminant, as a single matrix product with a
+    precomputed `Lx3` matrix of `weights` for `L` wavelengths. Large cubes
+    (such as memory-mapped ones) are processed in tiles, so that only a tile of
+    spectra is converted to floating point at a time, and the tiles can be
+    converted by several threads.
+
+    Parameters
+    ----------
+    wl: ndarray
+        The wavelengths of the spectra in nm, which need not be evenly spaced.
+
+    illuminant: str or ndarray, optional
+        For reflectance spectra, the illuminant, as a name in `data.load_fw`
+        (e.g. `"d65-spd"`) or a spectral power distribution sampled at `wl`.
+        For radiance spectra, `None`.
+
+    cmfs: str, optional
+        The name of the XYZ color matching functions in `data.load_fw`, which
+        are resampled at `wl`.
+
+    normalize: bool, optional
+        If `True`, the colors are scaled such that `Y = 1` for a perfect
+        reflector under the illuminant, or for an equal-energy radiance of 1
+        without illuminant, e.g. to be the D65 white of sRGB. Otherwise, they
+        are the integrals of the spectra (times the illuminant) against the
+        color matching functions over wavelengths in nm.
+
+    Attributes
+    ----------
+    weights: ndarray of size `Lx3`
+        The weight of each wavelength for each of X, Y and Z, including the
+        illuminant, the wavelength intervals (by the trapezoidal rule) and the
+        normalization.
+
+    """
+    def __init__(self, wl, illuminant=None, cmfs="xyz-cmfs", normalize=True):
+        self.wl = np.asarray(wl, dtype=np.float64)
+        if len(self.wl) < 2:
+            raise ValueError("The spectra need at least 2 wavelengths.")
+        xyz_cmfs = load_fw(cmfs, self.wl)[0]
+        weights = xyz_cmfs.T * _trapezoid_weights(self.wl)[:,None]
+        if illuminant is not None:
+            if isinstance(illuminant, basestring):
+                illuminant = load_fw(illuminant, self.wl)[0]
+            illuminant = np.asarray(illuminant, dtype=np.float64)
+            if illuminant.shape != self.wl.shape:
+                raise ValueError("The illuminant must be sampled at `wl`.")
+            weights *= illuminant[:,None]
+        if normalize:
+            weights /= np.sum(weights[:,1])
+        self.weights = weights
+
+    def __call__(self, src_data, dst_space="CIE-XYZ", spectral_axis=-1,
+                 out=None, dtype=None, tile_size=None, workers=None):
+        """Convert the spectra of `src_data` into colors.
+
+        Parameters
+        ----------
+        src_data: ndarray
+            The spectra, with the wavelengths along the `spectral_axis`, e.g. an
+            `MxNxL` cube. It can be a `numpy.memmap` of any layout, of which
+            only a tile is read into memory at a time.
+
+        dst_space: string, optional
+            The color space of the result, as in `color_space_transform`, e.g.
+            `"CIE-XYZ"`, `"sRGB"` or `"CIE-L*a*b*"`.
+
+        spectral_axis: int, optional
+            The axis of `src_data` holding the spectra.
+
+        out: ndarray, optional
+            A preallocated array to write the result into, of the shape of the
+            result.
+
+        dtype: numpy dtype, optional
+            The data type of the result, as in `color_space_transform`, e.g.
+            `np.uint8` for an 8-bit sRGB image. It defaults to `float32` for
+            `float32` spectra, and to `float64` otherwise, which is also the
+            type of the computations.
+
+        tile_size: int, optional
+            Number of spectra converted at a time, which defaults to about
+            `_tile_bytes` bytes of floating point spectra.
+
+        workers: int, optional
+            Number of threads to use, see `utils.parallel_map`.
+
+        Returns
+        -------
+        dst_data: ndarray
+            The colors, of the shape of `src_data` with the color channels in
+            place of the spectral axis, e.g. an `MxNx3` image.
+
+        """
+        src_data = np.asarray(src_data)
+        src_view = np.moveaxis(src_data, spectral_axis, -1)
+        num_wl = len(self.wl)
+        if src_view.shape[-1] != num_wl:
+            raise ValueError("The spectra must have %d wavelengths." % num_wl)
+        if dtype is not None and np.dtype(dtype).kind == "f":
+            float_dtype = np.dtype(dtype)
+        else:
+            float_dtype = _float_dtype(src_data)
+        if dtype is None:
+            dtype = float_dtype
+        shape = src_view.shape[:-1] + (3,)
+        if out is None:
+            dst_data = np.empty(shape, dtype)
+        else:
+            dst_data = np.moveaxis(out, spectral_axis, -1)
+            if dst_data.shape != shape:
+                raise ValueError("The output must have the shape of the "
+                                 "result.")
+        if len(shape) == 1:
+            src_view = src_view[None]
+            dst_view = dst_data[None]
+        else:
+            dst_view = dst_data
+        weights = self.weights.astype(float_dtype)
+
+        # Tile along the first axis of the spectra, so that each tile is a
+        # view of `src_data` whatever its layout.
+        if tile_size is None:
+            tile_size = _tile_bytes // (num_wl * float_dtype.itemsize)
+        row_size = max(int(np.prod(src_view.shape[1:-1])), 1)
+        def run_tile(tile):
+            start, stop = tile
+            spectra = src_view[start:stop].reshape(-1, num_wl).astype(
+                float_dtype, copy=False)
+            xyz = np.dot(spectra, weights)
+            if dst_space != "CIE-XYZ" or dst_view.dtype != float_dtype:
+                xyz = color_space_transform(xyz, "CIE-XYZ", dst_space,
+                                            dtype=dst_view.dtype,
+                                            channel_axis=-1)
+            dst_view[start:stop] = xyz.reshape(dst_view[start:stop].shape)
+        parallel_map(run_tile, tile_ranges(
+            len(src_view), max(tile_size // row_size, 1)), workers)
+        if out is not None:
+            return out
+        return np.moveaxis(dst_data, -1, spectral_axis)
+
+def spectral_to_color(src_data, wl, dst_space="CIE-XYZ", illuminant=None,
+                      spectral_axis=-1, dtype=None, workers=None):
+    """Convert spectra into colors, see `SpectralIntegrator`.
+
+    Example::
+
+      cube = np.load("reflectance.npy", mmap_mode="r")
+      srgb = spectral_to_color(cube, np.arange(400, 721, 10), "sRGB",
+                               illuminant="d65-spd", dtype=np.uint8,
+                               workers=4)
+
+    """
+    return SpectralIntegrator(wl, illuminant)(
+        src_data, dst_space, spectral_axis, dtype=dtype, workers=workers)
+
+def _trapezoid_weights(wl):
+    """The weights of the trapezoidal rule for integrating over `wl`."""
+    steps = np.diff(wl)
+    weights = np.zeros(len(wl))
+    weights[:-1] += steps / 2
+    weights[1:] += steps / 2
+    return weights
+
+# Number of bytes of floating point spectra converted at a time, to bound the
+# memory of temporaries.
+_tile_bytes = 2 ** 24
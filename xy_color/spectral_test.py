@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from xy_python_utils.unittest_utils import check_near
+
+from color_space_transform import color_space_transform
+from data import load_fw
+from spectral import *
+from test_utils import TemporaryCacheMixin
+
+class SpectralTest(TemporaryCacheMixin, unittest.TestCase):
+    def test_spectral_integrator(self):
+        # A perfect reflector under D65 is the white of sRGB.
+        wl = np.arange(400, 721, 10)
+        integrator = SpectralIntegrator(wl, "d65-spd")
+        self.assertEqual(integrator.weights.shape, (len(wl), 3))
+        check_near(integrator(np.ones(len(wl)), "sRGB"), np.ones(3), 3e-3)
+        self.assertRaises(ValueError, integrator, np.ones(len(wl) + 1))
+        self.assertTrue(np.array_equal(
+            SpectralIntegrator(wl, u"d65-spd").weights, integrator.weights))
+
+        # The same as integrating the spectra on the 1 nm grid of the CMFs.
+        xyz_cmfs, wl_1nm = load_fw("xyz-cmfs")
+        d65_spd = load_fw("d65-spd", wl_1nm)[0]
+        spd = np.exp(-((wl_1nm - 550) / 50.) ** 2)
+        expected = np.dot(xyz_cmfs, spd * d65_spd) / np.dot(xyz_cmfs[1],
+                                                            d65_spd)
+        check_near(SpectralIntegrator(wl_1nm, "d65-spd")(spd), expected, 1e-3)
+
+        # Images with the spectra along any axis, in tiles and threads.
+        cube = np.random.rand(20, 30, len(wl)).astype(np.float32)
+        xyz = integrator(cube)
+        self.assertEqual(xyz.shape, (20, 30, 3))
+        self.assertEqual(xyz.dtype, np.float32)
+        check_near(xyz, np.dot(cube.astype(np.float64), integrator.weights),
+                   1e-5)
+        lab = color_space_transform(xyz, "CIE-XYZ", "CIE-L*a*b*")
+        check_near(integrator(cube, "CIE-L*a*b*", tile_size=7, workers=3),
+                   lab, 1e-3)
+        bsq = np.ascontiguousarray(np.moveaxis(cube, -1, 0))
+        out = np.empty((3, 20, 30), np.float32)
+        self.assertIs(integrator(bsq, spectral_axis=0, out=out, tile_size=50),
+                      out)
+        check_near(np.moveaxis(out, 0, -1), xyz, 1e-6)
+        srgb = integrator(cube, "sRGB", dtype=np.uint8)
+        self.assertEqual(srgb.dtype, np.uint8)
+        self.assertTrue(np.all(srgb == color_space_transform(
+            xyz, "CIE-XYZ", "sRGB", dtype=np.uint8)))
+
+    def test_memmap(self):
+        wl = np.linspace(380, 780, 41)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, "cube.npy")
+            cube = np.random.rand(40, 50, len(wl))
+            np.save(filename, cube)
+            srgb = spectral_to_color(np.load(filename, mmap_mode="r"), wl,
+                                     "sRGB", illuminant="d65-spd", workers=2)
+            self.assertTrue(np.array_equal(srgb, spectral_to_color(
+                cube, wl, "sRGB", illuminant="d65-spd")))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    unittest.main()
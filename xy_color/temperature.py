@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+
+import hashlib
+import numpy as np
+
+import data
+from color_space_transform import color_space_transform
+from data import _open_atomic, get_blackbody_spd, load_fw
+from utils import _tile_size, parallel_map, tile_ranges
+
+class PlanckianLocus(object):
+    """A table of the colors of blackbody radiation over a range of
+    temperatures, i.e. the Planckian locus, for converting temperatures into
+    colors by interpolation, and colors into correlated color temperatures.
+
+    The colors are computed once from the blackbody spectral power
+    distributions of `size` temperatures, evenly spaced in reciprocal
+    temperature (mired, i.e. `1e6 / T`) along which the locus is smooth, so
+    that converting a temperature takes a constant time, without any spectral
+    integration. The locus is also tabulated in the CIE 1960 UCS uv
+    chromaticity diagram, where the correlated color temperatures are defined.
+
+    Parameters
+    ----------
+    t_min, t_max: float
+        The range of temperatures in Kelvin.
+
+    size: int
+        Number of temperatures in the table.
+
+    cmfs: str
+        The name of the XYZ color matching functions in `data.load_fw`.
+
+    Attributes
+    ----------
+    temperatures: ndarray of size `size`
+        The temperatures of the table, in decreasing order.
+
+    table: ndarray of size `size x 3`
+        The CIE-XYZ colors of the temperatures, normalized to `Y = 1`.
+
+    max_error: float
+        The maximum absolute error of the interpolated xy chromaticity
+        coordinates against the exact ones, estimated halfway between the
+        temperatures of the table.
+
+    uv: ndarray of size `size x 2`
+        The CIE 1960 uv chromaticity coordinates of the table.
+
+    tangents: ndarray of size `size x 2`
+        The unit tangents of the locus at `uv`, towards lower temperatures,
+        i.e. the normals of the isotemperature lines.
+
+    """
+    def __init__(self, t_min=1000., t_max=25000., size=4096,
+                 cmfs="xyz-cmfs"):
+        self.t_min = float(t_min)
+        self.t_max = float(t_max)
+        self.size = size
+        self.cmfs = cmfs
+        self.temperatures = 1e6 / np.linspace(
+            1e6 / self.t_max, 1e6 / self.t_min, size)
+        self.table = _blackbody_xyz(self.temperatures, cmfs)
+        self._index()
+        mid_temperatures = 2 / (1 / self.temperatures[1:] +
+                                1 / self.temperatures[:-1])
+        self.max_error = float(np.max(np.abs(
+            _xy(self.xyz(mid_temperatures)) -
+            _xy(_blackbody_xyz(mid_temperatures, cmfs).T))))
+
+    def xyz(self, temperature):
+        """Convert temperatures into CIE-XYZ colors normalized to `Y = 1`, by
+        linear interpolation in reciprocal temperature.
+
+        Parameters
+        ----------
+        temperature: float or ndarray
+            The temperatures in Kelvin. The ones out of `[t_min, t_max]` are
+            converted to NaN.
+
+        Returns
+        -------
+        xyz: ndarray
+            The colors, with the channels along the first axis, i.e. of shape
+            `(3,) + temperature.shape`.
+
+        """
+        temperature = np.asarray(temperature, dtype=np.float64)
+        step = (1e6 / self.t_min - 1e6 / self.t_max) / (self.size - 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            outside = ~((temperature >= self.t_min) &
+                        (temperature <= self.t_max))
+            position = (1e6 / temperature - 1e6 / self.t_max) / step
+        position = np.where(outside, 0, position)
+        index = np.clip(np.floor(position), 0, self.size - 2).astype(np.intp)
+        weight = (position - index)[...,None]
+        xyz = self.table[index] * (1 - weight) + self.table[index + 1] * weight
+        return np.moveaxis(np.where(outside[...,None], np.nan, xyz), -1, 0)
+
+    def __call__(self, temperature, color_space="CIE-xyY"):
+        """Convert temperatures into colors of `color_space`, as in `xyz`, e.g.
+        into their xy chromaticity coordinates (and `Y = 1`) with the default
+        `"CIE-xyY"`. The linear and the gamma-corrected RGB values of the
+        brightest temperatures can exceed 1, and need to be scaled by the
+        caller for display."""
+        xyz = self.xyz(temperature)
+        if color_space == "CIE-XYZ":
+            return xyz
+        outside = np.isnan(xyz)
+        colors = color_space_transform(
+            np.where(outside, 0, xyz).reshape(3, -1), "CIE-XYZ",
+            color_space).reshape(xyz.shape)
+        return np.where(outside, np.nan, colors)
+
+    def cct(self, src_data, color_space="CIE-XYZ", channel_axis=None,
+            workers=None):
+        """Estimate the correlated color temperature (CCT) and the distance to
+        the Planckian locus (Duv) of each color of `src_data`.
+
+        The CCT is the temperature of the nearest point of the locus in the
+        CIE 1960 uv chromaticity diagram, i.e. of the isotemperature line (the
+        normal of the locus) going through the color. As in Robertson's method,
+        it is interpolated in reciprocal temperature between the two lines of
+        the table around the color, which are found by bisection for all the
+        colors at once, in `log2(size)` steps.
+
+        Parameters
+        ----------
+        src_data: ndarray
+            The input data, in any of the forms accepted by
+            `color_space_transform` but without alpha channel, e.g. a `3xN`
+            matrix or an `MxNx3` image. For `"CIE-xyY"` only the xy
+            chromaticity coordinates are used.
+
+        color_space: string, optional
+            Color space of `src_data`.
+
+        channel_axis: int, optional
+            The axis of `src_data` holding the color channels, with the same
+            default as in `color_space_transform`.
+
+        workers: int, optional
+            Number of threads to use, see `utils.parallel_map`.
+
+        Returns
+        -------
+        cct: ndarray
+            The correlated color temperatures in Kelvin, of the shape of
+            `src_data` without the color channels. They are NaN for black, and
+            for the colors beyond the isotemperature lines of `t_min` and
+            `t_max`. CIE 015:2004 considers them meaningful only
+            within `|Duv| < 0.05`.
+
+        duv: ndarray
+            The signed distances to the locus in the uv chromaticity diagram,
+            positive above the locus (i.e. towards green) and negative below it
+            (towards magenta), in the same shape as `cct`.
+
+        """
+        src_data = np.asarray(src_data)
+        if channel_axis is None:
+            channel_axis = -1 if len(src_data.shape) == 3 else 0
+        src_view = np.moveaxis(src_data, channel_axis, -1)
+        if src_view.shape[-1] != 3:
+            raise ValueError("The data must have 3 color channels.")
+        src_colors = src_view.reshape(-1, 3)
+
+        cct = np.empty(len(src_colors))
+        duv = np.empty(len(src_colors))
+        mired = 1e6 / self.temperatures
+        def run_tile(tile):
+            start, stop = tile
+            if color_space == "CIE-xyY":
+                uv = _xy_to_uv(src_colors[start:stop,:2].astype(np.float64))
+            else:
+                uv = _uv(color_space_transform(
+                    src_colors[start:stop], color_space, "CIE-XYZ",
+                    dtype=np.float64, channel_axis=-1))
+            valid = np.all(np.isfinite(uv), axis=1)
+            uv[~valid] = 0
+            # The signed distance of the colors along the locus from its
+            # `index`-th point, which decreases along the table.
+            def distance(index):
+                return np.sum((uv - self.uv[index]) * self.tangents[index],
+                              axis=1)
+            lo = np.zeros(len(uv), np.intp)
+            hi = np.full(len(uv), self.size - 1, np.intp)
+            valid &= (distance(lo) >= 0) & (distance(hi) <= 0)
+            for _ in xrange(int(np.ceil(np.log2(self.size - 1)))):
+                mid = (lo + hi) // 2
+                after = distance(mid) >= 0
+                lo = np.where(after, mid, lo)
+                hi = np.where(after, hi, mid)
+            d_lo, d_hi = distance(lo), distance(hi)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                weight = np.where(d_lo > d_hi, d_lo / (d_lo - d_hi), 0)
+            tile_cct = 1e6 / (mired[lo] + weight * (mired[hi] - mired[lo]))
+            # The distances to the locus along the two isotemperature lines,
+            # positive on the left of the locus.
+            def offset(index):
+                return np.cross(self.tangents[index], uv - self.uv[index])
+            tile_duv = offset(lo) * (1 - weight) + offset(hi) * weight
+            tile_cct[~valid] = np.nan
+            tile_duv[~valid] = np.nan
+            cct[start:stop] = tile_cct
+            duv[start:stop] = tile_duv
+        parallel_map(run_tile, tile_ranges(len(src_colors), _tile_size),
+                     workers)
+        shape = src_view.shape[:-1]
+        return cct.reshape(shape), duv.reshape(shape)
+
+    def save(self, filename):
+        """Save the table into a `.npz` file, which can be loaded by `load`."""
+        with _open_atomic(filename) as f:
+            np.savez(f, t_range=[self.t_min, self.t_max], cmfs=self.cmfs,
+                     table=self.table, max_error=self.max_error)
+
+    @classmethod
+    def load(cls, filename):
+        """Load a table saved by `save`, without computing it again."""
+        npz = np.load(filename)
+        locus = cls.__new__(cls)
+        locus.t_min, locus.t_max = [float(t) for t in npz["t_range"]]
+        locus.cmfs = str(npz["cmfs"])
+        locus.table = npz["table"]
+        locus.size = len(locus.table)
+        locus.temperatures = 1e6 / np.linspace(
+            1e6 / locus.t_max, 1e6 / locus.t_min, locus.size)
+        locus.max_error = float(npz["max_error"])
+        locus._index()
+        return locus
+
+    def _index(self):
+        self.uv = _uv(self.table)
+        self.tangents = np.gradient(self.uv, axis=0, edge_order=2)
+        self.tangents /= np.sqrt(np.sum(self.tangents ** 2, axis=1))[:,None]
+
+def get_planckian_locus(t_min=1000., t_max=25000., size=4096,
+                        cmfs="xyz-cmfs"):
+    """Get a `PlanckianLocus`, which is cached both in memory and on disk.
+
+    The tables are stored as `.npz` files in the `temperature` sub-directory
+    of `data.cache_path`.
+
+    Example::
+
+      locus = get_planckian_locus()
+      xyy = locus(temperatures)
+      srgb = locus(temperatures, "sRGB-linear")
+
+    """
+    key = (float(t_min), float(t_max), size, cmfs)
+    return data._get_cached(
+        _loci, key, "temperature", "planckian_%s.npz" % hashlib.md5(
+            repr(key).encode("utf-8")).hexdigest(),
+        PlanckianLocus.load,
+        lambda locus: (locus.t_min, locus.t_max, locus.size,
+                       locus.cmfs) == key,
+        lambda: PlanckianLocus(t_min, t_max, size, cmfs))
+
+_loci = {}
+
+def correlated_color_temperature(src_data, color_space="CIE-XYZ",
+                                 channel_axis=None, workers=None):
+    """Estimate the correlated color temperature and Duv of colors, with the
+    Planckian locus of `get_planckian_locus()`, see `PlanckianLocus.cct`.
+
+    Example::
+
+      cct, duv = correlated_color_temperature(uint8_image, "sRGB")
+
+    """
+    return get_planckian_locus().cct(src_data, color_space, channel_axis,
+                                     workers)
+
+def _blackbody_xyz(temperatures, cmfs):
+    """The CIE-XYZ colors of blackbody radiation, normalized to `Y = 1`, as a
+    `Tx3` matrix."""
+    xyz_cmfs, wl = load_fw(cmfs)
+    xyz = np.dot(get_blackbody_spd(temperatures, wl), xyz_cmfs.T)
+    return xyz / xyz[:,1:2]
+
+def _uv(xyz):
+    """The CIE 1960 uv chromaticity coordinates of `Nx3` CIE-XYZ colors, as
+    a `Nx2` matrix."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (np.column_stack((4 * xyz[:,0], 6 * xyz[:,1])) /
+                (xyz[:,0] + 15 * xyz[:,1] + 3 * xyz[:,2])[:,None])
+
+def _xy_to_uv(xy):
+    """The CIE 1960 uv chromaticity coordinates of `Nx2` xy coordinates."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (np.column_stack((4 * xy[:,0], 6 * xy[:,1])) /
+                (-2 * xy[:,0] + 12 * xy[:,1] + 3)[:,None])
+
+def _xy(xyz):
+    """The xy chromaticity coordinates of `3xN` CIE-XYZ colors."""
+    return xyz[:2] / np.sum(xyz, axis=0)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import numpy as np
+import os
+import unittest
+
+import data
+import temperature
+from data import get_blackbody_spd, load_fw
+from temperature import *
+from temperature import _blackbody_xyz, _uv
+from test_utils import TemporaryCacheMixin
+
+class TemperatureTest(TemporaryCacheMixin, unittest.TestCase):
+    def test_planckian_locus(self):
+        locus = PlanckianLocus(1000, 25000, 1024)
+        self.assertLess(locus.max_error, 1e-6)
+        # Compare with the exact colors of random temperatures.
+        temperatures = np.random.uniform(1000, 25000, (10, 20))
+        xyy = locus(temperatures)
+        self.assertEqual(xyy.shape, (3, 10, 20))
+        xyz_cmfs, wl = load_fw("xyz-cmfs")
+        xyz = np.dot(xyz_cmfs, get_blackbody_spd(temperatures, wl).reshape(
+            -1, len(wl)).T)
+        xy = (xyz[:2] / np.sum(xyz, axis=0)).reshape(2, 10, 20)
+        self.assertLess(np.max(np.abs(xyy[:2] - xy)), locus.max_error * 1.5)
+        self.assertTrue(np.allclose(xyy[2], 1))
+        # The CIE illuminant A is a blackbody of 2856 K.
+        self.assertAlmostEqual(locus(2856)[0], 0.44757, places=4)
+        self.assertAlmostEqual(locus(2856)[1], 0.40745, places=4)
+        # The temperatures out of range are NaN in any color space.
+        for color_space in ("CIE-XYZ", "CIE-xyY", "sRGB"):
+            colors = locus([1000, 25000, 999, 25001, np.nan], color_space)
+            self.assertFalse(np.any(np.isnan(colors[:,:2])))
+            self.assertTrue(np.all(np.isnan(colors[:,2:])))
+
+    def test_cct(self):
+        # Colors offset from the exact locus along its normal, i.e. along the
+        # isotemperature lines, are mapped back to their temperature and
+        # offset.
+        locus = get_planckian_locus()
+        temperatures = np.random.uniform(1000, 25000, 1000)
+        duv = np.random.uniform(-0.05, 0.05, 1000)
+        uv = _uv(_blackbody_xyz(temperatures, "xyz-cmfs"))
+        mired = 1e6 / temperatures
+        tangents = (_uv(_blackbody_xyz(1e6 / (mired + 1e-3), "xyz-cmfs")) -
+                    _uv(_blackbody_xyz(1e6 / (mired - 1e-3), "xyz-cmfs")))
+        tangents /= np.sqrt(np.sum(tangents ** 2, axis=1))[:,None]
+        uv[:,0] -= duv * tangents[:,1]
+        uv[:,1] += duv * tangents[:,0]
+        xyz = np.vstack((1.5 * uv[:,0] / uv[:,1], np.ones(1000),
+                         (4 - uv[:,0] - 10 * uv[:,1]) / (2 * uv[:,1])))
+        cct, duv_est = locus.cct(xyz.reshape(3, 10, 100), channel_axis=0)
+        self.assertEqual(cct.shape, (10, 100))
+        self.assertLess(np.max(np.abs(cct.ravel() / temperatures - 1)), 1e-5)
+        self.assertLess(np.max(np.abs(duv_est.ravel() - duv)), 1e-7)
+        # Same from the xy coordinates, or with several threads.
+        xyy = np.vstack((xyz[:2] / np.sum(xyz, axis=0), np.ones(1000)))
+        cct_xy, duv_xy = locus.cct(xyy, "CIE-xyY", workers=2)
+        self.assertLess(np.max(np.abs(cct_xy / cct.ravel() - 1)), 1e-12)
+        self.assertLess(np.max(np.abs(duv_xy - duv_est.ravel())), 1e-12)
+
+        # The D65 white point of sRGB, for images as well.
+        cct, duv = correlated_color_temperature(
+            np.full((2, 3, 3), 255, np.uint8), "sRGB")
+        self.assertEqual(cct.shape, (2, 3))
+        self.assertTrue(np.all(np.abs(cct - 6504) < 2))
+        self.assertTrue(np.all(np.abs(duv - 0.0032) < 1e-4))
+        # Black and the colors beyond the ends of the table are NaN.
+        for color, color_space in (([0, 0, 0], "CIE-XYZ"),
+                                   ([0.7, 0.3, 1], "CIE-xyY"),
+                                   ([0.2, 0.2, 1], "CIE-xyY")):
+            cct, duv = correlated_color_temperature(color, color_space)
+            self.assertTrue(np.isnan(cct))
+            self.assertTrue(np.isnan(duv))
+
+    def test_get_planckian_locus(self):
+        locus = get_planckian_locus(2000, 10000, 256)
+        self.assertIs(get_planckian_locus(2000, 10000, 256), locus)
+        # The table is loaded from disk by a new process.
+        temperature._loci.clear()
+        loaded = get_planckian_locus(2000, 10000, 256)
+        self.assertIsNot(loaded, locus)
+        self.assertTrue(np.array_equal(loaded.table, locus.table))
+        self.assertTrue(np.array_equal(loaded.temperatures,
+                                       locus.temperatures))
+        self.assertEqual(loaded.max_error, locus.max_error)
+        self.assertTrue(np.array_equal(loaded.tangents, locus.tangents))
+        self.assertEqual(len(os.listdir(data.cache_path + "/temperature")), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+
+import data
+
+class TemporaryCacheMixin(object):
+    """A mixin for `unittest.TestCase` running each test with `data.cache_path`
+    set to a new temporary directory, which is removed after the test."""
+    def setUp(self):
+        super(TemporaryCacheMixin, self).setUp()
+        cache_path = data.cache_path
+        data.cache_path = tempfile.mkdtemp()
+        self.addCleanup(setattr, data, "cache_path", cache_path)
+        self.addCleanup(shutil.rmtree, data.cache_path)
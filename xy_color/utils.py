@@ -5,6 +5,7 @@
 
 import numpy as np
 
+from multiprocessing.pool import ThreadPool
 from scipy.interpolate import interp1d
 
 def normalize_rows(matrix):
@@ -24,6 +25,52 @@ def normalize_columns(matrix):
     assert len(matrix.shape) == 2
     return matrix / np.sum(matrix, axis = 0)
 
+def tile_ranges(length, tile_length):
+    """Split `length` entries into consecutive tiles of at most `tile_length`
+    entries, returning a list of `(start, stop)` ranges.
+
+    """
+    tile_length = max(int(tile_length), 1)
+    return [(start, min(start + tile_length, length))
+            for start in xrange(0, length, tile_length)]
+
+# Number of colors processed at a time by the table lookups, such as those of
+# `lut.ColorLUT` and `palette.PaletteIndex`, to bound the memory of
+# temporaries.
+_tile_size = 65536
+
+def set_num_workers(num_workers):
+    """Set the default number of threads used by `parallel_map`, and hence by
+    the functions taking a `workers` argument such as `color_space_transform`.
+    The initial default is 1, i.e. running in the calling thread only.
+
+    """
+    global _num_workers
+    _num_workers = max(int(num_workers), 1)
+
+_num_workers = 1
+
+def parallel_map(fcn, items, workers=None):
+    """Apply `fcn` on each of the `items` with a pool of `workers` threads, and
+    return the list of results in order.
+
+    This is meant for functions spending most of their time in NumPy routines
+    that release the GIL. If `workers` is `None`, the default set by
+    `set_num_workers` is used. The thread pools are created on first use and
+    kept for later calls.
+
+    """
+    items = list(items)
+    if workers is None:
+        workers = _num_workers
+    if workers <= 1 or len(items) <= 1:
+        return [fcn(item) for item in items]
+    if workers not in _thread_pools:
+        _thread_pools[workers] = ThreadPool(workers)
+    return _thread_pools[workers].map(fcn, items, chunksize=1)
+
+_thread_pools = {}
+
 def xy_inside_horseshoe(xx, yy, horseshoe_curve):
     """Check whether a set of coordinates are inside the horseshoe shape.
 
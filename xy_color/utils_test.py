@@ -53,5 +53,18 @@ class UtilsTest(unittest.TestCase):
         self.assertTrue(np.max(np.abs(
             np.sum(col_normalized, axis=0) - np.array([1,1,1,1,1]))) < 0.0001)
 
+    def test_tile_ranges(self):
+        self.assertEqual(tile_ranges(10, 4), [(0, 4), (4, 8), (8, 10)])
+        self.assertEqual(tile_ranges(8, 4), [(0, 4), (4, 8)])
+        self.assertEqual(tile_ranges(3, 0), [(0, 1), (1, 2), (2, 3)])
+        self.assertEqual(tile_ranges(0, 4), [])
+
+    def test_parallel_map(self):
+        items = range(20)
+        self.assertEqual(parallel_map(lambda x: x * x, items, workers=4),
+                         [x * x for x in items])
+        self.assertEqual(parallel_map(lambda x: x * x, items),
+                         [x * x for x in items])
+
 if __name__ == "__main__":
     unittest.main()
@@ -10,7 +10,7 @@ import tornado.ioloop
 import tornado.web
 
 from PIL import Image
-from xy_python_utils.image_utils import imread, imcast
+from xy_python_utils.image_utils import imread
 
 from color_space_transform import color_space_transform as cst
 
@@ -64,13 +64,12 @@ class ImageHandler(tornado.web.RequestHandler):
         contrast = float(self.get_query_argument("contrast"))
         adjusted_lab = self.original_lab.copy()
         self.adjust_l_channel(adjusted_lab[:,:,0], brightness, contrast)
-        adjusted_image = cst(adjusted_lab, "CIE-L*a*b*", "sRGB")
-        adjusted_image[adjusted_image>1.0] = 1.0
-        adjusted_image[adjusted_image<0.0] = 0.0
+        adjusted_image = cst(adjusted_lab, "CIE-L*a*b*", "sRGB",
+                             dtype=np.uint8)
         self.render_image(adjusted_image)
 
     def render_image(self, img_data):
-        img = Image.fromarray(imcast(img_data, np.uint8))
+        img = Image.fromarray(img_data)
         o = StringIO.StringIO()
         img.save(o, format="JPEG")
         s = o.getvalue()